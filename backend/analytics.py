@@ -0,0 +1,206 @@
+"""Vectorized analytics over columnar extracts of order history
+
+Functions here take NumPy arrays already pulled from MongoDB and do no I/O,
+so the API layer decides what to read and how to cache the results.
+"""
+import numpy as np
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def demand_heatmap(weekdays, hours, items, revenue) -> dict:
+    """7x24 grids of orders, items and revenue per weekday/hour slot
+
+    weekdays are 0 (Monday) to 6, hours 0 to 23, one entry per order.
+    """
+    weekdays = np.asarray(weekdays, dtype=np.int64)
+    hours = np.asarray(hours, dtype=np.int64)
+    slots = weekdays * 24 + hours
+
+    def grid(weights=None):
+        counts = np.bincount(slots, weights=weights, minlength=7 * 24)
+        return counts.reshape(7, 24)
+
+    orders_grid = grid()
+    items_grid = grid(np.asarray(items, dtype=np.float64))
+    revenue_grid = grid(np.asarray(revenue, dtype=np.float64))
+
+    peak = None
+    if slots.size:
+        peak_slot = int(np.argmax(orders_grid))
+        peak = {
+            "weekday": WEEKDAYS[peak_slot // 24],
+            "hour": peak_slot % 24,
+            "orders": int(orders_grid.flat[peak_slot])
+        }
+
+    return {
+        "weekdays": WEEKDAYS,
+        "orders": orders_grid.astype(int).tolist(),
+        "items": items_grid.round(2).tolist(),
+        "revenue": revenue_grid.round(2).tolist(),
+        "peak": peak
+    }
+
+
+def daily_consumption(day_index, product_index, quantities, recipe_matrix, n_days: int):
+    """Days x ingredients usage series from daily product sales and recipes
+
+    day_index/product_index/quantities describe (day, product, units sold)
+    rows; recipe_matrix is products x ingredients, the amount of each
+    ingredient in one unit of each product.
+    """
+    recipe_matrix = np.asarray(recipe_matrix, dtype=np.float64)
+    sales = np.zeros((n_days, recipe_matrix.shape[0]))
+    np.add.at(
+        sales,
+        (np.asarray(day_index, dtype=np.int64), np.asarray(product_index, dtype=np.int64)),
+        np.asarray(quantities, dtype=np.float64)
+    )
+    return sales @ recipe_matrix
+
+
+def forecast_daily_usage(series, method: str = "ses", alpha: float = 0.3, window: int = 7):
+    """Expected usage per day for each column of a days x items series
+
+    "ma" averages the last `window` days; "ses" is simple exponential
+    smoothing, computed for every column at once as a weighted sum.
+    """
+    series = np.asarray(series, dtype=np.float64)
+    n_days = series.shape[0]
+    if n_days == 0:
+        return np.zeros(series.shape[1] if series.ndim == 2 else 0)
+    if method == "ma":
+        return series[-window:].mean(axis=0)
+
+    # level_T = sum_t alpha (1-alpha)^(T-t) x_t, with the first day seeding the level
+    decay = (1 - alpha) ** np.arange(n_days - 1, -1, -1)
+    weights = alpha * decay
+    weights[0] = decay[0]
+    return weights @ series
+
+
+def reorder_plan(daily_usage, current_stock, min_stock, horizon_days: int, lead_time_days: int = 0) -> dict:
+    """Days of cover and the quantity to order so stock stays above min_stock
+
+    The order covers forecast usage over the horizon plus the supplier lead time.
+    """
+    daily_usage = np.asarray(daily_usage, dtype=np.float64)
+    current_stock = np.asarray(current_stock, dtype=np.float64)
+    min_stock = np.asarray(min_stock, dtype=np.float64)
+
+    needed = daily_usage * (horizon_days + lead_time_days) + min_stock - current_stock
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(daily_usage > 0, np.maximum(current_stock, 0) / daily_usage, np.inf)
+    return {
+        "days_of_cover": cover,
+        "reorder_quantity": np.maximum(needed, 0)
+    }
+
+
+def recipe_unit_costs(recipe_matrix, ingredient_costs):
+    """Ingredient cost of one unit of each product (products x ingredients @ costs)"""
+    recipe_matrix = np.asarray(recipe_matrix, dtype=np.float64)
+    ingredient_costs = np.asarray(ingredient_costs, dtype=np.float64)
+    if recipe_matrix.size == 0:
+        return np.zeros(recipe_matrix.shape[0])
+    return recipe_matrix @ ingredient_costs
+
+
+def menu_engineering(quantities, revenues, list_prices, unit_costs) -> dict:
+    """Kasavana-Smith menu engineering matrix, one entry per product
+
+    A product is popular when its share of units sold reaches 70% of an
+    even share, and profitable when its unit margin reaches the
+    sales-weighted average margin.
+    """
+    quantities = np.asarray(quantities, dtype=np.float64)
+    revenues = np.asarray(revenues, dtype=np.float64)
+    list_prices = np.asarray(list_prices, dtype=np.float64)
+    unit_costs = np.asarray(unit_costs, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average_price = np.where(quantities > 0, revenues / quantities, list_prices)
+    unit_margin = average_price - unit_costs
+    total_margin = unit_margin * quantities
+
+    total_units = quantities.sum()
+    menu_mix = quantities / total_units if total_units else np.zeros_like(quantities)
+    popularity_threshold = 0.7 / len(quantities) if len(quantities) else 0.0
+    margin_threshold = total_margin.sum() / total_units if total_units else 0.0
+
+    popular = menu_mix >= popularity_threshold
+    profitable = unit_margin >= margin_threshold
+    classification = np.where(
+        popular,
+        np.where(profitable, "star", "plowhorse"),
+        np.where(profitable, "puzzle", "dog")
+    )
+
+    return {
+        "quantity": quantities,
+        "average_price": average_price,
+        "unit_cost": unit_costs,
+        "unit_margin": unit_margin,
+        "total_margin": total_margin,
+        "menu_mix": menu_mix,
+        "classification": classification.tolist(),
+        "popularity_threshold": popularity_threshold,
+        "margin_threshold": margin_threshold,
+        "total_revenue": revenues.sum(),
+        "total_cost": (unit_costs * quantities).sum()
+    }
+
+
+def grouped_median(groups, values, n_groups: int):
+    """Median of values within each group, plus the group sizes
+
+    One lexsort orders every group at once; each group's median is then read
+    from the middle of its run. Empty groups get NaN.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.bincount(groups, minlength=n_groups)
+    medians = np.full(n_groups, np.nan)
+    if values.size == 0:
+        return medians, counts
+
+    ordered = values[np.lexsort((values, groups))]
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    lower = (starts + (counts - 1) // 2)[present]
+    upper = (starts + counts // 2)[present]
+    medians[present] = (ordered[lower] + ordered[upper]) / 2
+    return medians, counts
+
+
+def prep_time_estimates(product_index, seconds, n_products: int,
+                        min_samples: int = 5, default_seconds: float = 300.0) -> dict:
+    """Robust prep time per product from (product, seconds) observations
+
+    Each order's prep time counts once for every product on it. The
+    estimate is the median and the spread is the MAD scaled to a standard
+    deviation, so a few forgotten tickets do not drag either. Products with
+    fewer than min_samples observations fall back to the overall figures.
+    """
+    product_index = np.asarray(product_index, dtype=np.int64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+
+    medians, counts = grouped_median(product_index, seconds, n_products)
+    if seconds.size:
+        deviations = np.abs(seconds - medians[product_index])
+        mads, _ = grouped_median(product_index, deviations, n_products)
+        overall = float(np.median(seconds))
+        overall_mad = float(np.median(np.abs(seconds - overall)))
+    else:
+        mads = np.full(n_products, np.nan)
+        overall, overall_mad = default_seconds, 0.0
+
+    enough = counts >= max(min_samples, 1)
+    return {
+        "median": np.where(enough, medians, overall),
+        "spread": 1.4826 * np.where(enough, mads, overall_mad),
+        "samples": counts,
+        "overall_median": overall,
+        "overall_spread": 1.4826 * overall_mad
+    }
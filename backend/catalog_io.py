@@ -0,0 +1,153 @@
+"""Bulk import and export of catalog data (products, categories, ingredients, COGS)
+
+Records are read one at a time from CSV, JSON Lines or a JSON array and
+handed to the server in batches, which validates them against the API models
+and upserts them on each entity's natural key, so re-running an import
+updates rows instead of duplicating them.
+
+Command line, run from the backend directory with the same .env as the API:
+
+    python catalog_io.py import ingredients ingredients.csv
+    python catalog_io.py import products menu.jsonl
+    python catalog_io.py export products --format csv > menu.csv
+
+The CLI writes straight to MongoDB; running API servers pick up the new
+catalog on their next restart or the next import made through the API.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "json"}
+
+
+def detect_format(filename: str, default: str = "jsonl") -> str:
+    for suffix, fmt in FORMATS.items():
+        if (filename or "").lower().endswith(suffix):
+            return fmt
+    return default
+
+
+def iter_records(stream, fmt: str):
+    """Yield one dict per record from a text stream without reading it all
+
+    Blank CSV cells are dropped so model defaults apply. A JSON array is
+    the one format that has to be parsed whole.
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and value is not None and value.strip() != ""
+            }
+    elif fmt == "jsonl":
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    elif fmt == "json":
+        records = json.load(stream)
+        yield from records if isinstance(records, list) else [records]
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def batched(records, size: int):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_recipes(value) -> list:
+    """Recipe lines from a list of dicts or a CSV cell like "Espresso Beans:18; Milk:150" """
+    if not isinstance(value, str):
+        return list(value or [])
+    recipes = []
+    for part in value.split(";"):
+        if part.strip():
+            name, _, quantity = part.rpartition(":")
+            if not name.strip():
+                raise ValueError(f"Recipe line '{part.strip()}' should look like 'Ingredient:quantity'")
+            recipes.append({"ingredient_name": name.strip(), "quantity": float(quantity)})
+    return recipes
+
+
+def resolve_recipes(value, ingredient_ids: dict) -> list:
+    """Replace ingredient names with IDs using a {lowercase name: id} map"""
+    recipes = []
+    for recipe in parse_recipes(value):
+        if not recipe.get("ingredient_id"):
+            name = str(recipe.get("ingredient_name", "")).strip()
+            ingredient_id = ingredient_ids.get(name.lower())
+            if not ingredient_id:
+                raise ValueError(f"Unknown ingredient '{name}'")
+            recipe = {"ingredient_id": ingredient_id, "quantity": recipe["quantity"]}
+        recipes.append(recipe)
+    return recipes
+
+
+def format_recipes(recipes: list, ingredient_names: dict) -> str:
+    return "; ".join(
+        f"{ingredient_names.get(r['ingredient_id'], r['ingredient_id'])}:{r['quantity']:g}"
+        for r in recipes or []
+    )
+
+
+def csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+async def run_import(entity: str, path: str, fmt: str = None):
+    from server import import_catalog, client
+
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as stream:
+            summary = await import_catalog(entity, iter_records(stream, fmt or detect_format(path)))
+    finally:
+        client.close()
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+async def run_export(entity: str, fmt: str):
+    from server import export_catalog, client
+
+    try:
+        async for chunk in export_catalog(entity, fmt):
+            sys.stdout.write(chunk)
+    finally:
+        client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export catalog data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Upsert records from a file")
+    import_parser.add_argument("entity", choices=["products", "categories", "ingredients", "cogs"])
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "jsonl", "json"])
+
+    export_parser = commands.add_parser("export", help="Write records to stdout")
+    export_parser.add_argument("entity", choices=["products", "categories", "ingredients", "cogs"])
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        summary = asyncio.run(run_import(args.entity, args.path, args.format))
+        return 1 if summary["errors"] else 0
+    asyncio.run(run_export(args.entity, args.format))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
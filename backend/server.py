@@ -1,22 +1,36 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, UploadFile, File, status
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import UpdateOne
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
+from typing import ClassVar, List, Optional, Literal
 import uuid
+import math
+import time
+import asyncio
+import bisect
+import json
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict, deque
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 import qrcode
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 import base64
+import analytics
+import catalog_io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -57,8 +71,176 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Error creating default admin: {e}")
     
+    # Detect whether multi-document transactions are available
+    global TRANSACTIONS_ENABLED
+    try:
+        hello = await client.admin.command("hello")
+        TRANSACTIONS_ENABLED = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        logger.info(f"Multi-document transactions {'enabled' if TRANSACTIONS_ENABLED else 'unavailable'}")
+    except Exception as e:
+        logger.error(f"Error detecting transaction support: {e}")
+    
+    # Indexes for hot query paths - each on its own, so one failure
+    # (e.g. legacy data violating a unique index) does not skip the rest
+    indexes = [
+        (db.orders, [("status", 1), ("created_at", 1)], {}),
+        # Legacy ORD-... numbers have no business_date and may repeat
+        (db.orders, [("business_date", 1), ("order_number", 1)],
+         {"unique": True, "partialFilterExpression": {"business_date": {"$exists": True}}}),
+        (db.stock_movements, [("ingredient_id", 1), ("created_at", 1)], {}),
+        (db.stock_movements, "created_at", {}),
+        (db.stock_snapshots, "taken_at", {}),
+        (db.users, [("role", 1), ("search_terms", 1)], {}),
+        (db.idempotency_keys, "created_at", {"expireAfterSeconds": IDEMPOTENCY_TTL_SECONDS}),
+        (db.orders, [("customer_point", "2dsphere")], {}),
+        # Only paid orders still waiting for their rollup are indexed
+        (db.orders, "rollup_pending", {"partialFilterExpression": {"rollup_pending": {"$exists": True}}}),
+        (db.table_rollups, [("date", 1), ("table_id", 1), ("hour", 1)], {"unique": True}),
+        (db.daily_rollups, [("date", 1), ("product_id", 1), ("category", 1), ("payment_method", 1)], {"unique": True}),
+    ]
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Error creating index {keys} on {collection.name}: {e}")
+    
+    # Give open orders from before geo indexing a GeoJSON point
+    try:
+        unindexed = await db.orders.find(
+            {
+                "status": {"$in": ACTIVE_ORDER_STATUSES},
+                "customer_location": {"$type": "object"},
+                "customer_point": {"$exists": False}
+            },
+            {"_id": 0, "id": 1, "customer_location": 1}
+        ).to_list(None)
+        bulk_ops = []
+        for order in unindexed:
+            point = normalize_location(order["customer_location"])
+            if point:
+                bulk_ops.append(UpdateOne({"id": order["id"]}, {"$set": {"customer_point": point}}))
+        if bulk_ops:
+            await db.orders.bulk_write(bulk_ops, ordered=False)
+    except Exception as e:
+        logger.error(f"Error backfilling order locations: {e}")
+    
+    # Give users from before customer search their normalized search terms
+    try:
+        unindexed = await db.users.find(
+            {"search_terms": {"$exists": False}},
+            {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1}
+        ).to_list(None)
+        bulk_ops = [
+            UpdateOne(
+                {"id": u["id"]},
+                {"$set": {"search_terms": customer_search_terms(u.get("name", ""), u.get("email", ""), u.get("phone"))}}
+            )
+            for u in unindexed
+        ]
+        if bulk_ops:
+            await db.users.bulk_write(bulk_ops, ordered=False)
+    except Exception as e:
+        logger.error(f"Error backfilling customer search terms: {e}")
+    
+    # Load tickets still being made into the batch-brew board
+    try:
+        brewing = await db.orders.find(
+            {"status": {"$in": list(BREWING_STATUSES)}},
+            {"_id": 0, "id": 1, "order_number": 1, "items": 1}
+        ).sort("created_at", 1).to_list(None)
+        for order in brewing:
+            batch_board.add(order)
+        logger.info(f"Batch-brew board loaded with {len(brewing)} open tickets")
+    except Exception as e:
+        logger.error(f"Error loading batch-brew board: {e}")
+    
+    # Rebuild table occupancy from today's open dine-in orders
+    try:
+        for table in await db.tables.find({}, {"_id": 0}).to_list(None):
+            floor.put_table(table)
+        open_orders = await db.orders.find(
+            {
+                "order_type": "dine-in",
+                "payment_status": "unpaid",
+                "status": {"$ne": "cancelled"},
+                "created_at": {"$gte": shop_day_start(shop_date())}
+            },
+            {"_id": 0, "id": 1, "order_type": 1, "table_id": 1, "table_number": 1, "total_amount": 1, "created_at": 1}
+        ).sort("created_at", 1).to_list(None)
+        for order in open_orders:
+            floor.order_opened(order)
+        # Tables that were occupied by orders which have since closed are free again
+        for table_id, table in floor.tables.items():
+            if table["status"] == "occupied" and table.get("open_order_ids") and not table["open_orders"]:
+                floor.set_status(table_id, "available")
+        logger.info(f"Floor state loaded: {len(floor.tables)} tables, {len(open_orders)} open orders")
+    except Exception as e:
+        logger.error(f"Error loading floor state: {e}")
+    
+    # Seed today's stage latency histograms from recorded status histories
+    try:
+        todays_orders = await db.orders.find(
+            {"created_at": {"$gte": shop_day_start(shop_date())}, "status_history.1": {"$exists": True}},
+            {"_id": 0, "created_at": 1, "status_history": 1}
+        ).to_list(None)
+        for order in todays_orders:
+            stage_timings.replay(order)
+    except Exception as e:
+        logger.error(f"Error loading stage timings: {e}")
+    
+    # Ingredients from before the stock ledger have no opening movement, so
+    # the first run takes their current_stock as the ledger's baseline
+    try:
+        if not await db.stock_snapshots.find_one({}, {"_id": 1}):
+            ingredients = await db.ingredients.find({}, {"_id": 0, "id": 1, "current_stock": 1}).to_list(None)
+            await db.stock_snapshots.insert_one({
+                "id": str(uuid.uuid4()),
+                "taken_at": datetime.now(timezone.utc).isoformat(),
+                "levels": {i["id"]: i.get("current_stock", 0) for i in ingredients},
+                "baseline": True
+            })
+            logger.info(f"Stock ledger baseline taken for {len(ingredients)} ingredients")
+    except Exception as e:
+        logger.error(f"Error taking stock ledger baseline: {e}")
+    
+    # Seed the low-stock monitor with every ingredient's threshold
+    try:
+        ingredients = await db.ingredients.find(
+            {}, {"_id": 0, "id": 1, "name": 1, "unit": 1, "current_stock": 1, "min_stock": 1}
+        ).to_list(None)
+        for ingredient in ingredients:
+            stock_alerts.track(ingredient)
+        logger.info(f"Low-stock monitor tracking {len(ingredients)} ingredients, {len(stock_alerts.active)} low")
+    except Exception as e:
+        logger.error(f"Error loading low-stock monitor: {e}")
+    
+    # Train prep-time estimates for order ETAs
+    try:
+        await prep_estimator.refresh()
+        logger.info(f"Prep-time estimates trained on {prep_estimator.samples} orders")
+    except Exception as e:
+        logger.error(f"Error training prep-time estimates: {e}")
+    
+    background_jobs = [
+        asyncio.create_task(run_periodically(LOCATION_FLUSH_SECONDS, location_buffer.flush, "location flush")),
+        asyncio.create_task(run_periodically(FLOOR_FLUSH_SECONDS, floor.flush, "floor flush")),
+        asyncio.create_task(run_periodically(STOCK_SNAPSHOT_HOURS * 3600, take_stock_snapshot, "stock snapshot")),
+        asyncio.create_task(run_periodically(PREP_ESTIMATE_REFRESH_MINUTES * 60, prep_estimator.refresh, "prep estimates")),
+        asyncio.create_task(run_periodically(ROLLUP_BACKFILL_MINUTES * 60, backfill_daily_rollups, "rollup backfill")),
+    ]
+    
     yield
     # Shutdown
+    for job in background_jobs:
+        job.cancel()
+    try:
+        await location_buffer.flush()
+    except Exception as e:
+        logger.error(f"Error flushing buffered locations: {e}")
+    try:
+        await floor.flush()
+    except Exception as e:
+        logger.error(f"Error flushing floor state: {e}")
     client.close()
     logger.info("Database connection closed")
 
@@ -68,6 +250,39 @@ api_router = APIRouter(prefix="/api")
 SECRET_KEY = os.getenv("SECRET_KEY", os.urandom(32).hex())
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10080
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+# An in_progress key older than this is assumed abandoned and may be retried
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", 30))
+
+# Business day boundaries and hour-of-day reporting use the shop's local time
+SHOP_TZ = timezone(timedelta(hours=float(os.environ.get("SHOP_UTC_OFFSET_HOURS", "7"))))
+ORDER_NUMBER_BLOCK_SIZE = int(os.environ.get("ORDER_NUMBER_BLOCK_SIZE", 10))
+
+# Delivery location pings are buffered and written in batches
+LOCATION_FLUSH_SECONDS = float(os.environ.get("LOCATION_FLUSH_SECONDS", 5))
+# How often live table state is written back to the tables collection
+FLOOR_FLUSH_SECONDS = float(os.environ.get("FLOOR_FLUSH_SECONDS", 5))
+LOCATION_MIN_INTERVAL_SECONDS = float(os.environ.get("LOCATION_MIN_INTERVAL_SECONDS", 2))
+
+# Paid orders whose rollup write failed are picked up by this periodic backfill
+ROLLUP_BACKFILL_MINUTES = float(os.environ.get("ROLLUP_BACKFILL_MINUTES", 60))
+
+# Stock snapshots bound how much of the movement ledger a point-in-time query reads
+STOCK_SNAPSHOT_HOURS = float(os.environ.get("STOCK_SNAPSHOT_HOURS", 24))
+STOCK_SNAPSHOT_LAG_SECONDS = float(os.environ.get("STOCK_SNAPSHOT_LAG_SECONDS", 300))
+# A low-stock alert clears once stock is this fraction above min_stock
+LOW_STOCK_HYSTERESIS = float(os.environ.get("LOW_STOCK_HYSTERESIS", 0.1))
+
+# Prep-time estimates behind customer ETAs are retrained from recent status histories
+PREP_ESTIMATE_REFRESH_MINUTES = float(os.environ.get("PREP_ESTIMATE_REFRESH_MINUTES", 30))
+PREP_HISTORY_DAYS = int(os.environ.get("PREP_HISTORY_DAYS", 14))
+PREP_MIN_SAMPLES = int(os.environ.get("PREP_MIN_SAMPLES", 5))
+PREP_DEFAULT_SECONDS = float(os.environ.get("PREP_DEFAULT_SECONDS", 300))
+# Tickets the kitchen works on at once when turning queue depth into waiting time
+KITCHEN_STATIONS = max(int(os.environ.get("KITCHEN_STATIONS", 2)), 1)
+
+# Set at startup - multi-document transactions need a replica set or sharded cluster
+TRANSACTIONS_ENABLED = False
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
@@ -79,6 +294,7 @@ class CustomerRegister(BaseModel):
     email: EmailStr
     password: str
     name: str
+    phone: Optional[str] = None
     is_member: bool = False  # Option to join as member
 
 class UserRegister(BaseModel):
@@ -86,6 +302,7 @@ class UserRegister(BaseModel):
     email: EmailStr
     password: str
     name: str
+    phone: Optional[str] = None
     role: Literal["customer", "kitchen", "cashier", "waiter", "storage", "admin"] = "customer"
 
 class UserLogin(BaseModel):
@@ -98,6 +315,7 @@ class User(BaseModel):
     email: EmailStr
     name: str
     role: str
+    phone: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Token(BaseModel):
@@ -147,6 +365,22 @@ class CustomerMembership(BaseModel):
     status: Literal["active", "expired", "cancelled"] = "active"
     benefits: List[Benefit] = []
 
+class PartialUpdate(BaseModel):
+    """Base for partial update bodies: fields left out are not touched, and
+    an explicit null is refused unless the stored model allows it, so a
+    PATCH cannot write null into a required field."""
+    nullable_fields: ClassVar[frozenset] = frozenset()
+
+    @model_validator(mode="after")
+    def reject_nulls(self):
+        nulls = sorted(
+            name for name in self.model_fields_set
+            if getattr(self, name) is None and name != "version" and name not in self.nullable_fields
+        )
+        if nulls:
+            raise ValueError(f"{', '.join(nulls)} cannot be null")
+        return self
+
 class Ingredient(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -155,8 +389,32 @@ class Ingredient(BaseModel):
     current_stock: float
     min_stock: float
     cost_per_unit: float
+    version: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class IngredientUpdate(PartialUpdate):
+    name: Optional[str] = None
+    unit: Optional[str] = None
+    current_stock: Optional[float] = None
+    min_stock: Optional[float] = None
+    cost_per_unit: Optional[float] = None
+    version: Optional[int] = None
+
+class StockMovement(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    ingredient_id: str
+    kind: Literal["sale", "restock", "waste", "adjustment"]
+    delta: float  # Signed change to current_stock
+    order_id: Optional[str] = None
+    note: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class StockMovementCreate(BaseModel):
+    kind: Literal["restock", "waste", "adjustment"]
+    quantity: float  # Positive for restock/waste; signed for adjustments
+    note: Optional[str] = None
+
 class Recipe(BaseModel):
     ingredient_id: str
     quantity: float
@@ -173,8 +431,28 @@ class Product(BaseModel):
     available: bool = True
     featured: bool = False
     sort_order: int = 0
+    version: int = 0  # Incremented on every update for optimistic concurrency
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ProductUpdate(PartialUpdate):
+    """Partial product update; unset fields are left alone. When version is
+    sent the update only applies if the product is still at that version."""
+    nullable_fields: ClassVar[frozenset] = frozenset({"image_url"})
+    name: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[float] = None
+    image_url: Optional[str] = None
+    recipes: Optional[List[Recipe]] = None
+    available: Optional[bool] = None
+    featured: Optional[bool] = None
+    sort_order: Optional[int] = None
+    version: Optional[int] = None
+
+class ProductPatch(ProductUpdate):
+    """One entry of a batch product update"""
+    id: str
+
 class Category(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -184,8 +462,18 @@ class Category(BaseModel):
     icon: str = "Coffee"
     sort_order: int = 0
     active: bool = True
+    version: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class CategoryUpdate(PartialUpdate):
+    name: Optional[str] = None
+    slug: Optional[str] = None
+    description: Optional[str] = None
+    icon: Optional[str] = None
+    sort_order: Optional[int] = None
+    active: Optional[bool] = None
+    version: Optional[int] = None
+
 class TableCreate(BaseModel):
     table_number: int
     capacity: int
@@ -198,6 +486,16 @@ class Table(BaseModel):
     qr_image: Optional[str] = None
     capacity: int
     status: Literal["available", "occupied", "reserved"] = "available"
+    version: int = 0
+    open_order_ids: List[str] = []
+    running_bill: float = 0
+    seated_since: Optional[datetime] = None
+
+class TableUpdate(PartialUpdate):
+    table_number: Optional[int] = None
+    capacity: Optional[int] = None
+    status: Optional[Literal["available", "occupied", "reserved"]] = None
+    version: Optional[int] = None
 
 class OrderItem(BaseModel):
     product_id: str
@@ -228,6 +526,18 @@ class DiscountInfo(BaseModel):
     beverage_discount_amount: float = 0
     total_discount: float = 0
 
+class StatusChange(BaseModel):
+    status: str
+    at: datetime
+
+class OrderEta(BaseModel):
+    """Server estimate of when an order will be ready - not stored"""
+    seconds: int  # From now until ready, 0 once it is
+    ready_at: datetime
+    margin_seconds: int  # One robust standard deviation of the prep time
+    queue_ahead: int  # Tickets in the kitchen ahead of this one
+    refresh_after_seconds: int  # When checking again is worthwhile
+
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -247,9 +557,98 @@ class Order(BaseModel):
     payment_method: Optional[Literal["cash", "online", "qr"]] = None
     customer_location: Optional[dict] = None
     notes: Optional[str] = None
+    business_date: Optional[str] = None  # Shop-local day the order number belongs to
+    paid_at: Optional[datetime] = None
+    status_history: List[StatusChange] = []  # Every status the order entered, oldest first
+    eta: Optional[OrderEta] = None  # Filled in on create and get, never stored
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Role-scoped order views - each lists only the fields that role's dashboard
+# renders; the Mongo projection is derived from the same field list
+class KitchenOrderView(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: str
+    order_type: Literal["dine-in", "delivery", "to-go"]
+    table_number: Optional[int] = None
+    items: List[OrderItem]
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
+    notes: Optional[str] = None
+    has_location: bool = False
+    created_at: datetime
+
+class WaiterOrderView(KitchenOrderView):
+    customer_name: Optional[str] = None
+
+class CashierOrderView(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: str
+    customer_name: Optional[str] = None
+    order_type: Literal["dine-in", "delivery", "to-go"]
+    table_number: Optional[int] = None
+    items: List[OrderItem]
+    total_amount: float
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
+    payment_status: Literal["unpaid", "paid"]
+    payment_method: Optional[Literal["cash", "online", "qr"]] = None
+    created_at: datetime
+
+class CustomerOrderView(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: str
+    order_type: Literal["dine-in", "delivery", "to-go"]
+    table_number: Optional[int] = None
+    items: List[OrderItem]
+    subtotal: float = 0
+    discount_info: Optional[DiscountInfo] = None
+    total_amount: float
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
+    payment_status: Literal["unpaid", "paid"]
+    created_at: datetime
+
+# Roles not listed here (admin, storage) get the full Order document
+ORDER_VIEWS = {
+    "kitchen": KitchenOrderView,
+    "waiter": WaiterOrderView,
+    "cashier": CashierOrderView,
+    "customer": CustomerOrderView,
+}
+
+# View fields computed server-side instead of shipping the source field
+COMPUTED_ORDER_FIELDS = {
+    "has_location": {"$eq": [{"$type": "$customer_location"}, "object"]},
+}
+
+def order_projection(view) -> dict:
+    """Mongo projection returning only the fields of an order view model"""
+    if view is Order:
+        return {"_id": 0}
+    projection = {"_id": 0}
+    for name in view.model_fields:
+        projection[name] = COMPUTED_ORDER_FIELDS.get(name, 1)
+    return projection
+
+class LocationUpdate(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    accuracy: Optional[float] = None
+
+class PaymentRequest(BaseModel):
+    payment_method: Literal["cash", "online", "qr"]
+
+class OrderStatusUpdate(BaseModel):
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
+
+class BulkOrderStatusUpdate(BaseModel):
+    """Select orders by id and/or table, then move them all to one status"""
+    status: Literal["pending", "preparing", "ready", "completed", "cancelled"]
+    order_ids: List[str] = []
+    table_number: Optional[int] = None
+    from_status: Optional[Literal["pending", "preparing", "ready", "completed", "cancelled"]] = None
+
 class Transaction(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -295,6 +694,92 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def run_periodically(interval: float, job, name: str):
+    """Run an async job every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background job {name} failed: {e}")
+
+def geo_point(lat: float, lng: float) -> dict:
+    """GeoJSON point - note GeoJSON orders coordinates as [longitude, latitude]"""
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+def normalize_location(location) -> Optional[dict]:
+    """GeoJSON point from a client location dict, or None if it has no valid coordinates
+
+    Accepts {lat, lng}, {latitude, longitude}, {lat, lon} and GeoJSON points.
+    """
+    if not isinstance(location, dict):
+        return None
+    try:
+        if location.get("type") == "Point":
+            lng, lat = (float(c) for c in location["coordinates"][:2])
+        else:
+            lat = float(location.get("lat", location.get("latitude")))
+            lng = float(location.get("lng", location.get("lon", location.get("longitude"))))
+    except (TypeError, ValueError, KeyError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return geo_point(lat, lng)
+
+def shop_utc_offset() -> str:
+    """Shop UTC offset as +HH:MM, the form Mongo date operators accept"""
+    minutes = int(SHOP_TZ.utcoffset(None).total_seconds() // 60)
+    sign = "+" if minutes >= 0 else "-"
+    return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+def shop_day_start(date: str) -> str:
+    """UTC ISO timestamp of shop-local midnight, comparable with stored created_at"""
+    local_midnight = datetime.fromisoformat(date).replace(tzinfo=SHOP_TZ)
+    return local_midnight.astimezone(timezone.utc).isoformat()
+
+def shop_date(dt: Optional[datetime] = None) -> str:
+    """Shop-local calendar date (YYYY-MM-DD) for a UTC timestamp, default now"""
+    return (dt or datetime.now(timezone.utc)).astimezone(SHOP_TZ).date().isoformat()
+
+def format_ticket_number(seq: int) -> str:
+    """Short counter ticket number - 1 -> A-001, 999 -> A-999, 1000 -> B-001"""
+    series, number = divmod(seq - 1, 999)
+    return f"{chr(ord('A') + series % 26)}-{number + 1:03d}"
+
+class OrderNumberAllocator:
+    """Daily ticket sequence handed out from blocks reserved in `counters`
+
+    Each worker reserves a block of numbers per counter round trip, so
+    numbers are unique per day; a restarted worker leaves a small gap.
+    """
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self.day = None
+        self.next_seq = 0
+        self.block_end = 0
+        self.lock = asyncio.Lock()
+
+    async def allocate(self):
+        day = shop_date()
+        async with self.lock:
+            if day != self.day or self.next_seq > self.block_end:
+                counter = await db.counters.find_one_and_update(
+                    {"_id": f"orders:{day}"},
+                    {"$inc": {"seq": self.block_size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                self.day = day
+                self.block_end = counter["seq"]
+                self.next_seq = counter["seq"] - self.block_size + 1
+            seq = self.next_seq
+            self.next_seq += 1
+        return day, format_ticket_number(seq)
+
+order_numbers = OrderNumberAllocator(ORDER_NUMBER_BLOCK_SIZE)
+
 def generate_qr_code(data: str):
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(data)
@@ -305,6 +790,90 @@ def generate_qr_code(data: str):
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return f"data:image/png;base64,{img_str}"
 
+class TTLCache:
+    """Small in-process LRU whose entries also expire after ttl_seconds"""
+    def __init__(self, max_entries: int = 2048, ttl_seconds: int = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, record = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return record
+
+    def put(self, key: str, record: dict):
+        self.entries[key] = (time.monotonic(), record)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+# Recently completed idempotent responses, so replays of a retry storm never reach the database
+idempotency_cache = TTLCache(ttl_seconds=min(600, IDEMPOTENCY_TTL_SECONDS))
+
+async def run_idempotent(scope: str, key: Optional[str], payload, handler):
+    """Run handler at most once per Idempotency-Key, replaying its stored response on retries"""
+    if not key:
+        return await handler()
+    
+    record_id = f"{scope}:{key}"
+    fingerprint = hashlib.sha256(
+        json.dumps(jsonable_encoder(payload), sort_keys=True).encode()
+    ).hexdigest()
+    
+    record = idempotency_cache.get(record_id)
+    if record is None:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "state": "in_progress",
+                "created_at": now  # BSON date for the TTL index
+            })
+            leased = True
+        except DuplicateKeyError:
+            # A lease left in_progress by a crash or restart is taken over once it is stale
+            leased = await db.idempotency_keys.find_one_and_update(
+                {
+                    "_id": record_id,
+                    "state": "in_progress",
+                    "created_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}
+                },
+                {"$set": {"fingerprint": fingerprint, "created_at": now}}
+            ) is not None
+            if not leased:
+                record = await db.idempotency_keys.find_one({"_id": record_id})
+                if not record or record.get("state") != "completed":
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if leased:
+            try:
+                response = jsonable_encoder(await handler())
+            except Exception:
+                # Release the key so the client can retry a failed request
+                await db.idempotency_keys.delete_one({"_id": record_id})
+                raise
+            await db.idempotency_keys.update_one(
+                {"_id": record_id},
+                {"$set": {"state": "completed", "response": response}}
+            )
+            idempotency_cache.put(record_id, {"fingerprint": fingerprint, "response": response})
+            return response
+    
+    if record["fingerprint"] != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    idempotency_cache.put(record_id, {"fingerprint": record["fingerprint"], "response": record["response"]})
+    return record["response"]
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: CustomerRegister):
@@ -317,14 +886,17 @@ async def register(user_data: CustomerRegister):
     user = User(
         email=user_data.email,
         name=user_data.name,
+        phone=user_data.phone,
         role="customer"  # Always customer for public registration
     )
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
     user_dict["is_member"] = user_data.is_member  # Store membership status
+    user_dict["search_terms"] = customer_search_terms(user.name, user.email, user.phone)
     
     await db.users.insert_one(user_dict)
+    customer_lookups.clear()
     
     access_token = create_access_token(data={"sub": user.email})
     return Token(access_token=access_token, token_type="bearer", user=user)
@@ -350,6 +922,159 @@ async def login(credentials: UserLogin):
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+class CatalogState:
+    """Version counter for products, categories and ingredients
+
+    Every catalog write bumps it; in-process caches derived from the
+    catalog remember the version they were built from and rebuild lazily.
+    Stock movements from orders are not catalog writes.
+    """
+    def __init__(self):
+        self.version = 0
+
+    def bump(self):
+        self.version += 1
+
+catalog = CatalogState()
+
+class RecipeCostCache:
+    """Ingredient cost of one unit of each product, rebuilt when the catalog changes"""
+    def __init__(self):
+        self.version = None
+        self.costs = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self) -> dict:
+        async with self.lock:
+            if self.version != catalog.version:
+                version = catalog.version
+                products = await db.products.find({}, {"_id": 0, "id": 1, "recipes": 1}).to_list(None)
+                ingredients = await db.ingredients.find({}, {"_id": 0, "id": 1, "cost_per_unit": 1}).to_list(None)
+                ingredient_index = {i["id"]: n for n, i in enumerate(ingredients)}
+                recipe_matrix = [[0.0] * len(ingredients) for _ in products]
+                for row, product in enumerate(products):
+                    for recipe in product.get("recipes", []):
+                        column = ingredient_index.get(recipe["ingredient_id"])
+                        if column is not None:
+                            recipe_matrix[row][column] += recipe["quantity"]
+                unit_costs = analytics.recipe_unit_costs(
+                    recipe_matrix, [i.get("cost_per_unit", 0) for i in ingredients]
+                )
+                self.costs = {p["id"]: float(unit_costs[n]) for n, p in enumerate(products)}
+                self.version = version
+            return self.costs
+
+recipe_costs = RecipeCostCache()
+
+def search_tokens(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens"""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return re.findall(r"[a-z0-9]+", text)
+
+def trigrams(tokens: List[str]) -> set:
+    """Padded character trigrams, so short prefixes like "la" still match "latte" """
+    grams = set()
+    for token in tokens:
+        padded = f"  {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class ProductSearchIndex:
+    """Trigram index over product names, categories and descriptions
+
+    Rebuilt from the products collection when the catalog version changes,
+    so a query is a handful of dictionary lookups instead of a collection scan.
+    """
+    FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+    MIN_SIMILARITY = 0.3
+
+    def __init__(self):
+        self.version = None
+        self.products = []
+        self.fields = []    # per product: {field: trigram set}
+        self.names = []     # per product: name tokens, for prefix matches
+        self.postings = {}  # trigram -> set of product positions
+        self.lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with self.lock:
+            if self.version == catalog.version:
+                return
+            version = catalog.version
+            products = await db.products.find({}, {"_id": 0}).to_list(None)
+            fields, names, postings = [], [], {}
+            for position, product in enumerate(products):
+                product_fields = {field: trigrams(search_tokens(product.get(field))) for field in self.FIELD_WEIGHTS}
+                fields.append(product_fields)
+                names.append(search_tokens(product.get("name")))
+                for grams in product_fields.values():
+                    for gram in grams:
+                        postings.setdefault(gram, set()).add(position)
+            self.products, self.fields, self.names, self.postings = products, fields, names, postings
+            self.version = version
+
+    def search(self, query: str, limit: int = 20, category: Optional[str] = None, include_unavailable: bool = False) -> List[dict]:
+        query_tokens = search_tokens(query)
+        query_grams = trigrams(query_tokens)
+        if not query_grams:
+            return []
+        
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self.postings.get(gram, set())
+        
+        ranked = []
+        for position in candidates:
+            product = self.products[position]
+            if not include_unavailable and not product.get("available", True):
+                continue
+            if category and product.get("category") != category:
+                continue
+            similarities = {
+                field: len(query_grams & grams) / len(query_grams)
+                for field, grams in self.fields[position].items()
+            }
+            if max(similarities.values()) < self.MIN_SIMILARITY:
+                continue
+            score = sum(self.FIELD_WEIGHTS[field] * sim for field, sim in similarities.items())
+            if any(name.startswith(token) for token in query_tokens for name in self.names[position]):
+                score += 1.0
+            ranked.append((-score, product.get("sort_order", 0), position, score))
+        
+        ranked.sort()
+        return [dict(self.products[position], score=round(score, 3)) for _, _, position, score in ranked[:limit]]
+
+product_search = ProductSearchIndex()
+
+async def patch_document(collection, doc_id: str, update: BaseModel, not_found: str) -> tuple:
+    """Field-level $set of the fields a PATCH body actually sent
+
+    If the body carries a version, the write only matches a document still
+    at that version (documents created before versioning count as 0), and a
+    stale version is reported as 409 so concurrent editors do not silently
+    overwrite each other. Returns the document before and after the update.
+    """
+    changes = update.model_dump(exclude_unset=True, exclude={"version"})
+    query = {"id": doc_id}
+    if update.version is not None:
+        query["version"] = update.version if update.version else {"$in": [0, None]}
+    
+    operations = {"$inc": {"version": 1}}
+    if changes:
+        operations["$set"] = changes
+    before = await collection.find_one_and_update(
+        query,
+        operations,
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        if await collection.count_documents({"id": doc_id}, limit=1):
+            raise HTTPException(status_code=409, detail="Modified by someone else, reload and try again")
+        raise HTTPException(status_code=404, detail=not_found)
+    after = {**before, **changes, "version": before.get("version", 0) + 1}
+    return before, after
+
 # Categories Routes
 @api_router.get("/categories")
 async def get_categories():
@@ -371,6 +1096,7 @@ async def create_category(category: Category, current_user: User = Depends(get_c
     category_dict = category.model_dump()
     category_dict["created_at"] = category_dict["created_at"].isoformat()
     await db.categories.insert_one(category_dict)
+    catalog.bump()
     return category
 
 @api_router.put("/categories/{category_id}")
@@ -378,17 +1104,28 @@ async def update_category(category_id: str, category: Category, current_user: Us
     if current_user.role not in ["admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    category_dict = category.model_dump()
+    category_dict = category.model_dump(exclude={"version"})
     category_dict["created_at"] = category_dict["created_at"].isoformat()
-    await db.categories.update_one({"id": category_id}, {"$set": category_dict})
+    await db.categories.update_one({"id": category_id}, {"$set": category_dict, "$inc": {"version": 1}})
+    catalog.bump()
     return {"message": "Category updated"}
 
+@api_router.patch("/categories/{category_id}")
+async def patch_category(category_id: str, update: CategoryUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["admin"]:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    _, category = await patch_document(db.categories, category_id, update, "Category not found")
+    catalog.bump()
+    return category
+
 @api_router.delete("/categories/{category_id}")
 async def delete_category(category_id: str, current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin"]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     await db.categories.delete_one({"id": category_id})
+    catalog.bump()
     return {"message": "Category deleted"}
 
 # Products Routes
@@ -400,6 +1137,7 @@ async def create_product(product: Product, current_user: User = Depends(get_curr
     product_dict = product.model_dump()
     product_dict["created_at"] = product_dict["created_at"].isoformat()
     await db.products.insert_one(product_dict)
+    catalog.bump()
     return product
 
 @api_router.get("/products", response_model=List[Product])
@@ -415,6 +1153,19 @@ async def get_products(category: Optional[str] = None, include_unavailable: Opti
             p["created_at"] = datetime.fromisoformat(p["created_at"])
     return sorted(products, key=lambda x: x.get("sort_order", 0))
 
+@api_router.get("/products/search")
+async def search_products(
+    q: str,
+    limit: int = 20,
+    category: Optional[str] = None,
+    include_unavailable: Optional[str] = None
+):
+    """Fuzzy product search ranked by name, then category, then description matches"""
+    await product_search.refresh()
+    return product_search.search(
+        q, limit=max(1, min(limit, 100)), category=category, include_unavailable=include_unavailable == "true"
+    )
+
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     product = await db.products.find_one({"id": product_id}, {"_id": 0})
@@ -429,11 +1180,77 @@ async def update_product(product_id: str, product: Product, current_user: User =
     if current_user.role not in ["storage", "cashier", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    product_dict = product.model_dump()
+    product_dict = product.model_dump(exclude={"version"})
     product_dict["created_at"] = product_dict["created_at"].isoformat()
-    await db.products.update_one({"id": product_id}, {"$set": product_dict})
+    await db.products.update_one({"id": product_id}, {"$set": product_dict, "$inc": {"version": 1}})
+    catalog.bump()
     return product
 
+@api_router.patch("/products/{product_id}", response_model=Product)
+async def patch_product(product_id: str, update: ProductUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["storage", "cashier", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    _, product = await patch_document(db.products, product_id, update, "Product not found")
+    catalog.bump()
+    return product
+
+@api_router.post("/products/batch")
+async def batch_update_products(updates: List[ProductPatch], current_user: User = Depends(get_current_user)):
+    """Apply many partial product updates (e.g. a menu reorder) in one bulk_write
+
+    Each entry is reported as applied, conflict (its version is stale) or
+    not_found, so one bad entry does not hide the outcome of the others.
+    """
+    if current_user.role not in ["storage", "cashier", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    products = await db.products.find(
+        {"id": {"$in": [u.id for u in updates]}}, {"_id": 0, "id": 1, "version": 1}
+    ).to_list(None)
+    versions = {p["id"]: p.get("version") or 0 for p in products}
+    
+    results = []
+    bulk_ops = []
+    candidates = []
+    for update in updates:
+        entry = {"id": update.id, "result": "applied"}
+        results.append(entry)
+        if update.id not in versions:
+            entry["result"] = "not_found"
+            continue
+        if update.version is not None and update.version != versions[update.id]:
+            entry["result"] = "conflict"
+            continue
+        changes = update.model_dump(exclude_unset=True, exclude={"id", "version"})
+        if changes:
+            query = {"id": update.id}
+            if update.version is not None:
+                query["version"] = update.version if update.version else {"$in": [0, None]}
+            bulk_ops.append(UpdateOne(query, {"$set": changes, "$inc": {"version": 1}}))
+            candidates.append((update, entry))
+    
+    if bulk_ops:
+        result = await db.products.bulk_write(bulk_ops, ordered=False)
+        if result.modified_count:
+            catalog.bump()
+        if result.modified_count < len(bulk_ops):
+            # Some products changed or went away between the read and the write
+            products = await db.products.find(
+                {"id": {"$in": [u.id for u, _ in candidates]}}, {"_id": 0, "id": 1, "version": 1}
+            ).to_list(None)
+            versions = {p["id"]: p.get("version") or 0 for p in products}
+            for update, entry in candidates:
+                if update.id not in versions:
+                    entry["result"] = "not_found"
+                elif update.version is not None and versions[update.id] != update.version + 1:
+                    entry["result"] = "conflict"
+    
+    return {
+        "applied": sum(1 for entry in results if entry["result"] == "applied"),
+        "results": results
+    }
+
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str, current_user: User = Depends(get_current_user)):
     if current_user.role not in ["admin"]:
@@ -442,9 +1259,149 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    catalog.bump()
     return {"message": "Product deleted"}
 
 # Tables Routes
+class FloorState:
+    """Live state of every table, derived from the orders seated at it
+
+    A table with unpaid, uncancelled dine-in orders is occupied and its
+    running bill is the sum of those orders. Order and payment handlers
+    update it in memory, GET /tables is served from here, and changed
+    tables are written back to the tables collection by a periodic flush.
+    A seating runs from the first order until the table is free again.
+    The state lives in this process, so the API must run as a single worker.
+    """
+    LIVE_FIELDS = ("open_orders", "seating")
+
+    def __init__(self):
+        self.tables = {}        # table_id -> table document plus open_orders {order_id: amount} and seating totals
+        self.by_number = {}     # table_number -> table_id
+        self.order_tables = {}  # open order_id -> table_id
+        self.dirty = set()
+
+    def put_table(self, table: dict):
+        """Add a table or refresh its stored fields, keeping its live orders and status
+
+        The stored status lags behind until the next flush, so a known
+        table keeps the one held here; change it through set_status.
+        """
+        current = self.tables.get(table["id"])
+        if current is not None and current["table_number"] != table["table_number"]:
+            self.by_number.pop(current["table_number"], None)
+        live = {
+            "open_orders": current["open_orders"] if current else {},
+            "seating": current["seating"] if current else {"orders": 0, "revenue": 0},
+            "seated_since": current["seated_since"] if current else None
+        }
+        if current is not None:
+            live["status"] = current["status"]
+        self.tables[table["id"]] = {**table, **live}
+        self.by_number[table["table_number"]] = table["id"]
+
+    def set_status(self, table_id: str, status: str) -> Optional[dict]:
+        """Set a table's status by hand
+
+        Returns the finished seating when this frees an occupied table that had paid orders.
+        """
+        table = self.tables.get(table_id)
+        if table is None:
+            return None
+        seating = None
+        if status == "occupied" and table["seated_since"] is None:
+            table["seated_since"] = datetime.now(timezone.utc).isoformat()
+        elif status != "occupied":
+            seating = self._end_seating(table_id, table)
+        table["status"] = status
+        self.dirty.add(table_id)
+        return seating
+
+    def order_opened(self, order: dict):
+        if order.get("order_type") != "dine-in":
+            return
+        table_id = order.get("table_id")
+        if table_id not in self.tables:
+            table_id = self.by_number.get(order.get("table_number"))
+        if table_id is None:
+            return
+        table = self.tables[table_id]
+        table["open_orders"][order["id"]] = order.get("total_amount", 0)
+        if table["seated_since"] is None:
+            table["seated_since"] = order.get("created_at")
+        table["status"] = "occupied"
+        self.order_tables[order["id"]] = table_id
+        self.dirty.add(table_id)
+
+    def order_closed(self, order_id: str, paid: bool = False) -> Optional[dict]:
+        """An order was paid or cancelled; the table frees up with its last open order
+
+        Returns the finished seating when this freed a table that had paid orders.
+        """
+        table_id = self.order_tables.pop(order_id, None)
+        table = self.tables.get(table_id)
+        if table is None:
+            return None
+        amount = table["open_orders"].pop(order_id, 0)
+        if paid:
+            table["seating"]["orders"] += 1
+            table["seating"]["revenue"] += amount
+        self.dirty.add(table_id)
+        if table["open_orders"]:
+            return None
+        table["status"] = "available"
+        return self._end_seating(table_id, table)
+
+    def _end_seating(self, table_id: str, table: dict) -> Optional[dict]:
+        seating = None
+        if table["seating"]["orders"] and table["seated_since"]:
+            seating = {
+                "table_id": table_id,
+                "table_number": table["table_number"],
+                "capacity": table.get("capacity", 0),
+                "seated_since": table["seated_since"],
+                "freed_at": datetime.now(timezone.utc).isoformat(),
+                **table["seating"]
+            }
+        table["seated_since"] = None
+        table["seating"] = {"orders": 0, "revenue": 0}
+        return seating
+
+    def view(self, table: dict) -> dict:
+        view = {k: v for k, v in table.items() if k not in self.LIVE_FIELDS}
+        view["open_order_ids"] = list(table["open_orders"])
+        view["running_bill"] = round(sum(table["open_orders"].values()), 2)
+        return view
+
+    def snapshot(self) -> List[dict]:
+        return [self.view(t) for t in sorted(self.tables.values(), key=lambda t: t["table_number"])]
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        bulk_ops = []
+        for table_id in dirty:
+            table = self.tables.get(table_id)
+            if table is None:
+                continue
+            view = self.view(table)
+            bulk_ops.append(UpdateOne({"id": table_id}, {"$set": {
+                "status": view["status"],
+                "open_order_ids": view["open_order_ids"],
+                "running_bill": view["running_bill"],
+                "seated_since": view["seated_since"]
+            }}))
+        if not bulk_ops:
+            return
+        try:
+            await db.tables.bulk_write(bulk_ops, ordered=False)
+        except Exception:
+            self.dirty |= dirty
+            raise
+
+floor = FloorState()
+
 @api_router.post("/tables", response_model=Table)
 async def create_table(table: TableCreate, current_user: User = Depends(get_current_user)):
     if current_user.role not in ["storage", "cashier", "waiter"]:
@@ -462,12 +1419,13 @@ async def create_table(table: TableCreate, current_user: User = Depends(get_curr
     
     table_dict = table_obj.model_dump()
     await db.tables.insert_one(table_dict)
+    table_dict.pop("_id", None)
+    floor.put_table(table_dict)
     return table_obj
 
 @api_router.get("/tables", response_model=List[Table])
 async def get_tables(current_user: User = Depends(get_current_user)):
-    tables = await db.tables.find({}, {"_id": 0}).to_list(1000)
-    return tables
+    return floor.snapshot()
 
 @api_router.get("/tables/verify/{qr_code}", response_model=Table)
 async def verify_table_qr(qr_code: str):
@@ -480,13 +1438,40 @@ async def verify_table_qr(qr_code: str):
 async def update_table_status(table_id: str, status: dict, current_user: User = Depends(get_current_user)):
     if current_user.role not in ["waiter", "cashier"]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    await db.tables.update_one({"id": table_id}, {"$set": {"status": status["status"]}})
+    table = await db.tables.find_one_and_update(
+        {"id": table_id},
+        {"$set": {"status": status["status"]}, "$inc": {"version": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not table:
+        raise HTTPException(status_code=404, detail="Table not found")
+    # Refresh the stored fields so the floor serves the new version to later PATCHes
+    floor.put_table(table)
+    await record_seatings([floor.set_status(table_id, status["status"])])
     return {"message": "Table status updated"}
 
+@api_router.patch("/tables/{table_id}", response_model=Table)
+async def patch_table(table_id: str, update: TableUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["storage", "cashier", "waiter"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    _, table = await patch_document(db.tables, table_id, update, "Table not found")
+    floor.put_table(table)
+    if update.status is not None:
+        await record_seatings([floor.set_status(table_id, update.status)])
+    return floor.view(floor.tables[table_id])
+
 # Orders Routes
 @api_router.post("/orders", response_model=Order)
-async def create_order(order: OrderCreate):
-    order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+async def create_order(
+    order: OrderCreate,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
+):
+    return await run_idempotent("orders", idempotency_key, order, lambda: place_order(order))
+
+async def place_order(order: OrderCreate) -> Order:
+    business_date, order_number = await order_numbers.allocate()
     
     # Calculate subtotal and get product categories
     subtotal = 0
@@ -590,33 +1575,43 @@ async def create_order(order: OrderCreate):
         discount_info=discount_info,
         total_amount=final_amount,
         customer_location=order.customer_location,
-        notes=order.notes
+        notes=order.notes,
+        business_date=business_date
     )
     
-    order_dict = order_obj.model_dump()
+    order_obj.status_history = [StatusChange(status="pending", at=order_obj.created_at)]
+    order_dict = order_obj.model_dump(exclude={"eta"})
     order_dict["created_at"] = order_dict["created_at"].isoformat()
     order_dict["updated_at"] = order_dict["updated_at"].isoformat()
+    order_dict["status_history"] = [{"status": "pending", "at": order_dict["created_at"]}]
+    point = normalize_location(order.customer_location)
+    if point:
+        order_dict["customer_point"] = point
     if order_dict.get("discount_info"):
         order_dict["discount_info"] = order_dict["discount_info"]
     
     await db.orders.insert_one(order_dict)
+    batch_board.add(order_dict)
+    floor.order_opened(order_dict)
     
-    # Update ingredient stock - Batch optimized
-    bulk_ops = []
+    # Update ingredient stock - Batch optimized, one $inc per ingredient
+    stock_deltas = {}
     for item in order_obj.items:
         product = product_map.get(item.product_id)
         if product and "recipes" in product:
             for recipe in product["recipes"]:
-                bulk_ops.append(
-                    UpdateOne(
-                        {"id": recipe["ingredient_id"]},
-                        {"$inc": {"current_stock": -recipe["quantity"] * item.quantity}}
-                    )
-                )
+                ingredient_id = recipe["ingredient_id"]
+                stock_deltas[ingredient_id] = stock_deltas.get(ingredient_id, 0) - recipe["quantity"] * item.quantity
     
-    if bulk_ops:
-        await db.ingredients.bulk_write(bulk_ops)
+    if stock_deltas:
+        try:
+            await apply_stock_deltas(stock_deltas, "sale", order_id=order_obj.id)
+            stock_alerts.apply(stock_deltas)
+        except Exception as e:
+            # The order is already placed; a retry would only duplicate it
+            logger.error(f"Error updating stock for order {order_obj.id}: {e}")
     
+    order_obj.eta = prep_estimator.eta(order_dict)
     return order_obj
 
 class DiscountPreviewRequest(BaseModel):
@@ -705,29 +1700,26 @@ async def preview_order_discount(request: DiscountPreviewRequest):
         "has_membership": membership is not None
     }
 
-@api_router.get("/orders", response_model=List[Order])
+@api_router.get("/orders")
 async def get_orders(
     status: Optional[str] = None,
     order_type: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    """List orders, trimmed to the fields the caller's role needs"""
     query = {}
     if status:
         query["status"] = status
     if order_type:
         query["order_type"] = order_type
-    
+
     # Filter by customer for customer role
     if current_user.role == "customer":
         query["customer_id"] = current_user.id
-    
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for o in orders:
-        if isinstance(o["created_at"], str):
-            o["created_at"] = datetime.fromisoformat(o["created_at"])
-        if isinstance(o["updated_at"], str):
-            o["updated_at"] = datetime.fromisoformat(o["updated_at"])
-    return orders
+
+    view = ORDER_VIEWS.get(current_user.role, Order)
+    orders = await db.orders.find(query, order_projection(view)).sort("created_at", -1).to_list(1000)
+    return [view(**o) for o in orders]
 
 @api_router.get("/orders/{order_id}", response_model=Order)
 async def get_order(order_id: str):
@@ -738,84 +1730,809 @@ async def get_order(order_id: str):
         order["created_at"] = datetime.fromisoformat(order["created_at"])
     if isinstance(order["updated_at"], str):
         order["updated_at"] = datetime.fromisoformat(order["updated_at"])
+    order["eta"] = prep_estimator.eta(order)
     return Order(**order)
 
-@api_router.put("/orders/{order_id}/status")
-async def update_order_status(
-    order_id: str,
-    status_data: dict,
-    current_user: User = Depends(get_current_user)
-):
-    update_data = {
-        "status": status_data["status"],
-        "updated_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.orders.update_one({"id": order_id}, {"$set": update_data})
-    return {"message": "Order status updated"}
+# Kitchen Routes
+ACTIVE_ORDER_STATUSES = ["pending", "preparing", "ready"]
+BREWING_STATUSES = ("pending", "preparing")
 
-@api_router.put("/orders/{order_id}/location")
-async def update_order_location(order_id: str, location: dict):
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"customer_location": location, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    return {"message": "Location updated"}
+# Legal order status transitions - completed and cancelled are final
+ORDER_TRANSITIONS = {
+    "pending": ("preparing", "cancelled"),
+    "preparing": ("ready", "cancelled"),
+    "ready": ("completed", "cancelled"),
+    "completed": (),
+    "cancelled": (),
+}
 
-@api_router.put("/orders/{order_id}/payment")
-async def process_payment(
-    order_id: str,
-    payment_data: dict,
-    current_user: User = Depends(get_current_user)
-):
-    if current_user.role not in ["cashier"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    order = await db.orders.find_one({"id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    update_data = {
-        "payment_status": "paid",
-        "payment_method": payment_data["payment_method"],
-        "status": "completed",
-        "updated_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.orders.update_one({"id": order_id}, {"$set": update_data})
-    
-    # Create transaction
-    transaction = Transaction(
-        order_id=order_id,
-        amount=order["total_amount"],
-        payment_method=payment_data["payment_method"],
-        receipt_data={
-            "order_number": order["order_number"],
-            "items": order["items"],
-            "total": order["total_amount"],
-            "payment_method": payment_data["payment_method"],
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-    )
-    transaction_dict = transaction.model_dump()
-    transaction_dict["created_at"] = transaction_dict["created_at"].isoformat()
-    await db.transactions.insert_one(transaction_dict)
-    
-    return {"message": "Payment processed", "transaction": transaction}
+# Staff who may move orders between statuses
+ORDER_STATUS_ROLES = ["kitchen", "waiter", "cashier", "admin"]
 
-# Ingredients Routes
-@api_router.post("/ingredients", response_model=Ingredient)
-async def create_ingredient(ingredient: Ingredient, current_user: User = Depends(get_current_user)):
-    if current_user.role not in ["storage"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    ingredient_dict = ingredient.model_dump()
-    ingredient_dict["created_at"] = ingredient_dict["created_at"].isoformat()
-    await db.ingredients.insert_one(ingredient_dict)
-    return ingredient
+def transition_sources(status: str) -> List[str]:
+    """Statuses an order may be in to move to the given status"""
+    return [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
 
-@api_router.get("/ingredients", response_model=List[Ingredient])
-async def get_ingredients(current_user: User = Depends(get_current_user)):
-    if current_user.role not in ["storage", "kitchen"]:
-        raise HTTPException(status_code=403, detail="Not authorized")
+class BatchBrewBoard:
+    """Per-product totals across the tickets still being made
+
+    Kept up to date by the order write paths so the kitchen polls a
+    precomputed summary instead of aggregating every ticket itself.
+    """
+    def __init__(self):
+        self.tickets = {}   # order_id -> {"order_number", "items": [(product_id, product_name, quantity)]}
+        self.products = {}  # product_id -> {"product_name", "total_quantity", "tickets": {order_id: quantity}}
+        self.version = 0
+        self._summary = None
+
+    def add(self, order: dict):
+        order_id = order["id"]
+        if order_id in self.tickets:
+            return
+        items = [(i["product_id"], i["product_name"], i["quantity"]) for i in order.get("items", [])]
+        self.tickets[order_id] = {"order_number": order.get("order_number"), "items": items}
+        for product_id, product_name, quantity in items:
+            entry = self.products.setdefault(
+                product_id, {"product_name": product_name, "total_quantity": 0, "tickets": {}}
+            )
+            entry["total_quantity"] += quantity
+            entry["tickets"][order_id] = entry["tickets"].get(order_id, 0) + quantity
+        self._changed()
+
+    def remove(self, order_id: str):
+        ticket = self.tickets.pop(order_id, None)
+        if not ticket:
+            return
+        for product_id, _, quantity in ticket["items"]:
+            entry = self.products.get(product_id)
+            if not entry:
+                continue
+            entry["total_quantity"] -= quantity
+            entry["tickets"].pop(order_id, None)
+            if not entry["tickets"]:
+                del self.products[product_id]
+        self._changed()
+
+    def apply_status(self, order: dict, status: str):
+        if status in BREWING_STATUSES:
+            self.add(order)
+        else:
+            self.remove(order["id"])
+
+    def _changed(self):
+        self.version += 1
+        self._summary = None
+
+    def summary(self) -> dict:
+        if self._summary is None:
+            products = sorted(
+                self.products.items(), key=lambda kv: kv[1]["total_quantity"], reverse=True
+            )
+            self._summary = {
+                "version": self.version,
+                "open_tickets": len(self.tickets),
+                "products": [
+                    {
+                        "product_id": product_id,
+                        "product_name": entry["product_name"],
+                        "total_quantity": entry["total_quantity"],
+                        "tickets": [
+                            {
+                                "order_id": order_id,
+                                "order_number": self.tickets[order_id]["order_number"],
+                                "quantity": quantity
+                            }
+                            for order_id, quantity in entry["tickets"].items()
+                        ]
+                    }
+                    for product_id, entry in products
+                ]
+            }
+        return self._summary
+
+batch_board = BatchBrewBoard()
+
+# Upper bounds (seconds) of the stage latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 300, 420, 600, 900, 1200, 1800, 2700, 3600)
+
+def as_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+class StageTimings:
+    """Per-stage latency histograms for the current shop day
+
+    Every status change records how long the order spent in the status it
+    left, and reaching ready also records to_ready (placed to ready). The
+    buckets are fixed, so percentiles come from cumulative counts without
+    keeping individual samples. Counts reset when the shop day changes.
+    """
+    STAGES = ("pending", "preparing", "ready", "to_ready")
+
+    def __init__(self):
+        self.day = None
+        self.histograms = {}
+
+    def _roll(self):
+        today = shop_date()
+        if today != self.day:
+            self.day = today
+            self.histograms = {
+                stage: {"counts": [0] * (len(LATENCY_BUCKETS) + 1), "count": 0, "total": 0.0, "max": 0.0}
+                for stage in self.STAGES
+            }
+
+    def record(self, stage: str, seconds: float):
+        if stage not in self.STAGES or seconds < 0:
+            return
+        self._roll()
+        histogram = self.histograms[stage]
+        histogram["counts"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram["count"] += 1
+        histogram["total"] += seconds
+        histogram["max"] = max(histogram["max"], seconds)
+
+    def record_transition(self, order: dict, new_status: str, at: datetime):
+        """Record the stage an order is leaving, given the order as it was before the change
+
+        Orders from before status history fall back to updated_at, which is
+        stamped on every status change.
+        """
+        if new_status == "cancelled":
+            return
+        history = order.get("status_history") or []
+        if history:
+            left, entered_at = history[-1]["status"], history[-1]["at"]
+        else:
+            left, entered_at = order.get("status"), order.get("updated_at")
+        if left and entered_at:
+            self.record(left, (at - as_datetime(entered_at)).total_seconds())
+        if new_status == "ready" and order.get("created_at"):
+            self.record("to_ready", (at - as_datetime(order["created_at"])).total_seconds())
+
+    def replay(self, order: dict):
+        history = order.get("status_history") or []
+        for previous, change in zip(history, history[1:]):
+            self.record_transition(
+                {"status_history": [previous], "created_at": order.get("created_at")},
+                change["status"], as_datetime(change["at"])
+            )
+
+    @staticmethod
+    def percentile(histogram: dict, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th sample"""
+        if not histogram["count"]:
+            return None
+        target = q * histogram["count"]
+        cumulative = 0
+        for index, count in enumerate(histogram["counts"]):
+            if count and cumulative + count >= target:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else histogram["max"]
+                return round(lower + (min(upper, histogram["max"]) - lower) * (target - cumulative) / count, 1)
+            cumulative += count
+        return round(histogram["max"], 1)
+
+    def summary(self) -> dict:
+        self._roll()
+        stages = {}
+        for stage, histogram in self.histograms.items():
+            count = histogram["count"]
+            stages[stage] = {
+                "count": count,
+                "mean_seconds": round(histogram["total"] / count, 1) if count else None,
+                "p50_seconds": self.percentile(histogram, 0.5),
+                "p90_seconds": self.percentile(histogram, 0.9),
+                "p95_seconds": self.percentile(histogram, 0.95),
+                "max_seconds": round(histogram["max"], 1) if count else None,
+                "buckets": [
+                    {"le": LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None, "count": n}
+                    for i, n in enumerate(histogram["counts"]) if n
+                ]
+            }
+        return {"date": self.day, "stages": stages}
+
+stage_timings = StageTimings()
+
+class PrepTimeEstimator:
+    """Per-product prep times learned from status histories, and order ETAs
+
+    refresh() reads the last PREP_HISTORY_DAYS of orders that reached ready
+    and fits robust per-product estimates in analytics; eta() only does
+    dictionary lookups against those cached parameters and the batch-brew
+    board, so it is cheap enough to run on every create and get.
+    """
+    def __init__(self):
+        self.median = {}  # product_id -> prep seconds
+        self.spread = {}  # product_id -> robust standard deviation in seconds
+        self.default = PREP_DEFAULT_SECONDS
+        self.default_spread = 0.0
+        self.samples = 0
+        self.trained_at = None
+
+    async def refresh(self):
+        since = datetime.now(timezone.utc) - timedelta(days=PREP_HISTORY_DAYS)
+        orders = await db.orders.find(
+            {"created_at": {"$gte": since.isoformat()}, "status_history.status": "ready"},
+            {"_id": 0, "items.product_id": 1, "created_at": 1, "status_history": 1}
+        ).to_list(None)
+
+        product_ids = {}
+        product_index, seconds = [], []
+        for order in orders:
+            entered = {change["status"]: change["at"] for change in order["status_history"]}
+            started = entered.get("preparing") or order.get("created_at")
+            duration = (as_datetime(entered["ready"]) - as_datetime(started)).total_seconds()
+            if duration < 0:
+                continue
+            for product_id in {item["product_id"] for item in order.get("items", [])}:
+                product_index.append(product_ids.setdefault(product_id, len(product_ids)))
+                seconds.append(duration)
+
+        estimates = analytics.prep_time_estimates(
+            product_index, seconds, len(product_ids),
+            min_samples=PREP_MIN_SAMPLES, default_seconds=PREP_DEFAULT_SECONDS
+        )
+        self.median = {pid: float(estimates["median"][i]) for pid, i in product_ids.items()}
+        self.spread = {pid: float(estimates["spread"][i]) for pid, i in product_ids.items()}
+        self.default = float(estimates["overall_median"])
+        self.default_spread = float(estimates["overall_spread"])
+        self.samples = len(orders)
+        self.trained_at = datetime.now(timezone.utc)
+
+    def prep_seconds(self, product_ids) -> tuple:
+        """Prep time and spread of a ticket - its items are made side by side, so the slowest decides"""
+        estimates = [(self.median.get(pid, self.default), self.spread.get(pid, self.default_spread))
+                     for pid in product_ids]
+        return max(estimates, default=(0.0, 0.0))
+
+    def eta(self, order: dict) -> Optional[OrderEta]:
+        status = order.get("status", "pending")
+        if status in ("completed", "cancelled"):
+            return None
+        now = datetime.now(timezone.utc)
+        history = order.get("status_history") or []
+        if status == "ready":
+            ready_at = history[-1]["at"] if history else order.get("updated_at")
+            return OrderEta(seconds=0, ready_at=as_datetime(ready_at or now), margin_seconds=0,
+                            queue_ahead=0, refresh_after_seconds=0)
+
+        seconds, spread = self.prep_seconds({item["product_id"] for item in order.get("items", [])})
+        queue_ahead = 0
+        if status == "preparing":
+            started = history[-1]["at"] if history else order.get("updated_at")
+            if started:
+                seconds = max(seconds - (now - as_datetime(started)).total_seconds(), 0.0)
+        else:
+            # Tickets placed earlier share the kitchen's stations before this one starts
+            waiting = 0.0
+            for order_id, ticket in batch_board.tickets.items():
+                if order_id == order["id"]:
+                    break
+                queue_ahead += 1
+                waiting += self.prep_seconds({product_id for product_id, _, _ in ticket["items"]})[0]
+            seconds += waiting / KITCHEN_STATIONS
+
+        return OrderEta(
+            seconds=round(seconds),
+            ready_at=now + timedelta(seconds=seconds),
+            margin_seconds=round(spread),
+            queue_ahead=queue_ahead,
+            # Checking back about halfway to the estimate is enough to follow progress
+            refresh_after_seconds=round(min(max(seconds / 2, 15), 300))
+        )
+
+prep_estimator = PrepTimeEstimator()
+
+@api_router.get("/kitchen/queue", response_model=List[KitchenOrderView])
+async def get_kitchen_queue(current_user: User = Depends(get_current_user)):
+    """Open tickets oldest-first, served from the (status, created_at) index"""
+    if current_user.role not in ["kitchen", "waiter", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    orders = await db.orders.find(
+        {"status": {"$in": ACTIVE_ORDER_STATUSES}},
+        order_projection(KitchenOrderView)
+    ).sort("created_at", 1).to_list(200)
+    return orders
+
+@api_router.get("/kitchen/batch")
+async def get_kitchen_batch(since_version: Optional[int] = None, current_user: User = Depends(get_current_user)):
+    """Identical items grouped across open tickets for batch preparation"""
+    if current_user.role not in ["kitchen", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if since_version is not None and since_version == batch_board.version:
+        return {"version": batch_board.version, "unchanged": True}
+    return batch_board.summary()
+
+@api_router.get("/kitchen/stats")
+async def get_kitchen_stats(current_user: User = Depends(get_current_user)):
+    """Today's time-in-stage percentiles (queue wait, prep, pickup wait, placed-to-ready)"""
+    if current_user.role not in ["kitchen", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return stage_timings.summary()
+
+@api_router.put("/orders/{order_id}/status")
+async def update_order_status(
+    order_id: str,
+    status_data: OrderStatusUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ORDER_STATUS_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    new_status = status_data.status
+    changed_at = datetime.now(timezone.utc)
+    update_data = {
+        "status": new_status,
+        "updated_at": changed_at.isoformat()
+    }
+    # Only matches while the order is in a status that may move to new_status
+    order = await db.orders.find_one_and_update(
+        {"id": order_id, "status": {"$in": transition_sources(new_status)}},
+        {
+            "$set": update_data,
+            "$push": {"status_history": {"status": new_status, "at": update_data["updated_at"]}}
+        },
+        projection={
+            "_id": 0, "id": 1, "order_number": 1, "items": 1, "status": 1,
+            "created_at": 1, "updated_at": 1, "status_history": {"$slice": -1}
+        },
+        return_document=ReturnDocument.BEFORE
+    )
+    if not order:
+        current = await db.orders.find_one({"id": order_id}, {"_id": 0, "status": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot change order status from {current['status']} to {new_status}"
+        )
+    batch_board.apply_status(order, new_status)
+    stage_timings.record_transition(order, new_status, changed_at)
+    if new_status == "cancelled":
+        await record_seatings([floor.order_closed(order_id)])
+    return {"message": "Order status updated"}
+
+@api_router.post("/orders/bulk-status")
+async def bulk_update_order_status(
+    request: BulkOrderStatusUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    """Move many orders to one status with a single conditional bulk write"""
+    if current_user.role not in ORDER_STATUS_ROLES:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not request.order_ids and request.table_number is None:
+        raise HTTPException(status_code=400, detail="Provide order_ids or table_number")
+    
+    new_status = request.status
+    sources = transition_sources(new_status)
+    if request.from_status and request.from_status not in sources:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot change order status from {request.from_status} to {new_status}"
+        )
+    
+    query = {}
+    if request.order_ids:
+        query["id"] = {"$in": request.order_ids}
+    if request.table_number is not None:
+        query["table_number"] = request.table_number
+    if request.from_status:
+        query["status"] = request.from_status
+    elif not request.order_ids:
+        query["status"] = {"$in": sources}
+    
+    orders = await db.orders.find(
+        query,
+        {
+            "_id": 0, "id": 1, "order_number": 1, "status": 1, "items": 1,
+            "created_at": 1, "updated_at": 1, "status_history": {"$slice": -1}
+        }
+    ).to_list(500)
+    found = {o["id"] for o in orders}
+    
+    results = {}
+    for order_id in request.order_ids:
+        if order_id not in found:
+            results[order_id] = {"order_id": order_id, "result": "not_found"}
+    
+    # Each update only applies if the order still has the status we read,
+    # so a concurrent transition makes it miss instead of being overwritten
+    changed_at = datetime.now(timezone.utc)
+    now = changed_at.isoformat()
+    bulk_ops = []
+    candidates = []
+    for order in orders:
+        results[order["id"]] = {
+            "order_id": order["id"],
+            "order_number": order.get("order_number"),
+            "previous_status": order["status"],
+            "result": "illegal_transition"
+        }
+        if new_status in ORDER_TRANSITIONS.get(order["status"], ()):
+            bulk_ops.append(UpdateOne(
+                {"id": order["id"], "status": order["status"]},
+                {
+                    "$set": {"status": new_status, "updated_at": now},
+                    "$push": {"status_history": {"status": new_status, "at": now}}
+                }
+            ))
+            candidates.append(order)
+    
+    updated = 0
+    if bulk_ops:
+        result = await db.orders.bulk_write(bulk_ops, ordered=False)
+        applied = candidates
+        if result.modified_count < len(bulk_ops):
+            # Some orders moved between the read and the write - the ones
+            # carrying this request's timestamp are the ones we changed
+            stamped = await db.orders.find(
+                {"id": {"$in": [o["id"] for o in candidates]}, "status": new_status, "updated_at": now},
+                {"_id": 0, "id": 1}
+            ).to_list(None)
+            stamped_ids = {o["id"] for o in stamped}
+            applied = [o for o in candidates if o["id"] in stamped_ids]
+            for order in candidates:
+                if order["id"] not in stamped_ids:
+                    results[order["id"]]["result"] = "conflict"
+        seatings = []
+        for order in applied:
+            results[order["id"]]["result"] = "updated"
+            batch_board.apply_status(order, new_status)
+            stage_timings.record_transition(order, new_status, changed_at)
+            if new_status == "cancelled":
+                seatings.append(floor.order_closed(order["id"]))
+        await record_seatings(seatings)
+        updated = len(applied)
+    
+    return {"status": new_status, "updated": updated, "results": list(results.values())}
+
+class LocationBuffer:
+    """Latest reported position per order, written back in one bulk write
+
+    Phones can report GPS every few seconds; only the newest position
+    per order survives until the next flush, and pings arriving faster
+    than LOCATION_MIN_INTERVAL_SECONDS are refused.
+    """
+    def __init__(self, min_interval: float, max_orders: int = 5000):
+        self.min_interval = min_interval
+        self.max_orders = max_orders
+        self.pending = {}        # order_id -> $set fields
+        self.last_accepted = {}  # order_id -> monotonic time of last accepted ping
+
+    def offer(self, order_id: str, location: LocationUpdate) -> bool:
+        now = time.monotonic()
+        last = self.last_accepted.get(order_id)
+        if last is not None and now - last < self.min_interval:
+            return False
+        if order_id not in self.pending and len(self.pending) >= self.max_orders:
+            return False
+        self.last_accepted[order_id] = now
+        self.pending[order_id] = {
+            "customer_location": location.model_dump(exclude_none=True),
+            "customer_point": geo_point(location.lat, location.lng),
+            "location_updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        return True
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        # Location changes don't touch updated_at, and closed orders are skipped
+        bulk_ops = [
+            UpdateOne({"id": order_id, "status": {"$in": ACTIVE_ORDER_STATUSES}}, {"$set": fields})
+            for order_id, fields in batch.items()
+        ]
+        try:
+            await db.orders.bulk_write(bulk_ops, ordered=False)
+        except Exception:
+            # Keep positions that have not been superseded for the next flush
+            for order_id, fields in batch.items():
+                self.pending.setdefault(order_id, fields)
+            raise
+        
+        cutoff = time.monotonic() - max(60.0, self.min_interval)
+        self.last_accepted = {k: v for k, v in self.last_accepted.items() if v >= cutoff}
+
+location_buffer = LocationBuffer(LOCATION_MIN_INTERVAL_SECONDS)
+
+@api_router.put("/orders/{order_id}/location", status_code=202)
+async def update_order_location(order_id: str, location: LocationUpdate):
+    """Queue a customer position; it is written on the next buffer flush"""
+    if not location_buffer.offer(order_id, location):
+        raise HTTPException(
+            status_code=429,
+            detail="Location updates are too frequent",
+            headers={"Retry-After": str(int(LOCATION_MIN_INTERVAL_SECONDS) or 1)}
+        )
+    return {"message": "Location update accepted"}
+
+# Delivery Routes
+# Orders carrying a customer position - the customer app shares it for to-go orders too
+DELIVERY_ORDER_TYPES = ["delivery", "to-go"]
+COMPASS_POINTS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+
+def bearing_degrees(from_lat: float, from_lng: float, to_lat: float, to_lng: float) -> float:
+    """Initial great-circle bearing, 0 = north, clockwise"""
+    phi1, phi2 = math.radians(from_lat), math.radians(to_lat)
+    dlng = math.radians(to_lng - from_lng)
+    x = math.sin(dlng) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlng)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+def cluster_delivery_runs(orders: List[dict], shop_lat: float, shop_lng: float, run_size: int) -> List[dict]:
+    """Group distance-sorted orders into runs heading the same compass direction"""
+    sectors = {}
+    for order in orders:
+        lng, lat = order["customer_point"]["coordinates"]
+        sector = int(((bearing_degrees(shop_lat, shop_lng, lat, lng) + 22.5) % 360) // 45)
+        sectors.setdefault(sector, []).append(order)
+    
+    runs = []
+    for sector in sorted(sectors):
+        stops = sectors[sector]
+        for start in range(0, len(stops), run_size):
+            chunk = stops[start:start + run_size]
+            runs.append({
+                "direction": COMPASS_POINTS[sector],
+                "max_distance_m": chunk[-1]["distance_m"],
+                "orders": chunk
+            })
+    runs.sort(key=lambda r: r["orders"][0]["distance_m"])
+    return runs
+
+@api_router.get("/delivery/queue")
+async def get_delivery_queue(
+    cluster: bool = False,
+    run_size: int = 4,
+    max_distance_km: Optional[float] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Open orders with a customer location, nearest to the shop first"""
+    if current_user.role not in ["cashier", "waiter", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0, "shop_lat": 1, "shop_lng": 1})
+    if not settings or settings.get("shop_lat") is None or settings.get("shop_lng") is None:
+        raise HTTPException(status_code=400, detail="Shop location is not configured in settings")
+    shop_lat, shop_lng = settings["shop_lat"], settings["shop_lng"]
+    
+    geo_near = {
+        "near": geo_point(shop_lat, shop_lng),
+        "key": "customer_point",
+        "distanceField": "distance_m",
+        "spherical": True,
+        "query": {
+            "order_type": {"$in": DELIVERY_ORDER_TYPES},
+            "status": {"$in": ACTIVE_ORDER_STATUSES}
+        }
+    }
+    if max_distance_km is not None:
+        geo_near["maxDistance"] = max_distance_km * 1000
+    
+    orders = await db.orders.aggregate([
+        {"$geoNear": geo_near},
+        {"$limit": 200},
+        {"$project": {
+            "_id": 0, "id": 1, "order_number": 1, "order_type": 1, "customer_name": 1,
+            "status": 1, "payment_status": 1, "total_amount": 1, "created_at": 1,
+            "customer_location": 1, "customer_point": 1, "distance_m": 1
+        }}
+    ]).to_list(None)
+    
+    if cluster:
+        return {"runs": cluster_delivery_runs(orders, shop_lat, shop_lng, max(1, run_size))}
+    return {"orders": orders}
+
+@api_router.put("/orders/{order_id}/payment")
+async def process_payment(
+    order_id: str,
+    payment_data: PaymentRequest,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
+):
+    if current_user.role not in ["cashier"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return await run_idempotent(
+        f"payment:{order_id}", idempotency_key, payment_data,
+        lambda: settle_payment(order_id, payment_data.payment_method)
+    )
+
+async def settle_payment(order_id: str, payment_method: str):
+    """Mark an unpaid order paid and record its transaction, inside a
+    multi-document transaction when the deployment supports one"""
+    if TRANSACTIONS_ENABLED:
+        async with await client.start_session() as session:
+            order, transaction = await session.with_transaction(
+                lambda s: record_payment(order_id, payment_method, s)
+            )
+    else:
+        order, transaction = await record_payment(order_id, payment_method)
+    
+    batch_board.remove(order_id)
+    if order.get("status") != "completed":
+        stage_timings.record_transition(order, "completed", datetime.now(timezone.utc))
+    await record_seatings([floor.order_closed(order_id, paid=True)])
+    return {"message": "Payment processed", "transaction": transaction}
+
+async def record_payment(order_id: str, payment_method: str, session=None):
+    paid_at = datetime.now(timezone.utc)
+    now = paid_at.isoformat()
+    # The order is claimed for rollup as it is paid, so the backfill leaves it alone
+    claim = str(uuid.uuid4())
+    # Conditional on unpaid, so only one of several concurrent payments wins
+    # The order is returned as it was before, so the caller can time the stage it left
+    # A pipeline update, so history only gains "completed" if the status actually changes
+    order = await db.orders.find_one_and_update(
+        {"id": order_id, "payment_status": "unpaid", "status": {"$ne": "cancelled"}},
+        [{"$set": {
+            "payment_status": "paid",
+            "payment_method": payment_method,
+            "status": "completed",
+            "paid_at": now,
+            "updated_at": now,
+            "rollup_pending": claim,
+            "status_history": {"$cond": [
+                {"$eq": ["$status", "completed"]},
+                "$status_history",
+                {"$concatArrays": [
+                    {"$ifNull": ["$status_history", []]},
+                    [{"status": "completed", "at": now}]
+                ]}
+            ]}
+        }}],
+        projection={
+            "_id": 0, "id": 1, "order_number": 1, "items": 1, "subtotal": 1, "total_amount": 1,
+            "status": 1, "created_at": 1, "updated_at": 1, "status_history": {"$slice": -1}
+        },
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if not order:
+        existing = await db.orders.find_one({"id": order_id}, {"_id": 0, "id": 1, "status": 1}, session=session)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if existing.get("status") == "cancelled":
+            raise HTTPException(status_code=409, detail="Order was cancelled")
+        raise HTTPException(status_code=409, detail="Order already paid")
+    
+    # Create transaction
+    transaction = Transaction(
+        order_id=order_id,
+        amount=order["total_amount"],
+        payment_method=payment_method,
+        receipt_data={
+            "order_number": order["order_number"],
+            "items": order["items"],
+            "total": order["total_amount"],
+            "payment_method": payment_method,
+            "timestamp": now
+        }
+    )
+    transaction_dict = transaction.model_dump()
+    transaction_dict["created_at"] = transaction_dict["created_at"].isoformat()
+    await db.transactions.insert_one(transaction_dict, session=session)
+    try:
+        await roll_up_claimed([{**order, "payment_method": payment_method, "paid_at": paid_at}], claim, session=session)
+    except Exception as e:
+        if session is not None:
+            raise
+        # The payment stands; the claim was handed back and the next backfill counts it
+        logger.error(f"Error rolling up order {order_id}: {e}")
+    
+    return order, transaction
+
+class StockAlertMonitor:
+    """Low-stock alerts raised from the stock changes the write paths already know
+
+    Holds each ingredient's threshold and last known stock, so an order's
+    decrement is checked in memory. An alert is raised once when stock
+    drops below min_stock and only cleared after it climbs back
+    LOW_STOCK_HYSTERESIS above the threshold, so stock hovering around
+    min_stock does not flap.
+    """
+    def __init__(self, max_events: int = 200):
+        self.levels = {}   # ingredient_id -> {"name", "unit", "current_stock", "min_stock"}
+        self.active = {}   # ingredient_id -> open alert
+        self.events = deque(maxlen=max_events)
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    def track(self, ingredient: dict):
+        self.levels[ingredient["id"]] = {
+            "name": ingredient.get("name"),
+            "unit": ingredient.get("unit"),
+            "current_stock": ingredient.get("current_stock", 0),
+            "min_stock": ingredient.get("min_stock", 0)
+        }
+        self._evaluate(ingredient["id"])
+
+    def set_stock(self, ingredient_id: str, current_stock: float):
+        level = self.levels.get(ingredient_id)
+        if level is not None:
+            level["current_stock"] = current_stock
+            self._evaluate(ingredient_id)
+
+    def apply(self, deltas: dict):
+        for ingredient_id, delta in deltas.items():
+            level = self.levels.get(ingredient_id)
+            if level is not None:
+                level["current_stock"] += delta
+                self._evaluate(ingredient_id)
+
+    def _evaluate(self, ingredient_id: str):
+        level = self.levels[ingredient_id]
+        stock, threshold = level["current_stock"], level["min_stock"]
+        if ingredient_id not in self.active:
+            if stock < threshold:
+                alert = self._emit("low_stock", ingredient_id, level)
+                self.active[ingredient_id] = alert
+        elif stock >= threshold * (1 + LOW_STOCK_HYSTERESIS) and stock > threshold:
+            del self.active[ingredient_id]
+            self._emit("recovered", ingredient_id, level)
+
+    def _emit(self, kind: str, ingredient_id: str, level: dict) -> dict:
+        self.version += 1
+        event = {
+            "version": self.version,
+            "type": kind,
+            "ingredient_id": ingredient_id,
+            "name": level["name"],
+            "unit": level["unit"],
+            "current_stock": level["current_stock"],
+            "min_stock": level["min_stock"],
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+        self.events.append(event)
+        # Wake any waiting subscribers
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return event
+
+    async def wait(self, since_version: int, timeout: float):
+        if self.version == since_version:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def feed(self, since_version: Optional[int]) -> dict:
+        events = [e for e in self.events if since_version is None or e["version"] > since_version]
+        return {
+            "version": self.version,
+            "active": sorted(self.active.values(), key=lambda a: a["version"]),
+            "events": events
+        }
+
+stock_alerts = StockAlertMonitor()
+
+# Ingredients Routes
+@api_router.post("/ingredients", response_model=Ingredient)
+async def create_ingredient(ingredient: Ingredient, current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["storage"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    ingredient_dict = ingredient.model_dump()
+    ingredient_dict["created_at"] = ingredient_dict["created_at"].isoformat()
+    await db.ingredients.insert_one(ingredient_dict)
+    if ingredient.current_stock:
+        await db.stock_movements.insert_many(stock_movement_docs(
+            {ingredient.id: ingredient.current_stock}, "adjustment", note="Opening stock"
+        ))
+    stock_alerts.track(ingredient_dict)
+    catalog.bump()
+    return ingredient
+
+@api_router.get("/ingredients", response_model=List[Ingredient])
+async def get_ingredients(current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["storage", "kitchen"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
     ingredients = await db.ingredients.find({}, {"_id": 0}).to_list(1000)
     for i in ingredients:
@@ -832,11 +2549,246 @@ async def update_ingredient(
     if current_user.role not in ["storage"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    ingredient_dict = ingredient.model_dump()
+    ingredient_dict = ingredient.model_dump(exclude={"version"})
     ingredient_dict["created_at"] = ingredient_dict["created_at"].isoformat()
-    await db.ingredients.update_one({"id": ingredient_id}, {"$set": ingredient_dict})
+    previous = await db.ingredients.find_one_and_update(
+        {"id": ingredient_id},
+        {"$set": ingredient_dict, "$inc": {"version": 1}},
+        projection={"_id": 0, "current_stock": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    # An edited stock level is recorded as an adjustment so the ledger still adds up
+    if previous is not None:
+        delta = ingredient.current_stock - previous.get("current_stock", 0)
+        if delta:
+            await db.stock_movements.insert_many(stock_movement_docs(
+                {ingredient.id: delta}, "adjustment", note="Stock level edited"
+            ))
+        stock_alerts.track(ingredient_dict)
+    catalog.bump()
+    return ingredient
+
+@api_router.patch("/ingredients/{ingredient_id}", response_model=Ingredient)
+async def patch_ingredient(
+    ingredient_id: str,
+    update: IngredientUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["storage"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    before, ingredient = await patch_document(db.ingredients, ingredient_id, update, "Ingredient not found")
+    delta = ingredient.get("current_stock", 0) - before.get("current_stock", 0)
+    if delta:
+        await db.stock_movements.insert_many(stock_movement_docs(
+            {ingredient_id: delta}, "adjustment", note="Stock level edited"
+        ))
+    stock_alerts.track(ingredient)
+    catalog.bump()
     return ingredient
 
+def stock_movement_docs(deltas: dict, kind: str, order_id: Optional[str] = None, note: Optional[str] = None) -> List[dict]:
+    """Ledger documents for a set of {ingredient_id: signed quantity} changes"""
+    now = datetime.now(timezone.utc).isoformat()
+    docs = []
+    for ingredient_id, delta in deltas.items():
+        movement = StockMovement(ingredient_id=ingredient_id, kind=kind, delta=delta, order_id=order_id, note=note)
+        movement_dict = movement.model_dump()
+        movement_dict["created_at"] = now
+        docs.append(movement_dict)
+    return docs
+
+async def apply_stock_deltas(deltas: dict, kind: str, order_id: Optional[str] = None, note: Optional[str] = None):
+    """$inc current_stock by {ingredient_id: signed quantity} and record the ledger entries
+
+    Both writes share a transaction when the deployment supports one.
+    Otherwise the ledger goes first and the entries of any ingredient whose
+    $inc failed are removed again, so the ledger never claims a change that
+    was not applied.
+    """
+    docs = stock_movement_docs(deltas, kind, order_id=order_id, note=note)
+    bulk_ops = [
+        UpdateOne({"id": ingredient_id}, {"$inc": {"current_stock": delta}})
+        for ingredient_id, delta in deltas.items()
+    ]
+    if TRANSACTIONS_ENABLED:
+        async def write(session):
+            await db.stock_movements.insert_many(docs, session=session)
+            await db.ingredients.bulk_write(bulk_ops, session=session)
+        async with await client.start_session() as session:
+            await session.with_transaction(write)
+        return
+    
+    await db.stock_movements.insert_many(docs)
+    try:
+        await db.ingredients.bulk_write(bulk_ops, ordered=False)
+    except BulkWriteError as e:
+        failed = [docs[err["index"]]["id"] for err in e.details.get("writeErrors", [])]
+        await db.stock_movements.delete_many({"id": {"$in": failed}})
+        raise
+
+@api_router.post("/ingredients/{ingredient_id}/movements")
+async def record_stock_movement(
+    ingredient_id: str,
+    movement: StockMovementCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Record a restock, waste or manual adjustment and apply it to current_stock"""
+    if current_user.role not in ["storage"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if movement.kind == "restock":
+        delta = abs(movement.quantity)
+    elif movement.kind == "waste":
+        delta = -abs(movement.quantity)
+    else:
+        delta = movement.quantity
+    
+    # Ledger first, removed again if the stock change does not apply
+    docs = stock_movement_docs({ingredient_id: delta}, movement.kind, note=movement.note)
+    await db.stock_movements.insert_many(docs)
+    try:
+        ingredient = await db.ingredients.find_one_and_update(
+            {"id": ingredient_id},
+            {"$inc": {"current_stock": delta}},
+            projection={"_id": 0, "id": 1, "current_stock": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception:
+        await db.stock_movements.delete_one({"id": docs[0]["id"]})
+        raise
+    if not ingredient:
+        await db.stock_movements.delete_one({"id": docs[0]["id"]})
+        raise HTTPException(status_code=404, detail="Ingredient not found")
+    
+    stock_alerts.set_stock(ingredient_id, ingredient["current_stock"])
+    docs[0].pop("_id", None)
+    return {"movement": docs[0], "current_stock": ingredient["current_stock"]}
+
+@api_router.get("/ingredients/{ingredient_id}/movements")
+async def get_stock_movements(ingredient_id: str, limit: int = 100, current_user: User = Depends(get_current_user)):
+    """Most recent ledger entries for one ingredient"""
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    movements = await db.stock_movements.find(
+        {"ingredient_id": ingredient_id}, {"_id": 0}
+    ).sort("created_at", -1).to_list(max(1, min(limit, 1000)))
+    return movements
+
+async def take_stock_snapshot() -> dict:
+    """Fold the ledger into a new snapshot: the previous snapshot plus the
+    movements up to taken_at
+
+    Snapshots never read current_stock, so drift stays visible to
+    reconcile however many snapshots are taken. taken_at trails the clock
+    by STOCK_SNAPSHOT_LAG_SECONDS so movements stamped just before it have
+    been inserted by the time they are summed.
+    """
+    taken_at = (datetime.now(timezone.utc) - timedelta(seconds=STOCK_SNAPSHOT_LAG_SECONDS)).isoformat()
+    latest = await db.stock_snapshots.find_one({}, {"_id": 0}, sort=[("taken_at", -1)])
+    if latest and latest["taken_at"] >= taken_at:
+        return latest
+    _, levels = await stock_levels_at(taken_at)
+    snapshot = {"id": str(uuid.uuid4()), "taken_at": taken_at, "levels": levels}
+    await db.stock_snapshots.insert_one(snapshot)
+    snapshot.pop("_id", None)
+    
+    # Correct any drift in the alert monitor's view of stock
+    ingredients = await db.ingredients.find({}, {"_id": 0, "id": 1, "current_stock": 1}).to_list(None)
+    for ingredient in ingredients:
+        stock_alerts.set_stock(ingredient["id"], ingredient.get("current_stock", 0))
+    return snapshot
+
+async def stock_levels_at(at: str):
+    """Stock per ingredient at an ISO timestamp: the latest snapshot before
+    it plus the movements between the two"""
+    snapshot = await db.stock_snapshots.find_one(
+        {"taken_at": {"$lte": at}}, {"_id": 0}, sort=[("taken_at", -1)]
+    )
+    levels = dict(snapshot["levels"]) if snapshot else {}
+    window = {"$lte": at}
+    if snapshot:
+        window["$gt"] = snapshot["taken_at"]
+    async for row in db.stock_movements.aggregate([
+        {"$match": {"created_at": window}},
+        {"$group": {"_id": "$ingredient_id", "delta": {"$sum": "$delta"}}}
+    ]):
+        levels[row["_id"]] = levels.get(row["_id"], 0) + row["delta"]
+    return snapshot, levels
+
+@api_router.get("/inventory/stock-at")
+async def get_stock_at(at: datetime, current_user: User = Depends(get_current_user)):
+    """Stock of every ingredient at a past point in time"""
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    snapshot, levels = await stock_levels_at(at.astimezone(timezone.utc).isoformat())
+    return {
+        "at": at,
+        "snapshot_taken_at": snapshot["taken_at"] if snapshot else None,
+        "levels": levels
+    }
+
+@api_router.post("/inventory/snapshots")
+async def create_stock_snapshot(current_user: User = Depends(get_current_user)):
+    """Fold the ledger into a snapshot; taken_at trails the clock by STOCK_SNAPSHOT_LAG_SECONDS"""
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    snapshot = await take_stock_snapshot()
+    return {"id": snapshot["id"], "taken_at": snapshot["taken_at"], "ingredients": len(snapshot["levels"])}
+
+@api_router.get("/inventory/reconcile")
+async def reconcile_stock(current_user: User = Depends(get_current_user)):
+    """Compare current_stock with the level the ledger says it should be"""
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    ingredients = await db.ingredients.find(
+        {}, {"_id": 0, "id": 1, "name": 1, "unit": 1, "current_stock": 1}
+    ).to_list(None)
+    snapshot, levels = await stock_levels_at(datetime.now(timezone.utc).isoformat())
+    
+    mismatches = []
+    for ingredient in ingredients:
+        expected = levels.get(ingredient["id"], 0)
+        actual = ingredient.get("current_stock", 0)
+        if abs(actual - expected) > 1e-6:
+            mismatches.append({
+                "ingredient_id": ingredient["id"],
+                "name": ingredient["name"],
+                "unit": ingredient.get("unit"),
+                "current_stock": actual,
+                "ledger_stock": round(expected, 6),
+                "difference": round(actual - expected, 6)
+            })
+    return {
+        "snapshot_taken_at": snapshot["taken_at"] if snapshot else None,
+        "checked": len(ingredients),
+        "mismatches": mismatches
+    }
+
+@api_router.get("/inventory/alerts")
+async def get_stock_alerts(
+    since_version: Optional[int] = None,
+    wait: int = 0,
+    current_user: User = Depends(get_current_user)
+):
+    """Open low-stock alerts and the alert events after since_version
+
+    With wait > 0 the request is held for up to that many seconds until a
+    new event arrives, so dashboards get alerts as soon as they are raised.
+    """
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if since_version is not None and wait > 0:
+        await stock_alerts.wait(since_version, min(wait, 30))
+    return stock_alerts.feed(since_version)
+
 # COGS Routes
 @api_router.post("/cogs", response_model=COGS)
 async def create_cogs(cogs: COGS, current_user: User = Depends(get_current_user)):
@@ -855,6 +2807,155 @@ async def get_cogs(current_user: User = Depends(get_current_user)):
     cogs_list = await db.cogs.find({}, {"_id": 0}).to_list(1000)
     return cogs_list
 
+# Catalog Import/Export Routes
+CatalogEntity = Literal["products", "categories", "ingredients", "cogs"]
+
+# Natural key each entity is upserted on when a record carries no id; roles
+# match the entity's create endpoint
+CATALOG_ENTITIES = {
+    "categories": {"model": Category, "key": "slug", "roles": ["admin"]},
+    "ingredients": {"model": Ingredient, "key": "name", "roles": ["storage"]},
+    "products": {"model": Product, "key": "name", "roles": ["storage", "cashier", "admin"]},
+    "cogs": {"model": COGS, "key": "name", "roles": ["storage"]},
+}
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 100
+
+async def import_catalog(entity: str, records) -> dict:
+    """Validate and upsert catalog records in batches
+
+    Each batch is validated against the entity's model and written with one
+    unordered bulk_write. Invalid rows are skipped and reported; recipe
+    ingredient names are resolved to IDs from a map loaded once per import.
+    """
+    spec = CATALOG_ENTITIES[entity]
+    model, key = spec["model"], spec["key"]
+    collection = db[entity]
+    fields = model.model_fields
+    
+    ingredient_ids = None
+    if entity == "products":
+        ingredient_ids = {
+            i["name"].strip().lower(): i["id"]
+            async for i in db.ingredients.find({}, {"_id": 0, "id": 1, "name": 1})
+        }
+    
+    summary = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    row_number = 0
+    for batch in catalog_io.batched(records, IMPORT_BATCH_SIZE):
+        docs = {}
+        for record in batch:
+            row_number += 1
+            try:
+                if ingredient_ids is not None and "recipes" in record:
+                    record = dict(record, recipes=catalog_io.resolve_recipes(record["recipes"], ingredient_ids))
+                doc = model(**record).model_dump(exclude={"id", "created_at", "version"})
+            except ValueError as e:
+                summary["failed"] += 1
+                if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+                    summary["errors"].append({"row": row_number, "error": str(e)})
+                continue
+            record_id = record.get("id")
+            # Later rows win over earlier duplicates within a batch
+            docs[("id", record_id) if record_id else (key, doc[key])] = (doc, record_id)
+        if not docs:
+            continue
+        
+        now = datetime.now(timezone.utc).isoformat()
+        filters = [{field: value} for field, value in docs]
+        bulk_ops = []
+        for query, (doc, record_id) in zip(filters, docs.values()):
+            on_insert = {"id": record_id or str(uuid.uuid4())}
+            if "created_at" in fields:
+                on_insert["created_at"] = now
+            update = {"$set": doc, "$setOnInsert": on_insert}
+            if "version" in fields:
+                update["$inc"] = {"version": 1}
+            bulk_ops.append(UpdateOne(query, update, upsert=True))
+        
+        if entity == "ingredients":
+            previous = {
+                i["id"]: i.get("current_stock", 0)
+                async for i in collection.find({"$or": filters}, {"_id": 0, "id": 1, "current_stock": 1})
+            }
+        result = await collection.bulk_write(bulk_ops, ordered=False)
+        summary["inserted"] += result.upserted_count
+        summary["updated"] += result.matched_count
+        
+        # Imported stock levels go through the ledger like any other edit
+        if entity == "ingredients":
+            imported = await collection.find({"$or": filters}, {"_id": 0}).to_list(None)
+            deltas = {
+                i["id"]: i.get("current_stock", 0) - previous.get(i["id"], 0)
+                for i in imported
+                if i.get("current_stock", 0) != previous.get(i["id"], 0)
+            }
+            if deltas:
+                await db.stock_movements.insert_many(stock_movement_docs(deltas, "adjustment", note="Catalog import"))
+            for ingredient in imported:
+                stock_alerts.track(ingredient)
+    
+    if entity != "cogs" and (summary["inserted"] or summary["updated"]):
+        catalog.bump()
+    return summary
+
+async def export_catalog(entity: str, fmt: str = "jsonl"):
+    """Stream a catalog collection as CSV or JSON Lines, one document at a time"""
+    spec = CATALOG_ENTITIES[entity]
+    fields = list(spec["model"].model_fields)
+    
+    ingredient_names = None
+    if entity == "products" and fmt == "csv":
+        ingredient_names = {
+            i["id"]: i["name"] async for i in db.ingredients.find({}, {"_id": 0, "id": 1, "name": 1})
+        }
+        
+    if fmt == "csv":
+        yield catalog_io.csv_line(fields)
+    async for doc in db[entity].find({}, {"_id": 0}).sort(spec["key"], 1):
+        if fmt == "csv":
+            if ingredient_names is not None:
+                doc["recipes"] = catalog_io.format_recipes(doc.get("recipes"), ingredient_names)
+            yield catalog_io.csv_line([doc.get(field) for field in fields])
+        else:
+            yield json.dumps(doc, default=str) + "\n"
+
+@api_router.post("/catalog/{entity}/import")
+async def import_catalog_file(
+    entity: CatalogEntity,
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "jsonl", "json"]] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Upsert products, categories, ingredients or COGS from a CSV/JSON upload"""
+    if current_user.role not in CATALOG_ENTITIES[entity]["roles"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    stream = TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        records = catalog_io.iter_records(stream, format or catalog_io.detect_format(file.filename))
+        return await import_catalog(entity, records)
+    except ValueError as e:
+        # Raised by the parser, not by row validation; earlier batches are kept
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
+    finally:
+        stream.detach()
+
+@api_router.get("/catalog/{entity}/export")
+async def export_catalog_file(
+    entity: CatalogEntity,
+    format: Literal["csv", "jsonl"] = "jsonl",
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in CATALOG_ENTITIES[entity]["roles"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return StreamingResponse(
+        export_catalog(entity, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'}
+    )
+
 # Transactions Routes
 @api_router.get("/transactions", response_model=List[Transaction])
 async def get_transactions(current_user: User = Depends(get_current_user)):
@@ -867,6 +2968,643 @@ async def get_transactions(current_user: User = Depends(get_current_user)):
             t["created_at"] = datetime.fromisoformat(t["created_at"])
     return transactions
 
+# Reporting Routes
+def rollup_updates(order: dict, payment_method: str, date: str) -> List[UpdateOne]:
+    """$inc upserts adding one paid order to its daily_rollups rows
+
+    Lines for the same product and category are merged first, since they
+    land on the same row. Membership discounts are spread over the rows in
+    proportion to their gross value, so net_revenue sums to the order total.
+    order_count is attributed to the first row only, so summing it counts
+    each order once.
+    """
+    subtotal = order.get("subtotal") or sum(i["price"] * i["quantity"] for i in order["items"])
+    net_ratio = order["total_amount"] / subtotal if subtotal else 1
+    
+    rows = {}
+    for item in order["items"]:
+        key = (item["product_id"], item.get("category") or "uncategorized")
+        row = rows.setdefault(key, {"product_name": item["product_name"], "quantity": 0, "gross": 0})
+        row["quantity"] += item["quantity"]
+        row["gross"] += item["price"] * item["quantity"]
+    
+    updates = []
+    for index, ((product_id, category), row) in enumerate(rows.items()):
+        updates.append(UpdateOne(
+            {
+                "date": date,
+                "product_id": product_id,
+                "category": category,
+                "payment_method": payment_method
+            },
+            {
+                "$inc": {
+                    "quantity": row["quantity"],
+                    "gross_revenue": row["gross"],
+                    "net_revenue": round(row["gross"] * net_ratio, 2),
+                    "order_count": 1 if index == 0 else 0
+                },
+                "$set": {"product_name": row["product_name"]}
+            },
+            upsert=True
+        ))
+    return updates
+
+async def apply_rollup_updates(updates: List[UpdateOne], session=None):
+    """Write rollup_updates, retrying upserts that raced a new row
+
+    Two payments can both upsert a row that does not exist yet; one of
+    them hits the unique key, and by the retry the row is there to match.
+    A second failure is raised. Inside a transaction the duplicate has
+    already aborted it, so it is raised straight away.
+    """
+    for attempt in range(2):
+        try:
+            await db.daily_rollups.bulk_write(updates, ordered=False, session=session)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if (session is not None or attempt or e.details.get("writeConcernErrors")
+                    or any(err.get("code") != 11000 for err in errors)):
+                raise
+            updates = [updates[err["index"]] for err in errors]
+
+async def roll_up_claimed(orders: List[dict], claim: str, session=None):
+    """Add orders claimed under `claim` to daily_rollups and mark them rolled up
+
+    Orders waiting for a rollup carry rollup_pending: True, and whoever
+    swaps that for its own claim token is the only one to count them, so an
+    order is never counted twice. If the increments fail the claim is handed
+    back for the next backfill; inside a transaction the abort does that.
+    """
+    updates = []
+    for order in orders:
+        paid_at = order.get("paid_at") or order.get("updated_at") or order["created_at"]
+        if isinstance(paid_at, str):
+            paid_at = datetime.fromisoformat(paid_at)
+        if paid_at.tzinfo is None:
+            paid_at = paid_at.replace(tzinfo=timezone.utc)
+        updates.extend(rollup_updates(order, order.get("payment_method") or "cash", shop_date(paid_at)))
+    try:
+        await apply_rollup_updates(updates, session=session)
+    except Exception:
+        if session is None:
+            await db.orders.update_many({"rollup_pending": claim}, {"$set": {"rollup_pending": True}})
+        raise
+    await db.orders.update_many(
+        {"rollup_pending": claim},
+        {"$set": {"rolled_up": True}, "$unset": {"rollup_pending": ""}},
+        session=session
+    )
+
+def report_range(start: Optional[str], end: Optional[str], default_days: int = 30):
+    """Inclusive YYYY-MM-DD range, defaulting to the last `default_days` shop days"""
+    end = end or shop_date()
+    try:
+        end_date = datetime.fromisoformat(end).date()
+        start_date = datetime.fromisoformat(start).date() if start else end_date - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start_date.isoformat(), end_date.isoformat()
+
+ROLLUP_PERIOD_KEYS = {
+    "day": "$date",
+    "month": {"$substrBytes": ["$date", 0, 7]},
+    "week": {"$let": {
+        "vars": {"d": {"$dateFromString": {"dateString": "$date", "format": "%Y-%m-%d"}}},
+        "in": {"$dateToString": {"date": "$$d", "format": "%G-W%V"}}
+    }},
+}
+
+@api_router.get("/reports/revenue")
+async def get_revenue_report(
+    period: Literal["day", "week", "month"] = "day",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Revenue per day, ISO week or month - reads daily_rollups only"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    start, end = report_range(start, end)
+    rows = await db.daily_rollups.aggregate([
+        {"$match": {"date": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            "_id": ROLLUP_PERIOD_KEYS[period],
+            "gross_revenue": {"$sum": "$gross_revenue"},
+            "net_revenue": {"$sum": "$net_revenue"},
+            "orders": {"$sum": "$order_count"},
+            "items": {"$sum": "$quantity"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None)
+    
+    return {
+        "period": period,
+        "start": start,
+        "end": end,
+        "rows": [{"period": r.pop("_id"), **r} for r in rows]
+    }
+
+@api_router.get("/reports/top-products")
+async def get_top_products_report(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    """Best-selling products by quantity - reads daily_rollups only"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    start, end = report_range(start, end)
+    rows = await db.daily_rollups.aggregate([
+        {"$match": {"date": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            "_id": "$product_id",
+            "product_name": {"$last": "$product_name"},
+            "category": {"$last": "$category"},
+            "quantity": {"$sum": "$quantity"},
+            "net_revenue": {"$sum": "$net_revenue"}
+        }},
+        {"$sort": {"quantity": -1}},
+        {"$limit": max(1, min(limit, 100))}
+    ]).to_list(None)
+    
+    return [{"product_id": r.pop("_id"), **r} for r in rows]
+
+@api_router.get("/reports/payment-mix")
+async def get_payment_mix_report(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Orders and revenue per payment method - reads daily_rollups only"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    start, end = report_range(start, end)
+    rows = await db.daily_rollups.aggregate([
+        {"$match": {"date": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            "_id": "$payment_method",
+            "orders": {"$sum": "$order_count"},
+            "net_revenue": {"$sum": "$net_revenue"}
+        }},
+        {"$sort": {"net_revenue": -1}}
+    ]).to_list(None)
+    
+    total = sum(r["net_revenue"] for r in rows) or 1
+    return [
+        {"payment_method": r["_id"], "orders": r["orders"], "net_revenue": r["net_revenue"],
+         "share": round(r["net_revenue"] / total, 4)}
+        for r in rows
+    ]
+
+def seating_rollup_update(seating: dict) -> UpdateOne:
+    """$inc upsert adding one finished seating to its table_rollups row
+
+    Rows are keyed by shop date, table and the local hour the party sat down.
+    seat_seconds is dwell time multiplied by the table's capacity.
+    """
+    seated = datetime.fromisoformat(seating["seated_since"])
+    freed = datetime.fromisoformat(seating["freed_at"])
+    dwell = max(0.0, (freed - seated).total_seconds())
+    local = seated.astimezone(SHOP_TZ)
+    return UpdateOne(
+        {"date": local.date().isoformat(), "table_id": seating["table_id"], "hour": local.hour},
+        {
+            "$inc": {
+                "seatings": 1,
+                "orders": seating["orders"],
+                "revenue": round(seating["revenue"], 2),
+                "dwell_seconds": dwell,
+                "seat_seconds": dwell * seating["capacity"]
+            },
+            "$set": {"table_number": seating["table_number"], "capacity": seating["capacity"]}
+        },
+        upsert=True
+    )
+
+async def record_seatings(seatings: List[Optional[dict]]):
+    """Add the seatings FloorState reports as finished to table_rollups
+
+    Callers pass whatever order_closed or set_status returned; None means
+    no seating ended. A failed write is logged rather than failing the
+    request that freed the table.
+    """
+    updates = [seating_rollup_update(s) for s in seatings if s]
+    if not updates:
+        return
+    try:
+        await db.table_rollups.bulk_write(updates, ordered=False)
+    except Exception as e:
+        logger.error(f"Error recording table seating: {e}")
+
+@api_router.get("/reports/tables")
+async def get_table_turnover_report(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Seat turnover, dwell time and revenue per seat-hour by table and by hour - reads table_rollups only"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    start, end = report_range(start, end)
+    days = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).days + 1
+    totals = {
+        "seatings": {"$sum": "$seatings"},
+        "orders": {"$sum": "$orders"},
+        "revenue": {"$sum": "$revenue"},
+        "dwell_seconds": {"$sum": "$dwell_seconds"},
+        "seat_seconds": {"$sum": "$seat_seconds"}
+    }
+    match = {"$match": {"date": {"$gte": start, "$lte": end}}}
+    by_table, by_hour = await asyncio.gather(
+        db.table_rollups.aggregate([
+            match,
+            {"$sort": {"date": 1}},
+            {"$group": {
+                "_id": "$table_id",
+                "table_number": {"$last": "$table_number"},
+                "capacity": {"$last": "$capacity"},
+                **totals
+            }}
+        ]).to_list(None),
+        db.table_rollups.aggregate([
+            match,
+            {"$group": {"_id": "$hour", **totals}},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+    )
+    
+    def metrics(row: dict) -> dict:
+        seatings = row["seatings"]
+        return {
+            "seatings": seatings,
+            "orders": row["orders"],
+            "revenue": round(row["revenue"], 2),
+            "avg_dwell_minutes": round(row["dwell_seconds"] / seatings / 60, 1) if seatings else None,
+            # Revenue per occupied seat-hour
+            "revenue_per_seat_hour": round(row["revenue"] / (row["seat_seconds"] / 3600), 2) if row["seat_seconds"] else None
+        }
+    
+    # Tables that had no seatings in the range are still listed
+    tables = {
+        t["id"]: {"table_id": t["id"], "table_number": t["table_number"], "capacity": t.get("capacity", 0)}
+        for t in floor.tables.values()
+    }
+    empty = {"seatings": 0, "orders": 0, "revenue": 0, "dwell_seconds": 0, "seat_seconds": 0}
+    rows = {table_id: dict(table, **metrics(empty)) for table_id, table in tables.items()}
+    for row in by_table:
+        table = tables.get(row["_id"], {"table_id": row["_id"], "table_number": row["table_number"], "capacity": row["capacity"]})
+        rows[row["_id"]] = dict(table, **metrics(row))
+    for row in rows.values():
+        row["turnover_per_day"] = round(row["seatings"] / days, 2)
+    
+    total_seats = sum(t["capacity"] for t in tables.values())
+    return {
+        "start": start,
+        "end": end,
+        "days": days,
+        "tables": sorted(rows.values(), key=lambda r: r["table_number"]),
+        "hours": [
+            {
+                "hour": row["_id"],
+                **metrics(row),
+                # Revenue per available seat-hour across the whole floor
+                "revpash": round(row["revenue"] / (total_seats * days), 2) if total_seats else None
+            }
+            for row in by_hour
+        ]
+    }
+
+class DailyCache:
+    """Results that only change once per shop day, dropped at the day boundary"""
+    def __init__(self):
+        self.day = None
+        self.entries = {}
+
+    def get(self, key):
+        if self.day != shop_date():
+            return None
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        today = shop_date()
+        if self.day != today:
+            self.day = today
+            self.entries = {}
+        self.entries[key] = value
+
+heatmap_cache = DailyCache()
+
+@api_router.get("/analytics/heatmap")
+async def get_demand_heatmap(
+    days: int = 90,
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Weekday x hour demand over the last `days` complete shop days"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    days = max(1, min(days, 730))
+    cache_key = (days, product_id, category)
+    cached = heatmap_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    # Complete days only, so the cached grid stays valid until tomorrow
+    today = shop_date()
+    start = (datetime.fromisoformat(today) - timedelta(days=days)).date().isoformat()
+    pipeline = [{"$match": {
+        "created_at": {"$gte": shop_day_start(start), "$lt": shop_day_start(today)},
+        "status": {"$ne": "cancelled"}
+    }}]
+    if product_id or category:
+        conditions = []
+        if product_id:
+            conditions.append({"$eq": ["$$item.product_id", product_id]})
+        if category:
+            conditions.append({"$eq": ["$$item.category", category]})
+        pipeline += [
+            {"$set": {"items": {"$filter": {
+                "input": "$items", "as": "item", "cond": {"$and": conditions}
+            }}}},
+            {"$match": {"items.0": {"$exists": True}}}
+        ]
+    tz = shop_utc_offset()
+    pipeline += [
+        {"$set": {"placed": {"$dateFromString": {"dateString": "$created_at"}}}},
+        {"$project": {
+            "_id": 0,
+            "weekday": {"$subtract": [{"$isoDayOfWeek": {"date": "$placed", "timezone": tz}}, 1]},
+            "hour": {"$hour": {"date": "$placed", "timezone": tz}},
+            "items": {"$sum": "$items.quantity"},
+            # Line value scaled by the order's discount ratio
+            "revenue": {"$multiply": [
+                {"$sum": {"$map": {"input": "$items", "in": {"$multiply": ["$$this.price", "$$this.quantity"]}}}},
+                {"$cond": [{"$gt": ["$subtotal", 0]}, {"$divide": ["$total_amount", "$subtotal"]}, 1]}
+            ]}
+        }}
+    ]
+    
+    weekdays, hours, items, revenue = [], [], [], []
+    async for row in db.orders.aggregate(pipeline, batchSize=5000):
+        weekdays.append(row["weekday"])
+        hours.append(row["hour"])
+        items.append(row["items"])
+        revenue.append(row["revenue"])
+    
+    result = {
+        "start": start,
+        "end": today,
+        "days": days,
+        "product_id": product_id,
+        "category": category,
+        **analytics.demand_heatmap(weekdays, hours, items, revenue)
+    }
+    heatmap_cache.put(cache_key, result)
+    return result
+
+forecast_cache = DailyCache()
+
+async def daily_product_sales(start: str, end: str) -> List[dict]:
+    """Units sold per shop day and product for orders placed in [start, end)
+
+    Stock is decremented when an order is placed, so this counts every
+    order regardless of payment.
+    """
+    tz = shop_utc_offset()
+    pipeline = [
+        {"$match": {"created_at": {"$gte": shop_day_start(start), "$lt": shop_day_start(end)}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {
+                "date": {"$dateToString": {
+                    "date": {"$dateFromString": {"dateString": "$created_at"}},
+                    "format": "%Y-%m-%d",
+                    "timezone": tz
+                }},
+                "product_id": "$items.product_id"
+            },
+            "quantity": {"$sum": "$items.quantity"}
+        }}
+    ]
+    rows = []
+    async for row in db.orders.aggregate(pipeline, batchSize=5000):
+        rows.append({**row["_id"], "quantity": row["quantity"]})
+    return rows
+
+@api_router.get("/inventory/forecast")
+async def get_ingredient_forecast(
+    horizon_days: int = 7,
+    history_days: int = 90,
+    lead_time_days: int = 2,
+    method: Literal["ses", "ma"] = "ses",
+    include_series: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Forecast ingredient usage from order history and recipes, with reorder suggestions"""
+    if current_user.role not in ["storage", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    horizon_days = max(1, min(horizon_days, 60))
+    history_days = max(7, min(history_days, 730))
+    ingredients = await db.ingredients.find(
+        {}, {"_id": 0, "id": 1, "name": 1, "unit": 1, "current_stock": 1, "min_stock": 1}
+    ).to_list(None)
+    ingredient_ids = [i["id"] for i in ingredients]
+    
+    # Usage history only covers completed days, so it is computed once per day
+    cache_key = (history_days, method, catalog.version)
+    cached = forecast_cache.get(cache_key)
+    if cached is None:
+        today = shop_date()
+        start = (datetime.fromisoformat(today) - timedelta(days=history_days)).date().isoformat()
+        products = await db.products.find({}, {"_id": 0, "id": 1, "recipes": 1}).to_list(None)
+        sales = await daily_product_sales(start, today)
+        
+        product_index = {p["id"]: n for n, p in enumerate(products)}
+        ingredient_index = {ingredient_id: n for n, ingredient_id in enumerate(ingredient_ids)}
+        recipe_matrix = [[0.0] * len(ingredient_ids) for _ in products]
+        for p in products:
+            for recipe in p.get("recipes", []):
+                column = ingredient_index.get(recipe["ingredient_id"])
+                if column is not None:
+                    recipe_matrix[product_index[p["id"]]][column] += recipe["quantity"]
+        
+        start_date = datetime.fromisoformat(start).date()
+        rows = [r for r in sales if r["product_id"] in product_index]
+        series = analytics.daily_consumption(
+            [(datetime.fromisoformat(r["date"]).date() - start_date).days for r in rows],
+            [product_index[r["product_id"]] for r in rows],
+            [r["quantity"] for r in rows],
+            recipe_matrix if products else [[0.0] * len(ingredient_ids)],
+            history_days
+        )
+        cached = {
+            "start": start,
+            "series": series,
+            "average_daily": series.mean(axis=0),
+            "daily_forecast": analytics.forecast_daily_usage(series, method=method)
+        }
+        forecast_cache.put(cache_key, cached)
+    
+    plan = analytics.reorder_plan(
+        cached["daily_forecast"],
+        [i.get("current_stock", 0) for i in ingredients],
+        [i.get("min_stock", 0) for i in ingredients],
+        horizon_days,
+        lead_time_days
+    )
+    
+    results = []
+    for n, ingredient in enumerate(ingredients):
+        daily = float(cached["daily_forecast"][n])
+        cover = float(plan["days_of_cover"][n])
+        entry = {
+            "ingredient_id": ingredient["id"],
+            "name": ingredient["name"],
+            "unit": ingredient.get("unit"),
+            "current_stock": ingredient.get("current_stock", 0),
+            "min_stock": ingredient.get("min_stock", 0),
+            "average_daily_usage": round(float(cached["average_daily"][n]), 3),
+            "forecast_daily_usage": round(daily, 3),
+            "forecast_total": round(daily * horizon_days, 3),
+            "days_of_cover": round(cover, 1) if math.isfinite(cover) else None,
+            "suggested_reorder": round(float(plan["reorder_quantity"][n]), 3)
+        }
+        if include_series:
+            entry["series"] = [round(float(v), 3) for v in cached["series"][:, n]]
+        results.append(entry)
+    results.sort(key=lambda r: (r["days_of_cover"] is None, r["days_of_cover"] or 0))
+    
+    return {
+        "method": method,
+        "history_start": cached["start"],
+        "history_days": history_days,
+        "horizon_days": horizon_days,
+        "lead_time_days": lead_time_days,
+        "ingredients": results
+    }
+
+@api_router.get("/reports/menu-engineering")
+async def get_menu_engineering_report(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Classify products by popularity and unit margin (stars, plowhorses, puzzles, dogs)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    start, end = report_range(start, end)
+    sales, products, unit_costs, overhead = await asyncio.gather(
+        db.daily_rollups.aggregate([
+            {"$match": {"date": {"$gte": start, "$lte": end}}},
+            {"$group": {
+                "_id": "$product_id",
+                "product_name": {"$last": "$product_name"},
+                "quantity": {"$sum": "$quantity"},
+                "net_revenue": {"$sum": "$net_revenue"}
+            }}
+        ]).to_list(None),
+        db.products.find({}, {"_id": 0, "id": 1, "name": 1, "category": 1, "price": 1, "available": 1}).to_list(None),
+        recipe_costs.get(),
+        db.cogs.aggregate([{"$group": {"_id": None, "total": {"$sum": "$cost"}}}]).to_list(1)
+    )
+    
+    # Every current product is rated, plus anything sold since removed from the menu
+    sold = {r["_id"]: r for r in sales}
+    rows = [
+        {"product_id": p["id"], "name": p["name"], "category": p.get("category"),
+         "price": p.get("price", 0), "available": p.get("available", True)}
+        for p in products
+    ]
+    known = {p["id"] for p in products}
+    rows += [
+        {"product_id": product_id, "name": r.get("product_name"), "category": None,
+         "price": 0, "available": False}
+        for product_id, r in sold.items() if product_id not in known
+    ]
+    
+    matrix = analytics.menu_engineering(
+        [sold.get(r["product_id"], {}).get("quantity", 0) for r in rows],
+        [sold.get(r["product_id"], {}).get("net_revenue", 0) for r in rows],
+        [r["price"] for r in rows],
+        [unit_costs.get(r["product_id"], 0) for r in rows]
+    )
+    for n, row in enumerate(rows):
+        row["unit_cost"] = round(float(matrix["unit_cost"][n]), 2)
+        row["quantity"] = int(matrix["quantity"][n])
+        row["average_price"] = round(float(matrix["average_price"][n]), 2)
+        row["unit_margin"] = round(float(matrix["unit_margin"][n]), 2)
+        row["total_margin"] = round(float(matrix["total_margin"][n]), 2)
+        row["menu_mix"] = round(float(matrix["menu_mix"][n]), 4)
+        row["classification"] = matrix["classification"][n]
+    rows.sort(key=lambda r: r["total_margin"], reverse=True)
+    
+    return {
+        "start": start,
+        "end": end,
+        "popularity_threshold": round(float(matrix["popularity_threshold"]), 4),
+        "margin_threshold": round(float(matrix["margin_threshold"]), 2),
+        "total_revenue": round(float(matrix["total_revenue"]), 2),
+        "total_ingredient_cost": round(float(matrix["total_cost"]), 2),
+        "overhead_costs": overhead[0]["total"] if overhead else 0,
+        "products": rows
+    }
+
+async def backfill_daily_rollups(batch_size: int = 500) -> int:
+    """Roll up paid orders still waiting for daily_rollups
+
+    Picks up payments whose rollup write failed, through the partial index
+    on rollup_pending, so a run reads only the waiting orders. Each batch is
+    claimed under a fresh token before its rows are written, so two runs
+    at once never count an order twice.
+    """
+    processed = 0
+    while True:
+        waiting = await db.orders.find(
+            {"rollup_pending": True}, {"_id": 0, "id": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not waiting:
+            return processed
+        claim = str(uuid.uuid4())
+        await db.orders.update_many(
+            {"id": {"$in": [o["id"] for o in waiting]}, "rollup_pending": True},
+            {"$set": {"rollup_pending": claim}}
+        )
+        orders = await db.orders.find(
+            {"rollup_pending": claim},
+            {"_id": 0, "id": 1, "items": 1, "subtotal": 1, "total_amount": 1,
+             "payment_method": 1, "paid_at": 1, "updated_at": 1, "created_at": 1}
+        ).to_list(None)
+        if orders:
+            await roll_up_claimed(orders, claim)
+            processed += len(orders)
+
+@api_router.post("/admin/rollups/backfill")
+async def run_rollup_backfill(current_user: User = Depends(get_current_user)):
+    """Add historical paid orders to daily_rollups - Admin only"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Paid orders from before daily_rollups were never flagged as waiting
+    await db.orders.update_many(
+        {"payment_status": "paid", "rolled_up": {"$ne": True}, "rollup_pending": {"$exists": False}},
+        {"$set": {"rollup_pending": True}}
+    )
+    processed = await backfill_daily_rollups()
+    return {"message": f"Rolled up {processed} order(s)", "processed": processed}
+
 # Admin Routes - User Management
 @api_router.get("/admin/users")
 async def get_all_users(current_user: User = Depends(get_current_user)):
@@ -894,13 +3632,16 @@ async def create_user_by_admin(user_data: UserRegister, current_user: User = Dep
     user = User(
         email=user_data.email,
         name=user_data.name,
+        phone=user_data.phone,
         role=user_data.role
     )
     user_dict = user.model_dump()
     user_dict["password"] = hashed_password
     user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["search_terms"] = customer_search_terms(user.name, user.email, user.phone)
     
     await db.users.insert_one(user_dict)
+    customer_lookups.clear()
     return {"message": "User created successfully", "user": user}
 
 @api_router.put("/admin/users/{user_id}/role")
@@ -916,6 +3657,7 @@ async def update_user_role(user_id: str, role_data: dict, current_user: User = D
     result = await db.users.update_one({"id": user_id}, {"$set": {"role": new_role}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    customer_lookups.clear()
     
     return {"message": "User role updated successfully"}
 
@@ -932,6 +3674,7 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    customer_lookups.clear()
     
     return {"message": "User deleted successfully"}
 
@@ -1064,6 +3807,7 @@ async def update_loyalty_program(program_id: str, program_data: LoyaltyProgramCr
         {"program_id": program_id, "status": "active"},
         {"$set": {"benefits": update_data["benefits"], "program_name": update_data["name"]}}
     )
+    customer_lookups.clear()
     
     return {"message": "Program updated successfully"}
 
@@ -1078,6 +3822,7 @@ async def delete_loyalty_program(program_id: str, current_user: User = Depends(g
         {"program_id": program_id},
         {"$set": {"status": "cancelled"}}
     )
+    customer_lookups.clear()
     
     result = await db.loyalty_programs.delete_one({"id": program_id})
     if result.deleted_count == 0:
@@ -1145,6 +3890,8 @@ async def assign_membership(membership_data: CustomerMembershipCreate, current_u
         await db.customer_memberships.insert_one(membership_dict)
         created_memberships.append(membership)
     
+    if created_memberships:
+        customer_lookups.clear()
     return {"message": f"Membership assigned to {len(created_memberships)} customer(s)", "memberships": created_memberships}
 
 @api_router.get("/admin/memberships")
@@ -1194,9 +3941,87 @@ async def cancel_membership(membership_id: str, current_user: User = Depends(get
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Membership not found")
+    customer_lookups.clear()
     
     return {"message": "Membership cancelled"}
 
+def customer_search_terms(name: str, email: str, phone: Optional[str] = None) -> List[str]:
+    """Normalized prefixes a customer can be found by: each name word, the
+    full name, the email address and the phone digits"""
+    tokens = search_tokens(name)
+    terms = set(tokens)
+    if tokens:
+        terms.add(" ".join(tokens))
+    if email:
+        terms.add(email.strip().lower())
+    digits = re.sub(r"\D", "", phone or "")
+    if digits:
+        terms.add(digits)
+    return sorted(terms)
+
+def customer_query_prefixes(q: str) -> List[str]:
+    """The same normalizations applied to what the cashier typed"""
+    prefixes = {q.strip().lower()}
+    tokens = search_tokens(q)
+    if tokens:
+        prefixes.add(" ".join(tokens))
+    digits = re.sub(r"\D", "", q)
+    if len(digits) >= 3:
+        prefixes.add(digits)
+    return [p for p in prefixes if p]
+
+# Recent lookups; cleared whenever a customer or membership changes
+customer_lookups = TTLCache(max_entries=512, ttl_seconds=60)
+
+def membership_expired(membership: dict) -> bool:
+    """Past its end_date; the status stays active until an order next checks it"""
+    end_date = membership.get("end_date")
+    if not end_date:
+        return False
+    if isinstance(end_date, str):
+        end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+    if end_date.tzinfo is None:
+        end_date = end_date.replace(tzinfo=timezone.utc)
+    return end_date < datetime.now(timezone.utc)
+
+@api_router.get("/customers/search")
+async def search_customers(q: str, limit: int = 10, current_user: User = Depends(get_current_user)):
+    """Find customers by name, email prefix or phone, with their active memberships"""
+    if current_user.role not in ["cashier", "waiter", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    prefixes = customer_query_prefixes(q)
+    if not prefixes or len(q.strip()) < 2:
+        return []
+    limit = max(1, min(limit, 50))
+    cache_key = f"{'|'.join(sorted(prefixes))}:{limit}"
+    cached = customer_lookups.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # Anchored regexes on the indexed search_terms array are index range scans
+    customers = await db.users.find(
+        {
+            "role": "customer",
+            "search_terms": {"$in": [re.compile("^" + re.escape(p)) for p in prefixes]}
+        },
+        {"_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "is_member": 1}
+    ).sort("name", 1).to_list(limit)
+    
+    memberships = {}
+    if customers:
+        async for m in db.customer_memberships.find(
+            {"customer_id": {"$in": [c["id"] for c in customers]}, "status": "active"},
+            {"_id": 0, "id": 1, "customer_id": 1, "program_id": 1, "program_name": 1, "end_date": 1, "benefits": 1}
+        ):
+            if not membership_expired(m):
+                memberships.setdefault(m.pop("customer_id"), []).append(m)
+    for customer in customers:
+        customer["memberships"] = memberships.get(customer["id"], [])
+    
+    customer_lookups.put(cache_key, customers)
+    return customers
+
 # Customer can view their own membership
 @api_router.get("/my/membership")
 async def get_my_membership(current_user: User = Depends(get_current_user)):
@@ -1208,14 +4033,66 @@ async def get_my_membership(current_user: User = Depends(get_current_user)):
     
     return memberships
 
+# Dashboard Routes
+def dashboard_sections(sections: dict, known: Optional[str]) -> dict:
+    """Wrap each section with an ETag; sections whose ETag the client already
+    holds (known="name:etag,...") are sent back without their data"""
+    known_etags = dict(part.split(":", 1) for part in (known or "").split(",") if ":" in part)
+    payload = {}
+    for name, data in sections.items():
+        encoded = jsonable_encoder(data)
+        etag = hashlib.sha1(json.dumps(encoded, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        if known_etags.get(name) == etag:
+            payload[name] = {"etag": etag, "unchanged": True}
+        else:
+            payload[name] = {"etag": etag, "data": encoded}
+    return {"sections": payload}
+
+@api_router.get("/dashboards/admin")
+async def get_admin_dashboard(known: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Everything the admin dashboard loads, fetched concurrently in one request"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    users, stats, programs, memberships, orders = await asyncio.gather(
+        get_all_users(current_user=current_user),
+        get_admin_stats(current_user=current_user),
+        get_loyalty_programs(current_user=current_user),
+        get_all_memberships(status="active", current_user=current_user),
+        get_orders(current_user=current_user)
+    )
+    return dashboard_sections({
+        "users": users,
+        "stats": stats,
+        "programs": programs,
+        "memberships": memberships,
+        "orders": orders
+    }, known)
+
+@api_router.get("/dashboards/waiter")
+async def get_waiter_dashboard(known: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Orders and tables for the waiter dashboard poll in one request"""
+    if current_user.role not in ["waiter", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    orders, tables = await asyncio.gather(
+        get_orders(current_user=current_user),
+        get_tables(current_user=current_user)
+    )
+    return dashboard_sections({"orders": orders, "tables": tables}, known)
+
 # Settings Model
 class Settings(BaseModel):
     currency_symbol: str = "Rp"
     currency_code: str = "IDR"
+    shop_lat: Optional[float] = None
+    shop_lng: Optional[float] = None
     
 class SettingsUpdate(BaseModel):
     currency_symbol: Optional[str] = None
     currency_code: Optional[str] = None
+    shop_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    shop_lng: Optional[float] = Field(default=None, ge=-180, le=180)
 
 # Settings Endpoints
 @api_router.get("/settings")
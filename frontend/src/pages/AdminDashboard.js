@@ -1,7 +1,7 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { toast } from 'sonner';
-import api from '../utils/api';
+import api, { fetchDashboard } from '../utils/api';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -51,24 +51,20 @@ const AdminDashboard = () => {
     benefits: [{ benefit_type: 'food_discount', value: 10, description: '10% off food' }],
   });
 
+  const dashboardEtags = useRef({});
+
   useEffect(() => {
     fetchData();
   }, []);
 
   const fetchData = async () => {
     try {
-      const [usersRes, statsRes, programsRes, membershipsRes, ordersRes] = await Promise.all([
-        api.get('/admin/users'),
-        api.get('/admin/stats'),
-        api.get('/admin/programs'),
-        api.get('/admin/memberships?status=active'),
-        api.get('/orders'),
-      ]);
-      setUsers(usersRes.data);
-      setStats(statsRes.data);
-      setPrograms(programsRes.data);
-      setMemberships(membershipsRes.data);
-      setOrders(ordersRes.data || []);
+      const changed = await fetchDashboard('admin', dashboardEtags.current);
+      if (changed.users) setUsers(changed.users);
+      if (changed.stats) setStats(changed.stats);
+      if (changed.programs) setPrograms(changed.programs);
+      if (changed.memberships) setMemberships(changed.memberships);
+      if (changed.orders) setOrders(changed.orders || []);
       setLoading(false);
     } catch (error) {
       toast.error('Failed to load admin data');
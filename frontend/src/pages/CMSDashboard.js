@@ -166,14 +166,19 @@ const CMSDashboard = () => {
 
   const toggleProductAvailability = async (product) => {
     try {
-      await api.put(`/products/${product.id}`, {
-        ...product,
-        available: !product.available
+      await api.patch(`/products/${product.id}`, {
+        available: !product.available,
+        version: product.version
       });
       toast.success(`Product ${!product.available ? 'enabled' : 'disabled'}`);
       fetchData();
     } catch (error) {
-      toast.error('Failed to update product');
+      if (error.response?.status === 409) {
+        toast.error('Product was changed by someone else, reloading');
+        fetchData();
+      } else {
+        toast.error('Failed to update product');
+      }
     }
   };
 
@@ -186,16 +191,17 @@ const CMSDashboard = () => {
     const newProducts = [...products];
     [newProducts[currentIndex], newProducts[newIndex]] = [newProducts[newIndex], newProducts[currentIndex]];
     
-    // Update sort orders
-    for (let i = 0; i < newProducts.length; i++) {
-      try {
-        await api.put(`/products/${newProducts[i].id}`, {
-          ...newProducts[i],
-          sort_order: i
-        });
-      } catch (error) {
-        console.error('Failed to update sort order');
+    // Update sort orders in one request, sending only the products that moved
+    const updates = newProducts
+      .map((p, i) => ({ id: p.id, sort_order: i }))
+      .filter((u, i) => newProducts[i].sort_order !== u.sort_order);
+    try {
+      const response = await api.post('/products/batch', updates);
+      if (response.data.applied < updates.length) {
+        toast.error('Some products changed meanwhile - sort order refreshed');
       }
+    } catch (error) {
+      toast.error('Failed to update sort order');
     }
     
     fetchData();
@@ -1,7 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { newIdempotencyKey } from '../utils/api';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Badge } from '../components/ui/badge';
@@ -28,6 +29,7 @@ import {
   Tag,
   AlertCircle,
   RefreshCw,
+  Search,
 } from 'lucide-react';
 import { useAuth } from '../context/AuthContext';
 import { useLanguage } from '../context/LanguageContext';
@@ -85,8 +87,11 @@ const CustomerApp = () => {
   const [customerName, setCustomerName] = useState('');
   const [customerEmail, setCustomerEmail] = useState('');
   const [notes, setNotes] = useState('');
+  const orderKeyRef = useRef(null);
   const [location, setLocation] = useState(null);
   const [category, setCategory] = useState('all');
+  const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
   
   // State for loading and errors per section
   const [loadingStates, setLoadingStates] = useState({
@@ -119,6 +124,27 @@ const CustomerApp = () => {
     }
   }, [searchParams]);
 
+  // Ranked server-side search once at least two characters are typed
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (query.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API_URL}/products/search`, {
+          params: { q: query, limit: 50 },
+          timeout: 10000,
+        });
+        setSearchResults(response.data.map((p) => p.id));
+      } catch (error) {
+        setSearchResults(null);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
   // Fetch user-specific data when logged in
   useEffect(() => {
     if (user) {
@@ -346,7 +372,17 @@ const CustomerApp = () => {
         customer_location: location,
       };
 
-      const response = await axios.post(`${API_URL}/orders`, orderData, { timeout: 15000 });
+      // Reuse the key while retrying the same order so a retry cannot create a duplicate;
+      // an edited cart is a new order and gets a new key
+      const body = JSON.stringify(orderData);
+      if (!orderKeyRef.current || orderKeyRef.current.body !== body) {
+        orderKeyRef.current = { key: newIdempotencyKey(), body };
+      }
+      const response = await axios.post(`${API_URL}/orders`, orderData, {
+        timeout: 15000,
+        headers: { 'Idempotency-Key': orderKeyRef.current.key },
+      });
+      orderKeyRef.current = null;
       
       // Show discount applied message if applicable
       if (response.data.discount_info && response.data.discount_info.total_discount > 0) {
@@ -357,6 +393,9 @@ const CustomerApp = () => {
       } else {
         toast.success(`Order placed! Order #${response.data.order_number}`);
       }
+      if (response.data.eta) {
+        toast(`Ready in about ${Math.max(1, Math.round(response.data.eta.seconds / 60))} min`, { duration: 5000 });
+      }
       
       // Update location for to-go orders
       if (orderType === 'to-go' && location) {
@@ -380,15 +419,25 @@ const CustomerApp = () => {
       }
     } catch (error) {
       console.error('Failed to place order:', error);
+      // 422: the key was used for a different order, so start over with a fresh one.
+      // 409 means the first attempt is still running - keep the key so a retry
+      // replays that order instead of placing a second one.
+      if (error.response?.status === 422) {
+        orderKeyRef.current = null;
+      }
       toast.error(error.response?.data?.detail || 'Failed to place order. Please try again.');
     }
   };
 
   // Filter products by category
   const safeProducts = Array.isArray(products) ? products : [];
-  const filteredProducts = category === 'all' 
+  const categoryProducts = category === 'all' 
     ? safeProducts 
     : safeProducts.filter((p) => p.category === category);
+  // Search results keep the server's ranking
+  const filteredProducts = searchResults
+    ? searchResults.map((id) => categoryProducts.find((p) => p.id === id)).filter(Boolean)
+    : categoryProducts;
 
   // Get unique categories from products
   const categories = ['all', ...new Set(safeProducts.map((p) => p.category).filter(Boolean))];
@@ -551,6 +600,19 @@ const CustomerApp = () => {
       <section className="max-w-7xl mx-auto px-4 py-12" data-testid="menu-section">
         <h3 className="text-2xl font-playfair font-bold text-[#5A3A2A] mb-6">Our Menu</h3>
 
+        {products.length > 0 && (
+          <div className="relative mb-4 max-w-md">
+            <Search className="absolute left-3 top-1/2 -translate-y-1/2 w-4 h-4 text-[#5A3A2A]/50" />
+            <Input
+              value={searchTerm}
+              onChange={(e) => setSearchTerm(e.target.value)}
+              placeholder="Search the menu"
+              data-testid="menu-search-input"
+              className="pl-9 bg-white rounded-full"
+            />
+          </div>
+        )}
+
         {/* Category Filters - Always show if we have products */}
         {products.length > 0 && (
           <div className="flex flex-wrap gap-2 mb-8">
@@ -54,6 +54,37 @@ const InventoryDashboard = () => {
     fetchData();
   }, []);
 
+  // Long-poll low-stock alerts instead of rescanning every ingredient
+  useEffect(() => {
+    let active = true;
+    let version = null;
+    const pollAlerts = async () => {
+      while (active) {
+        try {
+          const response = await api.get('/inventory/alerts', {
+            params: version === null ? {} : { since_version: version, wait: 25 },
+          });
+          if (!active) break;
+          if (version !== null && response.data.events.length) {
+            response.data.events
+              .filter((event) => event.type === 'low_stock')
+              .forEach((event) =>
+                toast.warning(`${event.name} is low: ${event.current_stock} ${event.unit} left`)
+              );
+            fetchData();
+          }
+          version = response.data.version;
+        } catch (error) {
+          await new Promise((resolve) => setTimeout(resolve, 10000));
+        }
+      }
+    };
+    pollAlerts();
+    return () => {
+      active = false;
+    };
+  }, []);
+
   const fetchData = async () => {
     try {
       const [ingredientsRes, productsRes, cogsRes, tablesRes] = await Promise.all([
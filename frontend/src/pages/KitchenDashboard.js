@@ -20,8 +20,8 @@ const KitchenDashboard = () => {
 
   const fetchOrders = async () => {
     try {
-      const response = await api.get('/orders');
-      setOrders(response.data.filter((o) => o.status !== 'completed' && o.status !== 'cancelled'));
+      const response = await api.get('/kitchen/queue');
+      setOrders(response.data);
       setLoading(false);
     } catch (error) {
       toast.error('Failed to load orders');
@@ -127,7 +127,7 @@ const KitchenDashboard = () => {
                     </div>
                   )}
 
-                  {order.order_type === 'to-go' && order.customer_location && (
+                  {order.order_type === 'to-go' && order.has_location && (
                     <div className="flex items-center gap-2 text-sm text-[#F5EEDC]">
                       <MapPin className="w-4 h-4" />
                       <span>Location Shared</span>
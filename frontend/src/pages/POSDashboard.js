@@ -1,7 +1,7 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { toast } from 'sonner';
-import api from '../utils/api';
+import api, { newIdempotencyKey } from '../utils/api';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Badge } from '../components/ui/badge';
@@ -13,6 +13,7 @@ const POSDashboard = () => {
   const [orders, setOrders] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedOrder, setSelectedOrder] = useState(null);
+  const paymentKeyRef = useRef({ orderId: null, key: null });
   const [showPayment, setShowPayment] = useState(false);
   const [paymentMethod, setPaymentMethod] = useState('cash');
   const [loading, setLoading] = useState(true);
@@ -54,7 +55,15 @@ const POSDashboard = () => {
     if (!selectedOrder) return;
 
     try {
-      await api.put(`/orders/${selectedOrder.id}/payment`, { payment_method: paymentMethod });
+      // Reuse the key for retries of the same order's payment
+      if (paymentKeyRef.current.orderId !== selectedOrder.id) {
+        paymentKeyRef.current = { orderId: selectedOrder.id, key: newIdempotencyKey() };
+      }
+      await api.put(
+        `/orders/${selectedOrder.id}/payment`,
+        { payment_method: paymentMethod },
+        { headers: { 'Idempotency-Key': paymentKeyRef.current.key } }
+      );
       toast.success('Payment processed successfully');
       setShowPayment(false);
       setSelectedOrder(null);
@@ -1,7 +1,7 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { toast } from 'sonner';
-import api from '../utils/api';
+import api, { fetchDashboard } from '../utils/api';
 import { Button } from '../components/ui/button';
 import { Badge } from '../components/ui/badge';
 import { Card } from '../components/ui/card';
@@ -13,6 +13,7 @@ const WaiterDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState('orders');
   const { user, logout } = useAuth();
+  const dashboardEtags = useRef({});
 
   useEffect(() => {
     fetchData();
@@ -22,12 +23,9 @@ const WaiterDashboard = () => {
 
   const fetchData = async () => {
     try {
-      const [ordersRes, tablesRes] = await Promise.all([
-        api.get('/orders'),
-        api.get('/tables')
-      ]);
-      setOrders(ordersRes.data.filter((o) => o.status !== 'cancelled'));
-      setTables(tablesRes.data);
+      const changed = await fetchDashboard('waiter', dashboardEtags.current);
+      if (changed.orders) setOrders(changed.orders.filter((o) => o.status !== 'cancelled'));
+      if (changed.tables) setTables(changed.tables);
       setLoading(false);
     } catch (error) {
       toast.error('Failed to load data');
@@ -217,7 +215,7 @@ const WaiterDashboard = () => {
                           </div>
                         )}
 
-                        {order.order_type === 'to-go' && order.customer_location && (
+                        {order.order_type === 'to-go' && order.has_location && (
                           <div className="flex items-center gap-2 text-sm text-[#F5EEDC]">
                             <MapPin className="w-4 h-4" />
                             <span>Location Shared</span>
@@ -262,6 +260,17 @@ const WaiterDashboard = () => {
                       <div className="text-sm text-[#F5EEDC]/60">
                         Capacity: {table.capacity} seats
                       </div>
+                      {table.open_order_ids?.length > 0 && (
+                        <div className="text-sm text-[#D9A54C]" data-testid={`table-bill-${table.id}`}>
+                          {table.open_order_ids.length} open · Bill {table.running_bill.toFixed(2)}
+                        </div>
+                      )}
+                      {table.seated_since && (
+                        <div className="text-xs text-[#F5EEDC]/60 flex items-center justify-center gap-1">
+                          <Clock className="w-3 h-3" />
+                          Seated {new Date(table.seated_since).toLocaleTimeString()}
+                        </div>
+                      )}
                       
                       <div className="flex flex-col gap-2 pt-2">
                         {table.status === 'available' && (
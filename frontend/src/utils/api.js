@@ -25,4 +25,30 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// One key per logical write, reused across retries so the server can
+// replay the first response instead of repeating the write
+export const newIdempotencyKey = () => {
+  if (window.crypto?.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+};
+
+// Load a composite dashboard in one request. `etags` maps section -> ETag and
+// is updated in place; only sections that changed since the last call are returned
+export const fetchDashboard = async (name, etags) => {
+  const known = Object.entries(etags)
+    .map(([section, etag]) => `${section}:${etag}`)
+    .join(',');
+  const response = await api.get(`/dashboards/${name}`, { params: known ? { known } : {} });
+  const changed = {};
+  Object.entries(response.data.sections).forEach(([section, body]) => {
+    etags[section] = body.etag;
+    if (!body.unchanged) {
+      changed[section] = body.data;
+    }
+  });
+  return changed;
+};
+
 export default api;
\ No newline at end of file
@@ -0,0 +1,299 @@
+"""
+Coffee Shop Management System - Catalog Management Tests
+Tests for batch updates, PATCH endpoints and bulk import/export used by the CMS
+"""
+import pytest
+import requests
+import os
+import json
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def storage_headers(admin_headers):
+    """Create a storage user through the admin API and log in"""
+    email = f"TEST_catalog_storage_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Catalog Storage {TIMESTAMP}",
+        "role": "storage"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Storage user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def test_products(admin_headers):
+    """Create three hidden test products"""
+    products = []
+    for i in range(3):
+        response = requests.post(f"{API_URL}/products", json={
+            "name": f"TEST Catalog {TIMESTAMP} #{i}",
+            "category": "beverage",
+            "price": 3.0 + i,
+            "available": False,
+            "sort_order": i
+        }, headers=admin_headers)
+        assert response.status_code == 200, f"Product creation failed: {response.text}"
+        products.append(response.json())
+    return products
+
+
+def fetch_product(product_id):
+    response = requests.get(f"{API_URL}/products/{product_id}")
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestBatchProductUpdate:
+    """Test POST /api/products/batch"""
+
+    def test_reorder_in_one_request(self, admin_headers, test_products):
+        """Sort orders for several products are applied together"""
+        updates = [{"id": p["id"], "sort_order": 100 - i} for i, p in enumerate(test_products)]
+        response = requests.post(f"{API_URL}/products/batch", json=updates, headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["applied"] == len(test_products)
+        assert [r["result"] for r in data["results"]] == ["applied"] * len(test_products)
+
+        for update in updates:
+            assert fetch_product(update["id"])["sort_order"] == update["sort_order"]
+        print(f"✅ Reordered {len(updates)} products in one request")
+
+    def test_partial_patch_leaves_other_fields(self, admin_headers, test_products):
+        """Only the fields sent are changed"""
+        product = test_products[0]
+        response = requests.post(f"{API_URL}/products/batch",
+                                 json=[{"id": product["id"], "price": 9.5}], headers=admin_headers)
+        assert response.status_code == 200
+
+        updated = fetch_product(product["id"])
+        assert updated["price"] == 9.5
+        assert updated["name"] == product["name"]
+        assert updated["available"] is False
+
+    def test_results_per_entry(self, admin_headers, test_products):
+        """Stale versions and unknown ids are reported without blocking the rest"""
+        fresh, stale = fetch_product(test_products[0]["id"]), fetch_product(test_products[1]["id"])
+        response = requests.post(f"{API_URL}/products/batch", json=[
+            {"id": fresh["id"], "sort_order": 7, "version": fresh["version"]},
+            {"id": stale["id"], "sort_order": 8, "version": stale["version"] - 1},
+            {"id": f"missing-{TIMESTAMP}", "sort_order": 9}
+        ], headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["applied"] == 1
+        assert [r["result"] for r in data["results"]] == ["applied", "conflict", "not_found"]
+        assert fetch_product(fresh["id"])["sort_order"] == 7
+        assert fetch_product(stale["id"])["sort_order"] == stale["sort_order"]
+        print("✅ Batch update reported per entry")
+
+    @pytest.mark.parametrize("field", ["price", "name", "available"])
+    def test_null_on_required_field_rejected(self, admin_headers, test_products, field):
+        """An explicit null is refused and later listings still validate"""
+        product = test_products[0]
+        response = requests.post(f"{API_URL}/products/batch",
+                                 json=[{"id": product["id"], field: None}], headers=admin_headers)
+        assert response.status_code == 422
+        assert fetch_product(product["id"])[field] is not None
+        assert requests.get(f"{API_URL}/products").status_code == 200
+
+    def test_batch_requires_staff(self):
+        """Anonymous users cannot batch update products"""
+        response = requests.post(f"{API_URL}/products/batch", json=[])
+        assert response.status_code in [401, 403]
+
+
+class TestPatchUpdates:
+    """Test PATCH endpoints with optimistic concurrency"""
+
+    def test_patch_changes_only_sent_fields(self, admin_headers, test_products):
+        """A PATCH toggles one field and bumps the version"""
+        product = fetch_product(test_products[1]["id"])
+        response = requests.patch(f"{API_URL}/products/{product['id']}",
+                                  json={"featured": True}, headers=admin_headers)
+        assert response.status_code == 200
+        patched = response.json()
+        assert patched["featured"] is True
+        assert patched["price"] == product["price"]
+        assert patched["version"] == product["version"] + 1
+
+    def test_stale_version_conflicts(self, admin_headers, test_products):
+        """Two editors starting from the same version cannot both win"""
+        product = fetch_product(test_products[2]["id"])
+        url = f"{API_URL}/products/{product['id']}"
+        first = requests.patch(url, json={"price": 4.25, "version": product["version"]}, headers=admin_headers)
+        second = requests.patch(url, json={"price": 4.75, "version": product["version"]}, headers=admin_headers)
+        assert first.status_code == 200
+        assert second.status_code == 409
+        assert fetch_product(product["id"])["price"] == 4.25
+        print("✅ Stale PATCH rejected with 409")
+
+    def test_patch_unknown_product(self, admin_headers):
+        """Unknown products return 404"""
+        response = requests.patch(f"{API_URL}/products/missing-{TIMESTAMP}",
+                                  json={"available": True}, headers=admin_headers)
+        assert response.status_code == 404
+
+    def test_patch_null_on_required_field_rejected(self, admin_headers, test_products):
+        """null is refused for required fields but clears optional ones"""
+        product = test_products[1]
+        url = f"{API_URL}/products/{product['id']}"
+        response = requests.patch(url, json={"name": None}, headers=admin_headers)
+        assert response.status_code == 422
+        assert fetch_product(product["id"])["name"] == product["name"]
+        assert requests.get(f"{API_URL}/products").status_code == 200
+
+        response = requests.patch(url, json={"image_url": None}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["image_url"] is None
+
+    def test_patch_category(self, admin_headers):
+        """Categories accept partial updates"""
+        response = requests.post(f"{API_URL}/categories", json={
+            "name": f"TEST Category {TIMESTAMP}",
+            "slug": f"test-category-{TIMESTAMP}",
+            "active": False
+        }, headers=admin_headers)
+        assert response.status_code == 200
+        category = response.json()
+
+        response = requests.patch(f"{API_URL}/categories/{category['id']}",
+                                  json={"sort_order": 99, "version": 0}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["sort_order"] == 99
+        assert response.json()["name"] == category["name"]
+
+
+class TestCatalogImportExport:
+    """Test /api/catalog/{entity}/import and /export"""
+
+    def test_import_ingredients_then_products_by_name(self, admin_headers, storage_headers):
+        """Recipes in a CSV reference ingredients by name"""
+        ingredients_csv = (
+            "name,unit,current_stock,min_stock,cost_per_unit\n"
+            f"TEST Import Beans {TIMESTAMP},g,5000,500,0.04\n"
+            f"TEST Import Milk {TIMESTAMP},ml,8000,1000,0.002\n"
+        )
+        response = requests.post(f"{API_URL}/catalog/ingredients/import",
+                                 files={"file": ("ingredients.csv", ingredients_csv, "text/csv")},
+                                 headers=storage_headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["inserted"] == 2
+
+        products_csv = (
+            "name,category,price,available,recipes\n"
+            f"TEST Import Latte {TIMESTAMP},beverage,4.5,false,"
+            f"\"TEST Import Beans {TIMESTAMP}:18; TEST Import Milk {TIMESTAMP}:200\"\n"
+            f"TEST Import Bad {TIMESTAMP},beverage,not-a-price,false,\n"
+            f"TEST Import Ghost {TIMESTAMP},beverage,3,false,Unknown Thing:1\n"
+        )
+        response = requests.post(f"{API_URL}/catalog/products/import",
+                                 files={"file": ("menu.csv", products_csv, "text/csv")},
+                                 headers=admin_headers)
+        assert response.status_code == 200, response.text
+        summary = response.json()
+        assert summary["inserted"] == 1
+        assert summary["failed"] == 2
+        assert {e["row"] for e in summary["errors"]} == {2, 3}
+        print(f"✅ Imported menu with {summary['failed']} rejected rows")
+
+    def test_reimport_updates_instead_of_duplicating(self, storage_headers):
+        """Importing the same name twice updates the existing row"""
+        record = {"name": f"TEST Import Cups {TIMESTAMP}", "unit": "pcs",
+                  "current_stock": 100, "min_stock": 10, "cost_per_unit": 0.1}
+        for stock in (100, 150):
+            body = json.dumps(dict(record, current_stock=stock)) + "\n"
+            response = requests.post(f"{API_URL}/catalog/ingredients/import",
+                                     files={"file": ("cups.jsonl", body, "application/x-ndjson")},
+                                     headers=storage_headers)
+            assert response.status_code == 200
+
+        assert response.json() == {"inserted": 0, "updated": 1, "failed": 0, "errors": []}
+        ingredients = requests.get(f"{API_URL}/ingredients", headers=storage_headers)
+        assert ingredients.status_code == 200
+        cups = [i for i in ingredients.json() if i["name"] == record["name"]]
+        assert len(cups) == 1
+        assert cups[0]["current_stock"] == 150
+
+    @pytest.mark.parametrize("entity", ["ingredients", "cogs"])
+    def test_stock_entities_are_storage_only(self, admin_headers, entity):
+        """Import follows the create endpoints: admins cannot import ingredients or COGS"""
+        response = requests.post(f"{API_URL}/catalog/{entity}/import",
+                                 files={"file": ("rows.jsonl", "", "application/x-ndjson")},
+                                 headers=admin_headers)
+        assert response.status_code == 403
+
+    def test_export_products_jsonl(self, admin_headers, test_products):
+        """Export streams one JSON document per line"""
+        response = requests.get(f"{API_URL}/catalog/products/export", headers=admin_headers)
+        assert response.status_code == 200
+        names = {json.loads(line)["name"] for line in response.text.splitlines() if line}
+        assert test_products[0]["name"] in names
+
+    def test_export_csv_header(self, admin_headers):
+        """CSV exports start with the model's field names"""
+        response = requests.get(f"{API_URL}/catalog/categories/export",
+                                params={"format": "csv"}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.text.splitlines()[0].startswith("id,name,slug")
+
+
+class TestProductSearch:
+    """Test GET /api/products/search"""
+
+    def test_typo_and_prefix_match(self, admin_headers):
+        """Misspellings and prefixes still find the product, name matches first"""
+        response = requests.post(f"{API_URL}/products", json={
+            "name": f"Cappuccino Search{TIMESTAMP}",
+            "description": "Espresso with steamed milk foam",
+            "category": "beverage",
+            "price": 4.0
+        }, headers=admin_headers)
+        assert response.status_code == 200
+        product = response.json()
+
+        for query in ("capucino", "cappu", f"search{TIMESTAMP}"):
+            response = requests.get(f"{API_URL}/products/search", params={"q": query})
+            assert response.status_code == 200
+            ids = [p["id"] for p in response.json()]
+            assert product["id"] in ids, f"'{query}' did not find the product"
+        print("✅ Fuzzy search matched typo and prefix queries")
+
+    def test_results_are_ranked(self):
+        """Scores are returned in descending order"""
+        response = requests.get(f"{API_URL}/products/search", params={"q": "coffee"})
+        assert response.status_code == 200
+        scores = [p["score"] for p in response.json()]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_unavailable_products_hidden(self, test_products):
+        """Hidden products are excluded unless asked for"""
+        name = test_products[1]["name"]
+        ids = [p["id"] for p in requests.get(f"{API_URL}/products/search", params={"q": name}).json()]
+        assert test_products[1]["id"] not in ids
+        ids = [p["id"] for p in requests.get(f"{API_URL}/products/search",
+                                             params={"q": name, "include_unavailable": "true"}).json()]
+        assert test_products[1]["id"] in ids
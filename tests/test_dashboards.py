@@ -0,0 +1,84 @@
+"""
+Coffee Shop Management System - Composite Dashboard Tests
+Tests for single-request dashboard payloads with per-section ETags
+"""
+import pytest
+import requests
+import os
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def waiter_headers(admin_headers):
+    """Create a waiter user through the admin API and log in"""
+    email = f"TEST_dashboard_waiter_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Dashboard Waiter {TIMESTAMP}",
+        "role": "waiter"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Waiter user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestAdminDashboard:
+    """Test GET /api/dashboards/admin"""
+
+    def test_all_sections_in_one_response(self, admin_headers):
+        """Users, stats, programs, memberships and orders come back together"""
+        response = requests.get(f"{API_URL}/dashboards/admin", headers=admin_headers)
+        assert response.status_code == 200
+        sections = response.json()["sections"]
+        assert set(sections) == {"users", "stats", "programs", "memberships", "orders"}
+        for section in sections.values():
+            assert section["etag"]
+            assert "data" in section
+        assert "users_count" in sections["stats"]["data"]
+
+    def test_known_etags_skip_unchanged_sections(self, admin_headers):
+        """Sections whose ETag the client holds are returned without data"""
+        first = requests.get(f"{API_URL}/dashboards/admin", headers=admin_headers).json()["sections"]
+        known = f"programs:{first['programs']['etag']},users:stale"
+        second = requests.get(f"{API_URL}/dashboards/admin",
+                              params={"known": known}, headers=admin_headers).json()["sections"]
+        assert second["programs"] == {"etag": first["programs"]["etag"], "unchanged": True}
+        assert "data" in second["users"]
+        print("✅ Unchanged dashboard section skipped")
+
+    def test_waiter_cannot_load_admin_dashboard(self, waiter_headers):
+        """Only admins get the admin dashboard"""
+        response = requests.get(f"{API_URL}/dashboards/admin", headers=waiter_headers)
+        assert response.status_code == 403
+
+
+class TestWaiterDashboard:
+    """Test GET /api/dashboards/waiter"""
+
+    def test_orders_and_tables(self, waiter_headers):
+        """Waiters get orders and tables in one poll"""
+        response = requests.get(f"{API_URL}/dashboards/waiter", headers=waiter_headers)
+        assert response.status_code == 200
+        sections = response.json()["sections"]
+        assert set(sections) == {"orders", "tables"}
+        assert isinstance(sections["tables"]["data"], list)
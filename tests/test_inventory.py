@@ -0,0 +1,189 @@
+"""
+Coffee Shop Management System - Inventory Ledger Tests
+Tests for stock movements, snapshots and reconciliation
+"""
+import pytest
+import requests
+import os
+from datetime import datetime, timezone
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def storage_headers(admin_headers):
+    """Create a storage user through the admin API and log in"""
+    email = f"TEST_storage_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Storage {TIMESTAMP}",
+        "role": "storage"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Storage user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def ingredient(storage_headers):
+    """Create a test ingredient with opening stock"""
+    response = requests.post(f"{API_URL}/ingredients", json={
+        "name": f"TEST Beans {TIMESTAMP}",
+        "unit": "g",
+        "current_stock": 1000,
+        "min_stock": 200,
+        "cost_per_unit": 0.5
+    }, headers=storage_headers)
+    assert response.status_code == 200, f"Ingredient creation failed: {response.text}"
+    return response.json()
+
+
+class TestStockMovements:
+    """Test /api/ingredients/{id}/movements"""
+
+    def test_opening_stock_is_recorded(self, storage_headers, ingredient):
+        """Creating an ingredient writes an opening adjustment"""
+        response = requests.get(f"{API_URL}/ingredients/{ingredient['id']}/movements", headers=storage_headers)
+        assert response.status_code == 200
+        movements = response.json()
+        assert movements[-1]["kind"] == "adjustment"
+        assert movements[-1]["delta"] == 1000
+
+    def test_restock_and_waste_apply_to_stock(self, storage_headers, ingredient):
+        """Restock adds and waste subtracts regardless of sign"""
+        url = f"{API_URL}/ingredients/{ingredient['id']}/movements"
+        response = requests.post(url, json={"kind": "restock", "quantity": 500}, headers=storage_headers)
+        assert response.status_code == 200
+        after_restock = response.json()["current_stock"]
+
+        response = requests.post(url, json={"kind": "waste", "quantity": 50, "note": "spilled"},
+                                 headers=storage_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["movement"]["delta"] == -50
+        assert data["current_stock"] == after_restock - 50
+        print(f"✅ Stock now {data['current_stock']} {ingredient['unit']}")
+
+    def test_patch_null_stock_rejected(self, storage_headers, ingredient):
+        """PATCH refuses null current_stock and leaves the stock alone"""
+        before = requests.get(f"{API_URL}/ingredients", headers=storage_headers).json()
+        stock = next(i for i in before if i["id"] == ingredient["id"])["current_stock"]
+        response = requests.patch(f"{API_URL}/ingredients/{ingredient['id']}",
+                                  json={"current_stock": None}, headers=storage_headers)
+        assert response.status_code == 422
+
+        after = requests.get(f"{API_URL}/ingredients", headers=storage_headers)
+        assert after.status_code == 200
+        assert next(i for i in after.json() if i["id"] == ingredient["id"])["current_stock"] == stock
+
+    def test_movement_for_unknown_ingredient(self, storage_headers):
+        """Unknown ingredients return 404"""
+        response = requests.post(f"{API_URL}/ingredients/missing-{TIMESTAMP}/movements",
+                                 json={"kind": "restock", "quantity": 1}, headers=storage_headers)
+        assert response.status_code == 404
+
+
+class TestStockSnapshots:
+    """Test point-in-time stock and reconciliation"""
+
+    def test_stock_at_now_matches_current(self, storage_headers, ingredient):
+        """The ledger replayed to now gives the current stock"""
+        requests.post(f"{API_URL}/inventory/snapshots", headers=storage_headers)
+        requests.post(f"{API_URL}/ingredients/{ingredient['id']}/movements",
+                      json={"kind": "restock", "quantity": 10}, headers=storage_headers)
+
+        response = requests.get(f"{API_URL}/inventory/stock-at",
+                                params={"at": datetime.now(timezone.utc).isoformat()}, headers=storage_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["snapshot_taken_at"] is not None
+
+        ingredients = requests.get(f"{API_URL}/ingredients", headers=storage_headers).json()
+        current = next(i for i in ingredients if i["id"] == ingredient["id"])
+        assert data["levels"][ingredient["id"]] == pytest.approx(current["current_stock"])
+
+    def test_reconcile_reports_no_drift_for_ledgered_ingredient(self, storage_headers, ingredient):
+        """An ingredient changed only through the API reconciles cleanly"""
+        response = requests.get(f"{API_URL}/inventory/reconcile", headers=storage_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["checked"] >= 1
+        assert ingredient["id"] not in [m["ingredient_id"] for m in data["mismatches"]]
+
+    def test_snapshot_is_folded_from_ledger(self, storage_headers, ingredient):
+        """A snapshot replays the ledger, so reconcile stays clean across snapshots"""
+        before = datetime.now(timezone.utc)
+        response = requests.post(f"{API_URL}/inventory/snapshots", headers=storage_headers)
+        assert response.status_code == 200
+        assert datetime.fromisoformat(response.json()["taken_at"]) <= before
+
+        requests.post(f"{API_URL}/ingredients/{ingredient['id']}/movements",
+                      json={"kind": "waste", "quantity": 1}, headers=storage_headers)
+        response = requests.get(f"{API_URL}/inventory/reconcile", headers=storage_headers)
+        assert ingredient["id"] not in [m["ingredient_id"] for m in response.json()["mismatches"]]
+
+
+class TestLowStockAlerts:
+    """Test GET /api/inventory/alerts"""
+
+    def test_waste_below_threshold_raises_one_alert(self, storage_headers):
+        """Dropping below min_stock raises a single alert until stock recovers"""
+        response = requests.post(f"{API_URL}/ingredients", json={
+            "name": f"TEST Milk {TIMESTAMP}",
+            "unit": "ml",
+            "current_stock": 300,
+            "min_stock": 100,
+            "cost_per_unit": 0.01
+        }, headers=storage_headers)
+        assert response.status_code == 200
+        milk = response.json()
+        url = f"{API_URL}/ingredients/{milk['id']}/movements"
+        version = requests.get(f"{API_URL}/inventory/alerts", headers=storage_headers).json()["version"]
+
+        requests.post(url, json={"kind": "waste", "quantity": 250}, headers=storage_headers)
+        requests.post(url, json={"kind": "waste", "quantity": 10}, headers=storage_headers)
+        data = requests.get(f"{API_URL}/inventory/alerts",
+                            params={"since_version": version}, headers=storage_headers).json()
+        raised = [e for e in data["events"] if e["ingredient_id"] == milk["id"]]
+        assert [e["type"] for e in raised] == ["low_stock"]
+        assert milk["id"] in [a["ingredient_id"] for a in data["active"]]
+
+        # Back to exactly min_stock is still inside the hysteresis band
+        requests.post(url, json={"kind": "restock", "quantity": 60}, headers=storage_headers)
+        data = requests.get(f"{API_URL}/inventory/alerts", headers=storage_headers).json()
+        assert milk["id"] in [a["ingredient_id"] for a in data["active"]]
+
+        requests.post(url, json={"kind": "restock", "quantity": 500}, headers=storage_headers)
+        data = requests.get(f"{API_URL}/inventory/alerts", headers=storage_headers).json()
+        assert milk["id"] not in [a["ingredient_id"] for a in data["active"]]
+        print("✅ Low-stock alert raised once and cleared after restock")
+
+    def test_alerts_require_storage_or_admin(self):
+        """Customers cannot subscribe to stock alerts"""
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": f"TEST_alerts_customer_{TIMESTAMP}@test.com",
+            "password": TEST_PASSWORD,
+            "name": "TEST Alerts Customer"
+        })
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = requests.get(f"{API_URL}/inventory/alerts", headers=headers)
+        assert response.status_code == 403
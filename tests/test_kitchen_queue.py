@@ -0,0 +1,349 @@
+"""
+Coffee Shop Management System - Kitchen Queue Tests
+Tests for the kitchen display endpoints and order status transitions
+"""
+import pytest
+import requests
+import os
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def kitchen_headers(admin_headers):
+    """Create a kitchen user through the admin API and log in"""
+    email = f"TEST_kitchen_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Kitchen {TIMESTAMP}",
+        "role": "kitchen"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Kitchen user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def cashier_headers(admin_headers):
+    """Create a cashier user through the admin API and log in"""
+    email = f"TEST_kitchen_cashier_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Kitchen Cashier {TIMESTAMP}",
+        "role": "cashier"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Cashier user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def product():
+    """Get an available product for test orders"""
+    response = requests.get(f"{API_URL}/products")
+    assert response.status_code == 200
+    products = response.json()
+    assert products, "No products available"
+    return products[0]
+
+
+def place_order(product, quantity=1, table_number=None):
+    """Create a public dine-in order for the given product"""
+    response = requests.post(f"{API_URL}/orders", json={
+        "customer_name": f"TEST Kitchen Queue {TIMESTAMP}",
+        "order_type": "dine-in",
+        "table_number": table_number,
+        "items": [{
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "quantity": quantity,
+            "price": product["price"]
+        }],
+        "total_amount": product["price"] * quantity
+    })
+    assert response.status_code == 200, f"Order creation failed: {response.text}"
+    return response.json()
+
+
+class TestKitchenQueue:
+    """Test GET /api/kitchen/queue"""
+
+    def test_queue_contains_only_open_orders_oldest_first(self, kitchen_headers, product):
+        """Queue is FIFO and never includes completed or cancelled orders"""
+        first = place_order(product)
+        second = place_order(product)
+
+        response = requests.get(f"{API_URL}/kitchen/queue", headers=kitchen_headers)
+        assert response.status_code == 200
+
+        queue = response.json()
+        assert all(o["status"] in ("pending", "preparing", "ready") for o in queue)
+        ids = [o["id"] for o in queue]
+        assert ids.index(first["id"]) < ids.index(second["id"])
+        assert "customer_location" not in queue[0]
+        print(f"✅ Kitchen queue has {len(queue)} open tickets in FIFO order")
+
+    def test_customer_cannot_access_queue(self):
+        """Customers are rejected from the kitchen queue"""
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": f"TEST_queue_customer_{TIMESTAMP}@test.com",
+            "password": TEST_PASSWORD,
+            "name": "TEST Queue Customer"
+        })
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = requests.get(f"{API_URL}/kitchen/queue", headers=headers)
+        assert response.status_code == 403
+
+
+class TestKitchenBatch:
+    """Test GET /api/kitchen/batch"""
+
+    def test_batch_groups_items_across_tickets(self, kitchen_headers, product):
+        """Quantities of one product are summed across open tickets"""
+        before = requests.get(f"{API_URL}/kitchen/batch", headers=kitchen_headers).json()
+        first = place_order(product, quantity=2)
+        second = place_order(product, quantity=3)
+
+        response = requests.get(f"{API_URL}/kitchen/batch", headers=kitchen_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"] > before["version"]
+
+        entry = next(p for p in data["products"] if p["product_id"] == product["id"])
+        tickets = {t["order_id"]: t["quantity"] for t in entry["tickets"]}
+        assert tickets[first["id"]] == 2
+        assert tickets[second["id"]] == 3
+        assert entry["total_quantity"] == sum(tickets.values())
+        print(f"✅ {entry['product_name']} x{entry['total_quantity']} across {len(tickets)} tickets")
+
+    def test_ready_ticket_leaves_batch(self, kitchen_headers, product):
+        """A ticket marked ready is no longer counted"""
+        order = place_order(product)
+        for status in ("preparing", "ready"):
+            response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                    json={"status": status}, headers=kitchen_headers)
+            assert response.status_code == 200
+
+        data = requests.get(f"{API_URL}/kitchen/batch", headers=kitchen_headers).json()
+        ticket_ids = {t["order_id"] for p in data["products"] for t in p["tickets"]}
+        assert order["id"] not in ticket_ids
+
+    def test_unchanged_version_returns_short_response(self, kitchen_headers):
+        """Polling with the current version skips the payload"""
+        data = requests.get(f"{API_URL}/kitchen/batch", headers=kitchen_headers).json()
+        response = requests.get(f"{API_URL}/kitchen/batch",
+                                params={"since_version": data["version"]}, headers=kitchen_headers)
+        assert response.status_code == 200
+        assert response.json() == {"version": data["version"], "unchanged": True}
+
+
+class TestOrderStatusTransitions:
+    """Test status transition rules and POST /api/orders/bulk-status"""
+
+    def test_illegal_transition_rejected(self, kitchen_headers, product):
+        """A pending order cannot jump straight to completed"""
+        order = place_order(product)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                json={"status": "completed"}, headers=kitchen_headers)
+        assert response.status_code == 409
+
+    def test_repeated_transition_rejected(self, kitchen_headers, product):
+        """The second of two identical transitions is rejected"""
+        order = place_order(product)
+        url = f"{API_URL}/orders/{order['id']}/status"
+        assert requests.put(url, json={"status": "preparing"}, headers=kitchen_headers).status_code == 200
+        assert requests.put(url, json={"status": "preparing"}, headers=kitchen_headers).status_code == 409
+
+    def test_bulk_complete_ready_orders_for_table(self, kitchen_headers, product):
+        """All ready orders for one table are completed in one request"""
+        table_number = int(TIMESTAMP[-4:]) + 10000
+        orders = [place_order(product, table_number=table_number) for _ in range(3)]
+        for order in orders[:2]:
+            for status in ("preparing", "ready"):
+                requests.put(f"{API_URL}/orders/{order['id']}/status",
+                             json={"status": status}, headers=kitchen_headers)
+
+        response = requests.post(f"{API_URL}/orders/bulk-status", json={
+            "status": "completed",
+            "table_number": table_number,
+            "from_status": "ready"
+        }, headers=kitchen_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["updated"] == 2
+        assert {r["order_id"] for r in data["results"]} == {o["id"] for o in orders[:2]}
+        print(f"✅ Bulk completed {data['updated']} orders for table {table_number}")
+
+    def test_bulk_reports_per_order_results(self, kitchen_headers, product):
+        """Illegal and unknown orders are reported without blocking the rest"""
+        legal = place_order(product)
+        illegal = place_order(product)
+        requests.put(f"{API_URL}/orders/{illegal['id']}/status",
+                     json={"status": "cancelled"}, headers=kitchen_headers)
+
+        response = requests.post(f"{API_URL}/orders/bulk-status", json={
+            "status": "preparing",
+            "order_ids": [legal["id"], illegal["id"], f"missing-{TIMESTAMP}"]
+        }, headers=kitchen_headers)
+        assert response.status_code == 200
+        results = {r["order_id"]: r["result"] for r in response.json()["results"]}
+        assert results[legal["id"]] == "updated"
+        assert results[illegal["id"]] == "illegal_transition"
+        assert results[f"missing-{TIMESTAMP}"] == "not_found"
+
+    def test_bulk_requires_selector(self, kitchen_headers):
+        """A bulk request without order_ids or table_number is rejected"""
+        response = requests.post(f"{API_URL}/orders/bulk-status",
+                                 json={"status": "completed"}, headers=kitchen_headers)
+        assert response.status_code == 400
+
+
+class TestStageTimings:
+    """Test order status_history and GET /api/kitchen/stats"""
+
+    def test_status_history_records_each_transition(self, kitchen_headers, product):
+        """Every accepted transition is appended to the order's history"""
+        order = place_order(product)
+        assert [h["status"] for h in order["status_history"]] == ["pending"]
+        for status in ("preparing", "ready"):
+            response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                    json={"status": status}, headers=kitchen_headers)
+            assert response.status_code == 200
+
+        response = requests.get(f"{API_URL}/orders/{order['id']}")
+        assert response.status_code == 200
+        history = response.json()["status_history"]
+        assert [h["status"] for h in history] == ["pending", "preparing", "ready"]
+
+    @pytest.mark.parametrize("served", [True, False])
+    def test_payment_completes_history_once(self, kitchen_headers, cashier_headers, product, served):
+        """Paying adds "completed" only when the order was not already completed"""
+        order = place_order(product)
+        statuses = ("preparing", "ready", "completed") if served else ("preparing", "ready")
+        for status in statuses:
+            requests.put(f"{API_URL}/orders/{order['id']}/status",
+                         json={"status": status}, headers=kitchen_headers)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/payment",
+                                json={"payment_method": "cash"}, headers=cashier_headers)
+        assert response.status_code == 200
+
+        history = requests.get(f"{API_URL}/orders/{order['id']}").json()["status_history"]
+        assert [h["status"] for h in history] == ["pending", "preparing", "ready", "completed"]
+
+    def test_stats_report_stage_percentiles(self, kitchen_headers, product):
+        """Prep time and placed-to-ready are counted once an order is ready"""
+        order = place_order(product)
+        for status in ("preparing", "ready"):
+            requests.put(f"{API_URL}/orders/{order['id']}/status",
+                         json={"status": status}, headers=kitchen_headers)
+
+        response = requests.get(f"{API_URL}/kitchen/stats", headers=kitchen_headers)
+        assert response.status_code == 200
+        stages = response.json()["stages"]
+        assert set(stages) >= {"pending", "preparing", "ready", "to_ready"}
+        for stage in ("pending", "preparing", "to_ready"):
+            assert stages[stage]["count"] >= 1
+            assert stages[stage]["p50_seconds"] <= stages[stage]["p95_seconds"]
+        print(f"✅ Prep p95: {stages['preparing']['p95_seconds']}s")
+
+    def test_stats_require_kitchen_role(self):
+        """Customers cannot read kitchen stats"""
+        email = f"TEST_stats_customer_{TIMESTAMP}@test.com"
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": email, "password": TEST_PASSWORD, "name": "TEST Stats Customer"
+        })
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        assert requests.get(f"{API_URL}/kitchen/stats", headers=headers).status_code == 403
+
+
+class TestOrderEta:
+    """Test the ETA returned by POST /api/orders and GET /api/orders/{id}"""
+
+    def test_new_order_has_eta(self, product):
+        """A new order reports time to ready and when to check back"""
+        order = place_order(product)
+        eta = order["eta"]
+        assert eta["seconds"] >= 0
+        assert eta["queue_ahead"] >= 0
+        assert eta["refresh_after_seconds"] >= 15
+        print(f"✅ ETA {eta['seconds']}s with {eta['queue_ahead']} tickets ahead")
+
+    def test_eta_follows_status(self, kitchen_headers, product):
+        """Ready orders report zero seconds and finished orders no ETA"""
+        order = place_order(product)
+        url = f"{API_URL}/orders/{order['id']}"
+        assert requests.get(url).json()["eta"]["seconds"] >= 0
+
+        for status in ("preparing", "ready"):
+            requests.put(f"{url}/status", json={"status": status}, headers=kitchen_headers)
+        assert requests.get(url).json()["eta"]["seconds"] == 0
+
+        requests.put(f"{url}/status", json={"status": "completed"}, headers=kitchen_headers)
+        assert requests.get(url).json()["eta"] is None
+
+    def test_eta_is_not_stored(self, kitchen_headers, product):
+        """Order listings read from the database carry no ETA"""
+        order = place_order(product)
+        response = requests.get(f"{API_URL}/orders", headers=kitchen_headers)
+        assert response.status_code == 200
+        listed = next((o for o in response.json() if o["id"] == order["id"]), None)
+        if listed is not None:
+            assert listed.get("eta") is None
+
+
+class TestOrderStatusPermissions:
+    """Test that only staff can change order status"""
+
+    @pytest.fixture(scope="class")
+    def customer_headers(self):
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": f"TEST_status_customer_{TIMESTAMP}@test.com",
+            "password": TEST_PASSWORD,
+            "name": "TEST Status Customer"
+        })
+        assert response.status_code == 200
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_customer_cannot_change_status(self, customer_headers, product):
+        """A customer gets 403 and the order is untouched"""
+        order = place_order(product)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                json={"status": "cancelled"}, headers=customer_headers)
+        assert response.status_code == 403
+        assert requests.get(f"{API_URL}/orders/{order['id']}").json()["status"] == "pending"
+
+    def test_customer_cannot_bulk_change_status(self, customer_headers, product):
+        """A customer cannot cancel every order at a table"""
+        table_number = int(TIMESTAMP[-4:]) + 30000
+        order = place_order(product, table_number=table_number)
+        response = requests.post(f"{API_URL}/orders/bulk-status", json={
+            "status": "cancelled",
+            "table_number": table_number
+        }, headers=customer_headers)
+        assert response.status_code == 403
+        assert requests.get(f"{API_URL}/orders/{order['id']}").json()["status"] == "pending"
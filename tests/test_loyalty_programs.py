@@ -597,5 +597,77 @@ class TestEdgeCases:
         print("✅ Non-existent membership cancellation correctly rejected")
 
 
+class TestCustomerSearch:
+    """Test GET /api/customers/search for POS membership checkout"""
+
+    def test_find_by_name_email_and_phone(self, admin_headers):
+        """A customer is found by a name word, email prefix or phone digits"""
+        phone = f"+62 812-{TIMESTAMP[-8:-4]}-{TIMESTAMP[-4:]}"
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": f"TEST_search_{TIMESTAMP}@test.com",
+            "password": "TestPass123!",
+            "name": f"Sari Search{TIMESTAMP}",
+            "phone": phone
+        })
+        assert response.status_code == 200
+        customer_id = response.json()["user"]["id"]
+
+        for query in (f"search{TIMESTAMP}", f"test_search_{TIMESTAMP}", f"62812{TIMESTAMP[-8:-4]}"):
+            response = requests.get(f"{API_URL}/customers/search", params={"q": query}, headers=admin_headers)
+            assert response.status_code == 200
+            assert customer_id in [c["id"] for c in response.json()], f"'{query}' did not find the customer"
+        print("✅ Customer found by name, email and phone")
+
+    def test_results_include_active_memberships(self, admin_headers, test_customer):
+        """Each result carries its active memberships"""
+        response = requests.get(f"{API_URL}/customers/search",
+                                params={"q": test_customer["email"]}, headers=admin_headers)
+        assert response.status_code == 200
+        match = next(c for c in response.json() if c["id"] == test_customer["id"])
+        assert isinstance(match["memberships"], list)
+        assert "password" not in match
+
+    def test_customer_cannot_search(self, test_customer):
+        """Customers cannot look up other customers"""
+        headers = {"Authorization": f"Bearer {test_customer['token']}"}
+        response = requests.get(f"{API_URL}/customers/search", params={"q": "test"}, headers=headers)
+        assert response.status_code == 403
+
+    def test_deleted_program_leaves_search_at_once(self, admin_headers):
+        """Deleting a program drops its memberships from cached search results"""
+        response = requests.post(f"{API_URL}/auth/register", json={
+            "email": f"TEST_search_cache_{TIMESTAMP}@test.com",
+            "password": "TestPass123!",
+            "name": f"Cache Search{TIMESTAMP}"
+        })
+        assert response.status_code == 200
+        customer_id = response.json()["user"]["id"]
+
+        response = requests.post(f"{API_URL}/admin/programs", json={
+            "name": f"TEST_Search_Cache_Plan_{TIMESTAMP}",
+            "description": "Deleted while cached",
+            "duration_type": "months",
+            "duration_value": 1,
+            "is_group": False,
+            "color": "#2ECC71",
+            "benefits": [{"benefit_type": "beverage_discount", "value": 5, "description": "5% off"}]
+        }, headers=admin_headers)
+        assert response.status_code == 200
+        program_id = response.json()["id"]
+        response = requests.post(f"{API_URL}/admin/memberships",
+                                 json={"program_id": program_id, "customer_ids": [customer_id]}, headers=admin_headers)
+        assert response.status_code == 200
+
+        def memberships():
+            response = requests.get(f"{API_URL}/customers/search",
+                                    params={"q": f"search{TIMESTAMP}"}, headers=admin_headers)
+            match = next(c for c in response.json() if c["id"] == customer_id)
+            return [m["program_id"] for m in match["memberships"]]
+
+        assert program_id in memberships()
+        assert requests.delete(f"{API_URL}/admin/programs/{program_id}", headers=admin_headers).status_code == 200
+        assert program_id not in memberships()
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,281 @@
+"""
+Coffee Shop Management System - Order Listing Tests
+Tests for role-scoped order views, customer location updates and the delivery queue
+"""
+import pytest
+import requests
+import os
+import time
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+# Must match the server's location buffer settings
+LOCATION_FLUSH_SECONDS = float(os.environ.get("LOCATION_FLUSH_SECONDS", 5))
+
+# Fields each role's order view may return
+KITCHEN_FIELDS = {"id", "order_number", "order_type", "table_number", "items", "status",
+                  "notes", "has_location", "created_at"}
+WAITER_FIELDS = KITCHEN_FIELDS | {"customer_name"}
+CASHIER_FIELDS = {"id", "order_number", "customer_name", "order_type", "table_number", "items",
+                  "total_amount", "status", "payment_status", "payment_method", "created_at"}
+CUSTOMER_FIELDS = {"id", "order_number", "order_type", "table_number", "items", "subtotal",
+                   "discount_info", "total_amount", "status", "payment_status", "created_at"}
+PRIVATE_FIELDS = {"customer_location", "customer_email", "customer_point"}
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+STAFF_HEADERS = {}
+
+
+def staff_headers(admin_headers, role):
+    """Create a staff user through the admin API and log in, once per role"""
+    if role in STAFF_HEADERS:
+        return STAFF_HEADERS[role]
+    email = f"TEST_orders_{role}_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Orders {role.title()} {TIMESTAMP}",
+        "role": role
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"{role} user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    STAFF_HEADERS[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return STAFF_HEADERS[role]
+
+
+@pytest.fixture(scope="module")
+def customer():
+    """Register a customer; returns (headers, user)"""
+    response = requests.post(f"{API_URL}/auth/register", json={
+        "email": f"TEST_orders_customer_{TIMESTAMP}@test.com",
+        "password": TEST_PASSWORD,
+        "name": f"TEST Orders Customer {TIMESTAMP}"
+    })
+    assert response.status_code == 200, f"Customer registration failed: {response.text}"
+    data = response.json()
+    return {"Authorization": f"Bearer {data['access_token']}"}, data["user"]
+
+
+@pytest.fixture(scope="module")
+def product():
+    """Get an available product for test orders"""
+    products = requests.get(f"{API_URL}/products").json()
+    assert products, "No products available"
+    return products[0]
+
+
+def place_order(product, order_type="to-go", **fields):
+    response = requests.post(f"{API_URL}/orders", json={
+        "customer_name": f"TEST Orders {TIMESTAMP}",
+        "order_type": order_type,
+        "items": [{
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "quantity": 1,
+            "price": product["price"]
+        }],
+        "total_amount": product["price"],
+        **fields
+    })
+    assert response.status_code == 200, f"Order creation failed: {response.text}"
+    return response.json()
+
+
+@pytest.fixture(scope="module")
+def located_order(product, customer):
+    """A customer's to-go order carrying an email and a location"""
+    _, user = customer
+    return place_order(
+        product,
+        customer_id=user["id"],
+        customer_email=user["email"],
+        customer_location={"lat": -6.2, "lng": 106.8}
+    )
+
+
+def listed(headers, order_id):
+    response = requests.get(f"{API_URL}/orders", headers=headers)
+    assert response.status_code == 200
+    order = next((o for o in response.json() if o["id"] == order_id), None)
+    assert order is not None, "Order missing from listing"
+    return order
+
+
+class TestOrderViews:
+    """Test GET /api/orders returns only the fields each role needs"""
+
+    def test_kitchen_view(self, admin_headers, located_order):
+        """Kitchen sees tickets, with has_location instead of the position"""
+        order = listed(staff_headers(admin_headers, "kitchen"), located_order["id"])
+        assert set(order) <= KITCHEN_FIELDS
+        assert order["has_location"] is True
+
+    def test_waiter_view(self, admin_headers, located_order):
+        """Waiters additionally see the customer name"""
+        order = listed(staff_headers(admin_headers, "waiter"), located_order["id"])
+        assert set(order) <= WAITER_FIELDS
+        assert order["customer_name"] == located_order["customer_name"]
+
+    def test_cashier_view(self, admin_headers, located_order):
+        """Cashiers see amounts and payment state but not contact details or discounts"""
+        order = listed(staff_headers(admin_headers, "cashier"), located_order["id"])
+        assert set(order) <= CASHIER_FIELDS
+        assert "discount_info" not in order
+        assert order["total_amount"] == located_order["total_amount"]
+
+    def test_customer_view(self, customer, located_order):
+        """Customers see only their own orders, without location or email"""
+        headers, user = customer
+        order = listed(headers, located_order["id"])
+        assert set(order) <= CUSTOMER_FIELDS
+        assert not PRIVATE_FIELDS & set(order)
+
+        response = requests.get(f"{API_URL}/orders", headers=headers)
+        assert [o["id"] for o in response.json()] == [located_order["id"]]
+
+    def test_admin_gets_full_order(self, admin_headers, located_order):
+        """Admins still get the full document"""
+        order = listed(admin_headers, located_order["id"])
+        assert order["customer_email"] == located_order["customer_email"]
+        assert order["customer_location"] == {"lat": -6.2, "lng": 106.8}
+        print("✅ Every role receives only its own order view")
+
+
+class TestLocationUpdates:
+    """Test PUT /api/orders/{id}/location"""
+
+    def test_update_is_accepted_then_flushed(self, admin_headers, product):
+        """A valid ping returns 202 and shows up on the order after the next flush"""
+        order = place_order(product)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/location", json={"lat": -6.21, "lng": 106.82})
+        assert response.status_code == 202
+
+        time.sleep(LOCATION_FLUSH_SECONDS + 2)
+        stored = requests.get(f"{API_URL}/orders/{order['id']}").json()
+        assert stored["customer_location"]["lat"] == -6.21
+        assert stored["customer_location"]["lng"] == 106.82
+        print("✅ Buffered location flushed to the order")
+
+    def test_rapid_updates_are_throttled(self, product):
+        """A second ping inside the minimum interval gets 429 with Retry-After"""
+        order = place_order(product)
+        url = f"{API_URL}/orders/{order['id']}/location"
+        assert requests.put(url, json={"lat": -6.2, "lng": 106.8}).status_code == 202
+        response = requests.put(url, json={"lat": -6.2001, "lng": 106.8001})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    @pytest.mark.parametrize("body", [
+        {"lat": 91, "lng": 106.8},
+        {"lat": -6.2, "lng": 181},
+        {"lng": 106.8},
+        {"latitude": -6.2, "longitude": 106.8}
+    ])
+    def test_invalid_location_rejected(self, product, body):
+        """Out-of-range or misnamed coordinates get 422"""
+        order = place_order(product)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/location", json=body)
+        assert response.status_code == 422
+
+
+@pytest.fixture(scope="module")
+def shop_location(admin_headers):
+    """The configured shop location, setting a test one if there is none"""
+    settings = requests.get(f"{API_URL}/settings").json()
+    if settings.get("shop_lat") is None or settings.get("shop_lng") is None:
+        response = requests.put(f"{API_URL}/settings", json={"shop_lat": -6.2, "shop_lng": 106.8},
+                                headers=admin_headers)
+        assert response.status_code == 200
+        settings = response.json()
+    return settings["shop_lat"], settings["shop_lng"]
+
+
+@pytest.fixture(scope="module")
+def delivery_orders(product, shop_location):
+    """Delivery orders north and east of the shop, in each accepted location shape"""
+    lat, lng = shop_location
+    return {
+        "north": place_order(product, "delivery", customer_location={"lat": lat + 0.01, "lng": lng}),
+        "east": place_order(product, "delivery", customer_location={"latitude": lat, "longitude": lng + 0.02}),
+        "geojson": place_order(product, "delivery", customer_location={
+            "type": "Point", "coordinates": [lng, lat - 0.03]
+        }),
+        "invalid": place_order(product, "delivery", customer_location={"lat": 200, "lng": lng})
+    }
+
+
+class TestDeliveryQueue:
+    """Test GET /api/delivery/queue"""
+
+    def test_requires_shop_location(self, admin_headers):
+        """Without a configured shop location the queue cannot be sorted"""
+        settings = requests.get(f"{API_URL}/settings").json()
+        if settings.get("shop_lat") is not None and settings.get("shop_lng") is not None:
+            pytest.skip("Shop location is already configured")
+        response = requests.get(f"{API_URL}/delivery/queue", headers=admin_headers)
+        assert response.status_code == 400
+
+    def test_queue_is_nearest_first(self, admin_headers, delivery_orders):
+        """Every location shape is normalized and orders come back by distance"""
+        response = requests.get(f"{API_URL}/delivery/queue", headers=admin_headers)
+        assert response.status_code == 200
+        queue = response.json()["orders"]
+        distances = [o["distance_m"] for o in queue]
+        assert distances == sorted(distances)
+
+        positions = {o["id"]: i for i, o in enumerate(queue)}
+        for name in ("north", "east", "geojson"):
+            assert delivery_orders[name]["id"] in positions, f"{name} order missing from queue"
+        assert delivery_orders["invalid"]["id"] not in positions
+        assert positions[delivery_orders["north"]["id"]] < positions[delivery_orders["east"]["id"]]
+        assert positions[delivery_orders["east"]["id"]] < positions[delivery_orders["geojson"]["id"]]
+
+        north = queue[positions[delivery_orders["north"]["id"]]]
+        assert north["customer_point"]["type"] == "Point"
+        assert 1000 < north["distance_m"] < 1250
+
+    def test_clustered_runs(self, admin_headers, delivery_orders):
+        """cluster=true groups orders into runs by compass direction"""
+        response = requests.get(f"{API_URL}/delivery/queue",
+                                params={"cluster": "true", "run_size": 1}, headers=admin_headers)
+        assert response.status_code == 200
+        runs = response.json()["runs"]
+        assert all(len(run["orders"]) == 1 for run in runs)
+
+        directions = {run["orders"][0]["id"]: run["direction"] for run in runs}
+        assert directions[delivery_orders["north"]["id"]] == "N"
+        assert directions[delivery_orders["east"]["id"]] == "E"
+        assert directions[delivery_orders["geojson"]["id"]] == "S"
+        print(f"✅ {len(runs)} delivery runs")
+
+    def test_max_distance_filter(self, admin_headers, delivery_orders):
+        """max_distance_km drops orders further out"""
+        response = requests.get(f"{API_URL}/delivery/queue",
+                                params={"max_distance_km": 1.5}, headers=admin_headers)
+        assert response.status_code == 200
+        ids = {o["id"] for o in response.json()["orders"]}
+        assert delivery_orders["north"]["id"] in ids
+        assert delivery_orders["east"]["id"] not in ids
+
+    def test_kitchen_cannot_read_queue(self, admin_headers):
+        """Only cashiers, waiters and admins see delivery positions"""
+        response = requests.get(f"{API_URL}/delivery/queue", headers=staff_headers(admin_headers, "kitchen"))
+        assert response.status_code == 403
@@ -0,0 +1,181 @@
+"""
+Coffee Shop Management System - Order and Payment Write Safety Tests
+Tests for Idempotency-Key replays and concurrent payment handling
+"""
+import pytest
+import requests
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def cashier_headers(admin_headers):
+    """Create a cashier user through the admin API and log in"""
+    email = f"TEST_cashier_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Cashier {TIMESTAMP}",
+        "role": "cashier"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Cashier user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def order_payload():
+    """Order body for one unit of an available product"""
+    response = requests.get(f"{API_URL}/products")
+    assert response.status_code == 200
+    products = response.json()
+    assert products, "No products available"
+    product = products[0]
+    return {
+        "customer_name": f"TEST Payments {TIMESTAMP}",
+        "order_type": "to-go",
+        "items": [{
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "quantity": 1,
+            "price": product["price"]
+        }],
+        "total_amount": product["price"]
+    }
+
+
+def place_order(order_payload, headers=None):
+    response = requests.post(f"{API_URL}/orders", json=order_payload, headers=headers)
+    assert response.status_code == 200, f"Order creation failed: {response.text}"
+    return response.json()
+
+
+class TestOrderNumbers:
+    """Test short daily ticket numbers on new orders"""
+
+    def test_order_number_format(self, order_payload):
+        """Order numbers look like A-042 and carry their business date"""
+        order = place_order(order_payload)
+        assert re.fullmatch(r"[A-Z]-\d{3}", order["order_number"]), order["order_number"]
+        assert re.fullmatch(r"\d{4}-\d{2}-\d{2}", order["business_date"])
+
+    def test_order_numbers_are_unique(self, order_payload):
+        """Consecutive orders never share a number"""
+        numbers = {place_order(order_payload)["order_number"] for _ in range(5)}
+        assert len(numbers) == 5
+
+
+class TestOrderIdempotency:
+    """Test Idempotency-Key on POST /api/orders"""
+
+    def test_retry_returns_same_order(self, order_payload):
+        """A retried order with the same key is not created twice"""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        first = place_order(order_payload, headers)
+        second = place_order(order_payload, headers)
+        assert first["id"] == second["id"]
+        assert first["order_number"] == second["order_number"]
+        print(f"✅ Retry replayed order {first['order_number']}")
+
+    def test_orders_without_key_are_independent(self, order_payload):
+        """Requests without a key behave as before"""
+        first = place_order(order_payload)
+        second = place_order(order_payload)
+        assert first["id"] != second["id"]
+
+    def test_key_reuse_with_different_body_rejected(self, order_payload):
+        """Reusing a key for a different order is an error"""
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        place_order(order_payload, headers)
+        changed = dict(order_payload, notes="different order")
+        response = requests.post(f"{API_URL}/orders", json=changed, headers=headers)
+        assert response.status_code == 422
+
+
+class TestPaymentIdempotency:
+    """Test Idempotency-Key on PUT /api/orders/{id}/payment"""
+
+    def test_retried_payment_returns_same_transaction(self, cashier_headers, order_payload):
+        """A retried payment replays the first transaction"""
+        order = place_order(order_payload)
+        headers = dict(cashier_headers, **{"Idempotency-Key": str(uuid.uuid4())})
+        url = f"{API_URL}/orders/{order['id']}/payment"
+
+        first = requests.put(url, json={"payment_method": "cash"}, headers=headers)
+        second = requests.put(url, json={"payment_method": "cash"}, headers=headers)
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["transaction"]["id"] == second.json()["transaction"]["id"]
+
+
+class TestConcurrentPayments:
+    """Test that parallel payments for one order settle exactly once"""
+
+    def test_parallel_payments_settle_once(self, cashier_headers, order_payload):
+        """Only one of several simultaneous payments succeeds"""
+        order = place_order(order_payload)
+        url = f"{API_URL}/orders/{order['id']}/payment"
+
+        def pay(_):
+            return requests.put(url, json={"payment_method": "cash"}, headers=cashier_headers).status_code
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(pay, range(8)))
+
+        assert statuses.count(200) == 1, f"Expected exactly one success, got {statuses}"
+        assert all(s == 409 for s in statuses if s != 200)
+
+        response = requests.get(f"{API_URL}/transactions", headers=cashier_headers)
+        assert response.status_code == 200
+        matching = [t for t in response.json() if t["order_id"] == order["id"]]
+        assert len(matching) == 1
+        print(f"✅ {len(statuses)} parallel payments produced one transaction")
+
+    def test_paying_twice_sequentially_conflicts(self, cashier_headers, order_payload):
+        """A second payment for a paid order is rejected"""
+        order = place_order(order_payload)
+        url = f"{API_URL}/orders/{order['id']}/payment"
+        assert requests.put(url, json={"payment_method": "cash"}, headers=cashier_headers).status_code == 200
+        assert requests.put(url, json={"payment_method": "qr"}, headers=cashier_headers).status_code == 409
+
+    def test_cancelled_order_cannot_be_paid(self, cashier_headers, order_payload):
+        """Cancelled is final - paying it is rejected and the order stays cancelled"""
+        order = place_order(order_payload)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                json={"status": "cancelled"}, headers=cashier_headers)
+        assert response.status_code == 200
+
+        response = requests.put(f"{API_URL}/orders/{order['id']}/payment",
+                                json={"payment_method": "cash"}, headers=cashier_headers)
+        assert response.status_code == 409
+        stored = requests.get(f"{API_URL}/orders/{order['id']}").json()
+        assert stored["status"] == "cancelled"
+        assert stored["payment_status"] == "unpaid"
+
+    def test_payment_for_unknown_order(self, cashier_headers):
+        """Paying a missing order returns 404"""
+        response = requests.put(f"{API_URL}/orders/missing-{TIMESTAMP}/payment",
+                                json={"payment_method": "cash"}, headers=cashier_headers)
+        assert response.status_code == 404
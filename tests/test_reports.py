@@ -0,0 +1,215 @@
+"""
+Coffee Shop Management System - Reporting Tests
+Tests for rollup-backed sales reports and analytics endpoints
+"""
+import pytest
+import requests
+import os
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def cashier_headers(admin_headers):
+    """Create a cashier user through the admin API and log in"""
+    email = f"TEST_report_cashier_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Report Cashier {TIMESTAMP}",
+        "role": "cashier"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Cashier user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def paid_order(cashier_headers):
+    """Place and pay one order so today's rollups have data"""
+    products = requests.get(f"{API_URL}/products").json()
+    assert products, "No products available"
+    product = products[0]
+    response = requests.post(f"{API_URL}/orders", json={
+        "customer_name": f"TEST Reports {TIMESTAMP}",
+        "order_type": "to-go",
+        "items": [{
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "quantity": 2,
+            "price": product["price"]
+        }],
+        "total_amount": product["price"] * 2
+    })
+    assert response.status_code == 200
+    order = response.json()
+
+    response = requests.put(f"{API_URL}/orders/{order['id']}/payment",
+                            json={"payment_method": "qr"}, headers=cashier_headers)
+    assert response.status_code == 200
+    return order
+
+
+class TestSalesReports:
+    """Test /api/reports/* endpoints backed by daily_rollups"""
+
+    def test_revenue_report_includes_today(self, admin_headers, paid_order):
+        """A paid order shows up in today's revenue row"""
+        response = requests.get(f"{API_URL}/reports/revenue", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["period"] == "day"
+        assert data["rows"], "Expected at least one day of revenue"
+        today = data["rows"][-1]
+        assert today["net_revenue"] >= paid_order["total_amount"]
+        assert today["orders"] >= 1
+
+    @pytest.mark.parametrize("period", ["week", "month"])
+    def test_revenue_report_periods(self, admin_headers, paid_order, period):
+        """Weekly and monthly buckets are supported"""
+        response = requests.get(f"{API_URL}/reports/revenue", params={"period": period}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["rows"]
+
+    def test_top_products_and_payment_mix(self, admin_headers, paid_order):
+        """Top products and payment mix include the paid order"""
+        response = requests.get(f"{API_URL}/reports/top-products", headers=admin_headers)
+        assert response.status_code == 200
+        product_ids = [p["product_id"] for p in response.json()]
+        assert paid_order["items"][0]["product_id"] in product_ids
+
+        response = requests.get(f"{API_URL}/reports/payment-mix", headers=admin_headers)
+        assert response.status_code == 200
+        assert "qr" in [m["payment_method"] for m in response.json()]
+
+    def test_repeated_product_lines_are_summed(self, admin_headers, cashier_headers, paid_order):
+        """Two lines of the same product both count towards its rollup row"""
+        item = paid_order["items"][0]
+
+        def sold():
+            response = requests.get(f"{API_URL}/reports/top-products", params={"limit": 100},
+                                    headers=admin_headers)
+            assert response.status_code == 200
+            return next((p["quantity"] for p in response.json() if p["product_id"] == item["product_id"]), 0)
+
+        before = sold()
+        response = requests.post(f"{API_URL}/orders", json={
+            "customer_name": f"TEST Reports Repeat {TIMESTAMP}",
+            "order_type": "to-go",
+            "items": [{**item, "quantity": 1}, {**item, "quantity": 3}],
+            "total_amount": item["price"] * 4
+        })
+        assert response.status_code == 200
+        order = response.json()
+        response = requests.put(f"{API_URL}/orders/{order['id']}/payment",
+                                json={"payment_method": "cash"}, headers=cashier_headers)
+        assert response.status_code == 200
+        assert sold() - before == 4
+        print("✅ Repeated product lines summed into one rollup row")
+
+    def test_backfill_is_rerunnable(self, admin_headers):
+        """Running the backfill twice leaves nothing for the second run"""
+        response = requests.post(f"{API_URL}/admin/rollups/backfill", headers=admin_headers)
+        assert response.status_code == 200
+        response = requests.post(f"{API_URL}/admin/rollups/backfill", headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["processed"] == 0
+
+    @pytest.mark.parametrize("params", [
+        {"start": "2026-02-01", "end": "2026-01-01"},
+        {"end": "not-a-date"},
+        {"start": "2026-13-01"}
+    ])
+    def test_invalid_range_rejected(self, admin_headers, params):
+        """Malformed dates and a start after the end get 400"""
+        response = requests.get(f"{API_URL}/reports/revenue", params=params, headers=admin_headers)
+        assert response.status_code == 400
+
+    def test_reports_require_admin(self, cashier_headers):
+        """Non-admin users cannot read reports"""
+        response = requests.get(f"{API_URL}/reports/revenue", headers=cashier_headers)
+        assert response.status_code == 403
+
+
+class TestDemandHeatmap:
+    """Test GET /api/analytics/heatmap"""
+
+    def test_heatmap_shape(self, admin_headers):
+        """Grids are 7 weekdays by 24 hours"""
+        response = requests.get(f"{API_URL}/analytics/heatmap", params={"days": 30}, headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        for grid in ("orders", "items", "revenue"):
+            assert len(data[grid]) == 7
+            assert all(len(row) == 24 for row in data[grid])
+        assert data["weekdays"][0] == "Mon"
+
+    def test_heatmap_category_filter(self, admin_headers):
+        """A category filter never reports more orders than the unfiltered grid"""
+        full = requests.get(f"{API_URL}/analytics/heatmap", headers=admin_headers).json()
+        response = requests.get(f"{API_URL}/analytics/heatmap",
+                                params={"category": "beverage"}, headers=admin_headers)
+        assert response.status_code == 200
+        filtered = response.json()
+        assert sum(map(sum, filtered["orders"])) <= sum(map(sum, full["orders"]))
+
+
+class TestIngredientForecast:
+    """Test GET /api/inventory/forecast"""
+
+    @pytest.mark.parametrize("method", ["ses", "ma"])
+    def test_forecast_lists_every_ingredient(self, admin_headers, method):
+        """Each ingredient gets a forecast and a non-negative reorder suggestion"""
+        ingredients = requests.get(f"{API_URL}/ingredients", headers=admin_headers)
+        response = requests.get(f"{API_URL}/inventory/forecast",
+                                params={"method": method, "horizon_days": 7}, headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["horizon_days"] == 7
+        for entry in data["ingredients"]:
+            assert entry["forecast_daily_usage"] >= 0
+            assert entry["suggested_reorder"] >= 0
+        if ingredients.status_code == 200:
+            assert len(data["ingredients"]) == len(ingredients.json())
+
+    def test_forecast_series(self, admin_headers):
+        """include_series returns one value per history day"""
+        response = requests.get(f"{API_URL}/inventory/forecast",
+                                params={"history_days": 14, "include_series": "true"}, headers=admin_headers)
+        assert response.status_code == 200
+        for entry in response.json()["ingredients"]:
+            assert len(entry["series"]) == 14
+
+
+class TestMenuEngineering:
+    """Test GET /api/reports/menu-engineering"""
+
+    def test_every_product_is_classified(self, admin_headers, paid_order):
+        """Products are rated stars, plowhorses, puzzles or dogs"""
+        response = requests.get(f"{API_URL}/reports/menu-engineering", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["products"]
+        for product in data["products"]:
+            assert product["classification"] in ("star", "plowhorse", "puzzle", "dog")
+            assert product["unit_cost"] >= 0
+        sold = next(p for p in data["products"] if p["product_id"] == paid_order["items"][0]["product_id"])
+        assert sold["quantity"] >= 2
@@ -0,0 +1,213 @@
+"""
+Coffee Shop Management System - Floor State Tests
+Tests for table occupancy derived from live dine-in orders
+"""
+import pytest
+import requests
+import os
+from datetime import datetime
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://kopi-system.preview.emergentagent.com')
+API_URL = f"{BASE_URL}/api"
+
+ADMIN_CREDS = {"email": "admin@kopikrasand.com", "password": "Admin123!"}
+TEST_PASSWORD = "TestPass123!"
+
+# Generate unique timestamp for test data
+TIMESTAMP = datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Admin authorization headers"""
+    response = requests.post(f"{API_URL}/auth/login", json=ADMIN_CREDS)
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def cashier_headers(admin_headers):
+    """Create a cashier user through the admin API and log in"""
+    email = f"TEST_floor_cashier_{TIMESTAMP}@test.com"
+    response = requests.post(f"{API_URL}/admin/users", json={
+        "email": email,
+        "password": TEST_PASSWORD,
+        "name": f"TEST Floor Cashier {TIMESTAMP}",
+        "role": "cashier"
+    }, headers=admin_headers)
+    assert response.status_code == 200, f"Cashier user creation failed: {response.text}"
+
+    response = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": TEST_PASSWORD})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def product():
+    """Get an available product for test orders"""
+    products = requests.get(f"{API_URL}/products").json()
+    assert products, "No products available"
+    return products[0]
+
+
+def create_table(headers, offset):
+    response = requests.post(f"{API_URL}/tables", json={
+        "table_number": int(TIMESTAMP[-5:]) + 20000 + offset,
+        "capacity": 4
+    }, headers=headers)
+    assert response.status_code == 200, f"Table creation failed: {response.text}"
+    return response.json()
+
+
+def seat_order(table, product, quantity=1):
+    response = requests.post(f"{API_URL}/orders", json={
+        "customer_name": f"TEST Floor {TIMESTAMP}",
+        "order_type": "dine-in",
+        "table_id": table["id"],
+        "table_number": table["table_number"],
+        "items": [{
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "quantity": quantity,
+            "price": product["price"]
+        }],
+        "total_amount": product["price"] * quantity
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def get_table(headers, table_id):
+    tables = requests.get(f"{API_URL}/tables", headers=headers).json()
+    return next(t for t in tables if t["id"] == table_id)
+
+
+class TestFloorState:
+    """Test table state driven by order and payment events"""
+
+    def test_orders_occupy_table_and_payments_free_it(self, cashier_headers, product):
+        """A table is occupied while it has unpaid orders"""
+        table = create_table(cashier_headers, 0)
+        first = seat_order(table, product)
+        second = seat_order(table, product, quantity=2)
+
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "occupied"
+        assert set(state["open_order_ids"]) == {first["id"], second["id"]}
+        assert state["running_bill"] == pytest.approx(first["total_amount"] + second["total_amount"])
+        assert state["seated_since"] is not None
+
+        requests.put(f"{API_URL}/orders/{first['id']}/payment",
+                     json={"payment_method": "cash"}, headers=cashier_headers)
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "occupied"
+        assert state["open_order_ids"] == [second["id"]]
+
+        requests.put(f"{API_URL}/orders/{second['id']}/payment",
+                     json={"payment_method": "cash"}, headers=cashier_headers)
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "available"
+        assert state["running_bill"] == 0
+        assert state["seated_since"] is None
+        print(f"✅ Table {table['table_number']} freed after its last payment")
+
+    def test_cancelled_order_frees_table(self, cashier_headers, product):
+        """Cancelling the only order frees the table"""
+        table = create_table(cashier_headers, 1)
+        order = seat_order(table, product)
+        response = requests.put(f"{API_URL}/orders/{order['id']}/status",
+                                json={"status": "cancelled"}, headers=cashier_headers)
+        assert response.status_code == 200
+
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "available"
+        assert state["open_order_ids"] == []
+
+    def test_status_change_keeps_version_in_step(self, cashier_headers):
+        """The version GET /tables serves after a status change is the one PATCH expects"""
+        table = create_table(cashier_headers, 3)
+        response = requests.put(f"{API_URL}/tables/{table['id']}/status",
+                                json={"status": "reserved"}, headers=cashier_headers)
+        assert response.status_code == 200
+
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "reserved"
+        assert state["version"] == table["version"] + 1
+        response = requests.patch(f"{API_URL}/tables/{table['id']}",
+                                  json={"capacity": 6, "version": state["version"]}, headers=cashier_headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["capacity"] == 6
+
+    def test_patch_keeps_live_status(self, cashier_headers, product):
+        """A PATCH without status does not reset an occupied table to the unflushed stored status"""
+        table = create_table(cashier_headers, 4)
+        order = seat_order(table, product)
+        response = requests.patch(f"{API_URL}/tables/{table['id']}",
+                                  json={"capacity": 2}, headers=cashier_headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["status"] == "occupied"
+
+        state = get_table(cashier_headers, table["id"])
+        assert state["status"] == "occupied"
+        assert state["open_order_ids"] == [order["id"]]
+        assert state["capacity"] == 2
+
+
+class TestTableTurnoverReport:
+    """Test GET /api/reports/tables"""
+
+    def test_paid_seating_is_rolled_up(self, admin_headers, cashier_headers, product):
+        """A seating closed by payment shows up for its table and hour"""
+        table = create_table(cashier_headers, 2)
+        order = seat_order(table, product)
+        requests.put(f"{API_URL}/orders/{order['id']}/payment",
+                     json={"payment_method": "qr"}, headers=cashier_headers)
+
+        response = requests.get(f"{API_URL}/reports/tables", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        row = next(r for r in data["tables"] if r["table_id"] == table["id"])
+        assert row["seatings"] == 1
+        assert row["revenue"] == pytest.approx(order["total_amount"])
+        assert row["turnover_per_day"] > 0
+        assert data["hours"], "Expected at least one hourly slot"
+        print(f"✅ Table {table['table_number']}: {row['avg_dwell_minutes']} min dwell")
+
+    @pytest.mark.parametrize("offset,close", [(5, "cancel"), (6, "free")])
+    def test_seating_closed_without_payment_is_rolled_up(self, admin_headers, cashier_headers, product,
+                                                          offset, close):
+        """A seating with a paid order still counts when a cancel or a manual free ends it"""
+        table = create_table(cashier_headers, offset)
+        paid = seat_order(table, product)
+        unpaid = seat_order(table, product)
+        response = requests.put(f"{API_URL}/orders/{paid['id']}/payment",
+                                json={"payment_method": "cash"}, headers=cashier_headers)
+        assert response.status_code == 200
+        if close == "cancel":
+            response = requests.put(f"{API_URL}/orders/{unpaid['id']}/status",
+                                    json={"status": "cancelled"}, headers=cashier_headers)
+        else:
+            response = requests.put(f"{API_URL}/tables/{table['id']}/status",
+                                    json={"status": "available"}, headers=cashier_headers)
+        assert response.status_code == 200
+
+        response = requests.get(f"{API_URL}/reports/tables", headers=admin_headers)
+        assert response.status_code == 200
+        row = next((r for r in response.json()["tables"] if r["table_id"] == table["id"]), None)
+        assert row is not None, f"Seating ended by {close} missing from the report"
+        assert row["seatings"] == 1
+        assert row["revenue"] == pytest.approx(paid["total_amount"])
+
+    @pytest.mark.parametrize("params", [
+        {"start": "2026-03-10", "end": "2026-03-01"},
+        {"end": "yesterday"}
+    ])
+    def test_invalid_range_rejected(self, admin_headers, params):
+        """A reversed or malformed range gets 400 instead of a division error"""
+        response = requests.get(f"{API_URL}/reports/tables", params=params, headers=admin_headers)
+        assert response.status_code == 400
+
+    def test_report_requires_admin(self, cashier_headers):
+        """Cashiers cannot read floor analytics"""
+        response = requests.get(f"{API_URL}/reports/tables", headers=cashier_headers)
+        assert response.status_code == 403